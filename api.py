@@ -0,0 +1,107 @@
+"""
+JSON API for Online Bookstore
+Exposes the models' to_dict() output as keyset-paged JSON, or streams whole
+result sets as NDJSON / chunked JSON arrays in constant memory
+"""
+
+import json
+
+from flask import Blueprint, Response, abort, current_app, jsonify, request, stream_with_context
+from flask_login import current_user
+from sqlalchemy.orm import undefer
+
+from catalog import CatalogFilter, order_by_keys
+from models import Book, Category, Order
+import pagination
+
+api = Blueprint('api', __name__, url_prefix='/api')
+
+# Flush streamed output in chunks of roughly this many bytes
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def _page_size():
+    limit = request.args.get('limit', current_app.config['API_PAGE_SIZE'], type=int)
+    return max(1, min(limit, current_app.config['API_MAX_PAGE_SIZE']))
+
+
+def _buffered(pieces):
+    """Group many small strings into larger chunks to keep write calls down"""
+    buffer, size = [], 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= STREAM_CHUNK_SIZE:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def _ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row.to_dict(), separators=(',', ':')) + '\n'
+
+
+def _json_array(rows):
+    yield '['
+    for index, row in enumerate(rows):
+        yield (',' if index else '') + json.dumps(row.to_dict(), separators=(',', ':'))
+    yield ']'
+
+
+def respond(query, keys, scope):
+    """
+    Serve a query in the format asked for by ?format=
+    page (default): one keyset page with cursors; ndjson / json: the full result, streamed
+    """
+    output = request.args.get('format', 'page')
+    if output == 'page':
+        page = pagination.paginate(query, keys, request.args.get('cursor'), _page_size(), scope=scope)
+        return jsonify({
+            'items': [row.to_dict() for row in page.items],
+            'next_cursor': page.next_cursor,
+            'prev_cursor': page.prev_cursor,
+        })
+
+    if output not in ('ndjson', 'json'):
+        abort(400)
+    # yield_per streams rows from a server-side cursor instead of loading them all
+    rows = query.order_by(*order_by_keys(keys)).yield_per(current_app.config['API_STREAM_BATCH_SIZE'])
+    if output == 'ndjson':
+        body, mimetype = _ndjson_lines(rows), 'application/x-ndjson'
+    else:
+        body, mimetype = _json_array(rows), 'application/json'
+    return Response(stream_with_context(_buffered(body)), mimetype=mimetype)
+
+
+@api.route('/books')
+def books():
+    """In-stock books, with the same search, filter and sort args as /books"""
+    catalog_filter = CatalogFilter(request.args)
+    query = catalog_filter.apply(Book.query)
+    return respond(query, catalog_filter.sort_keys, f'api-books-{catalog_filter.sort_by}')
+
+
+@api.route('/categories')
+def categories():
+    """All categories with their book counts"""
+    query = Category.query.options(undefer(Category.book_count))
+    return respond(query, [(Category.id, False)], 'api-categories')
+
+
+@api.route('/orders')
+def orders():
+    """The current user's orders, newest first"""
+    if not current_user.is_authenticated:
+        abort(401)
+    query = Order.query.options(undefer(Order.item_count)).filter(Order.user_id == current_user.id)
+    return respond(query, [(Order.order_date, True), (Order.id, True)], 'api-orders')
+
+
+def init_app(app):
+    """Register the API blueprint"""
+    app.config.setdefault('API_PAGE_SIZE', 50)
+    app.config.setdefault('API_MAX_PAGE_SIZE', 500)
+    app.config.setdefault('API_STREAM_BATCH_SIZE', 1000)
+    app.register_blueprint(api)
@@ -3,31 +3,88 @@ Main Flask Application for Online Bookstore
 Handles routing, authentication, and business logic
 """
 
-from flask import Flask, render_template, redirect, url_for, flash, request, abort, session
+from flask import Flask, render_template, redirect, url_for, flash, request, abort
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from flask_bcrypt import Bcrypt
+from sqlalchemy.orm import joinedload, undefer
 from models import db, User, Category, Book, Order, OrderItem, Review, ContactMessage
+from sqlalchemy import case, func, update, bindparam
 from datetime import datetime
+import click
 import os
+import search
+import pagination
+import migrations
+import cart_store
+import response_cache
+import conditional
+import api
+import catalog_io
+import passwords
+import identity
+import db_config
+import query_plans
+import metrics
+import facets
+import recommendations
+import homepage
+import order_history
+import jobs
+import mailer
+import tasks
+import assets
+import streaming
+import compression
+import covers
+from cart_service import price_cart
+from catalog import CatalogFilter, book_sort_keys
 
 # Initialize Flask extensions
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-change-in-production'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///bookstore.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///bookstore.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['BOOKS_PER_PAGE'] = 24
+app.config['REVIEWS_PER_PAGE'] = 10
+app.config['ORDERS_PER_PAGE'] = 20
+app.config['BCRYPT_LOG_ROUNDS'] = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+if 'PASSWORD_HASH_WORKERS' in os.environ:
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.environ['PASSWORD_HASH_WORKERS'])
 
 # Initialize extensions
-bcrypt = Bcrypt(app)
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
 login_manager.login_message_category = 'info'
 
+db_config.configure(app)
 db.init_app(app)
+db_config.init_app(app)
+metrics.init_app(app)
+search.init_app(app)
+pagination.init_app(app)
+migrations.init_app(app)
+cart_store.init_app(app)
+response_cache.init_app(app)
+conditional.init_app(app)
+api.init_app(app)
+catalog_io.init_app(app)
+passwords.init_app(app)
+identity.init_app(app)
+query_plans.init_app(app)
+facets.init_app(app)
+recommendations.init_app(app)
+homepage.init_app(app)
+jobs.init_app(app)
+mailer.init_app(app)
+tasks.init_app(app)
+assets.init_app(app)
+streaming.init_app(app)
+compression.init_app(app)
+covers.init_app(app)
 
 @login_manager.user_loader
 def load_user(user_id):
-    """Load user from database for Flask-Login"""
-    return User.query.get(int(user_id))
+    """Load user for Flask-Login from the identity cache"""
+    return identity.load_user(user_id)
 
 # ==================== AUTH ROUTES ====================
 
@@ -56,10 +113,16 @@ def register():
             flash('Email already registered', 'danger')
             return redirect(url_for('register'))
         
-        # Create new user
-        hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+        # Create new user; hashing runs on the password pool
+        try:
+            hashed_password = passwords.get_hasher().hash(password)
+        except passwords.HasherBusy:
+            flash('We are very busy right now. Please try again in a moment.', 'warning')
+            return render_template('register.html'), 503
         new_user = User(username=username, email=email, password_hash=hashed_password)
         db.session.add(new_user)
+        db.session.flush()
+        tasks.after_registration(new_user.id)
         db.session.commit()
         
         flash('Registration successful! Please login.', 'success')
@@ -79,8 +142,19 @@ def login():
         password = request.form.get('password')
         
         user = User.query.filter_by(username=username).first()
+        hasher = passwords.get_hasher()
+        
+        try:
+            valid = user is not None and hasher.verify(password, user.password_hash)
+            # Upgrade the stored hash transparently when the work factor changed
+            if valid and hasher.needs_rehash(user.password_hash):
+                user.password_hash = hasher.hash(password)
+                db.session.commit()
+        except passwords.HasherBusy:
+            flash('We are very busy right now. Please try again in a moment.', 'warning')
+            return render_template('login.html'), 503
         
-        if user and bcrypt.check_password_hash(user.password_hash, password):
+        if valid:
             login_user(user)
             next_page = request.args.get('next')
             flash('Login successful!', 'success')
@@ -104,8 +178,8 @@ def logout():
 @login_required
 def profile():
     """User profile route"""
-    orders = Order.query.filter_by(user_id=current_user.id).order_by(Order.order_date.desc()).all()
-    return render_template('profile.html', orders=orders)
+    recent = order_history.history_page(current_user.id, per_page=5)
+    return render_template('profile.html', orders=recent.items)
 
 
 @app.route('/profile/edit', methods=['GET', 'POST'])
@@ -113,11 +187,14 @@ def profile():
 def edit_profile():
     """Edit user profile route"""
     if request.method == 'POST':
-        current_user.first_name = request.form.get('first_name')
-        current_user.last_name = request.form.get('last_name')
-        current_user.phone = request.form.get('phone')
-        current_user.address = request.form.get('address')
+        # current_user is a cached snapshot; writes go through the full row
+        user = identity.full_user(current_user)
+        user.first_name = request.form.get('first_name')
+        user.last_name = request.form.get('last_name')
+        user.phone = request.form.get('phone')
+        user.address = request.form.get('address')
         db.session.commit()
+        identity.invalidate(user.id)
         flash('Profile updated successfully!', 'success')
         return redirect(url_for('profile'))
     
@@ -127,62 +204,62 @@ def edit_profile():
 # ==================== BOOK ROUTES ====================
 
 @app.route('/')
+@db_config.read_only
+@conditional.conditional_view(homepage.feed_state)
+@response_cache.cached_view('listings', 'categories')
 def index():
     """Homepage route with featured books"""
-    featured_books = Book.query.filter(Book.stock_quantity > 0).order_by(Book.created_at.desc()).limit(8).all()
-    categories = Category.query.all()
-    recent_books = Book.query.filter(Book.stock_quantity > 0).order_by(Book.created_at.desc()).limit(4).all()
-    return render_template('index.html', featured_books=featured_books, categories=categories, recent_books=recent_books)
+    feed = homepage.get_feed()
+    return render_template('index.html', featured_books=feed.featured, categories=feed.categories,
+                           recent_books=feed.recent, bestsellers=feed.bestsellers)
 
 
 @app.route('/books')
+@db_config.read_only
+@conditional.conditional_view(conditional.catalog_state)
+@response_cache.cached_view('listings', 'categories')
 def books():
     """Browse all books with search and filter"""
-    search_query = request.args.get('search', '')
-    category_id = request.args.get('category', type=int)
-    sort_by = request.args.get('sort', 'title')
-    
-    query = Book.query.filter(Book.stock_quantity > 0)
-    
-    # Search filter
-    if search_query:
-        query = query.filter(
-            (Book.title.ilike(f'%{search_query}%')) |
-            (Book.author.ilike(f'%{search_query}%')) |
-            (Book.isbn.ilike(f'%{search_query}%'))
-        )
-    
-    # Category filter
-    if category_id:
-        query = query.filter_by(category_id=category_id)
-    
-    # Sorting
-    if sort_by == 'price_low':
-        query = query.order_by(Book.price.asc())
-    elif sort_by == 'price_high':
-        query = query.order_by(Book.price.desc())
-    elif sort_by == 'newest':
-        query = query.order_by(Book.created_at.desc())
-    else:
-        query = query.order_by(Book.title.asc())
+    catalog_filter = CatalogFilter(request.args)
+    query = catalog_filter.apply(Book.query.options(joinedload(Book.category)))
     
-    books = query.all()
+    # The grid query runs when rendering reaches it, after the sidebar is sent
+    page = streaming.DeferredPage(lambda: pagination.paginate(
+        query, catalog_filter.sort_keys, request.args.get('cursor'),
+        app.config['BOOKS_PER_PAGE'], scope=catalog_filter.sort_by))
     categories = Category.query.all()
+    facet_groups = facets.facets_for(catalog_filter, categories)
     
-    return render_template('books.html', books=books, categories=categories)
+    # Rating facet counts move with every review
+    if catalog_filter.uses_ratings or facet_groups:
+        response_cache.add_tags('ratings')
+    
+    return streaming.render_listing('books.html', books=page, page=page, categories=categories,
+                                    facets=facet_groups, catalog_filter=catalog_filter)
 
 
 @app.route('/book/<int:book_id>')
+@db_config.read_only
+@conditional.conditional_view(conditional.book_state)
+@response_cache.cached_view()
 def book_detail(book_id):
     """Book details page"""
     book = Book.query.get_or_404(book_id)
-    reviews = Review.query.filter_by(book_id=book_id).order_by(Review.created_at.desc()).all()
-    related_books = Book.query.filter_by(category_id=book.category_id).filter(Book.id != book_id).limit(4).all()
-    
-    # Calculate average rating
+    response_cache.add_tags(f'book:{book_id}', f'category:{book.category_id}')
+    reviews_query = Review.query.options(joinedload(Review.user)).filter_by(book_id=book_id)
+    review_page = pagination.paginate(reviews_query, [(Review.created_at, True), (Review.id, True)],
+                                      request.args.get('cursor'), app.config['REVIEWS_PER_PAGE'], scope='reviews')
+    # Books bought together with this one; same-category books until it has sales
+    related_books = recommendations.also_bought(book_id)
+    also_bought = bool(related_books)
+    if not also_bought:
+        related_books = Book.query.filter_by(category_id=book.category_id).filter(Book.id != book_id).limit(4).all()
+    
+    # Average rating comes from the stored aggregates
     avg_rating = book.get_average_rating()
     
-    return render_template('book_detail.html', book=book, reviews=reviews, related_books=related_books, avg_rating=avg_rating)
+    return render_template('book_detail.html', book=book, reviews=review_page.items, page=review_page,
+                           related_books=related_books, also_bought=also_bought, avg_rating=avg_rating)
 
 
 @app.route('/book/add', methods=['GET', 'POST'])
@@ -190,6 +267,11 @@ def book_detail(book_id):
 def add_book():
     """Add new book (admin)"""
     if request.method == 'POST':
+        try:
+            cover_image = covers.save_upload(request.files.get('cover_image'))
+        except ValueError as exc:
+            flash(str(exc), 'danger')
+            return redirect(url_for('add_book'))
         book = Book(
             title=request.form.get('title'),
             author=request.form.get('author'),
@@ -198,10 +280,14 @@ def add_book():
             stock_quantity=int(request.form.get('stock_quantity')),
             description=request.form.get('description'),
             publisher=request.form.get('publisher'),
-            category_id=request.form.get('category_id')
+            category_id=request.form.get('category_id'),
+            cover_image=cover_image
         )
         db.session.add(book)
         db.session.commit()
+        facets.refresh(book.id)
+        homepage.invalidate()
+        response_cache.invalidate('listings', f'category:{book.category_id}')
         flash('Book added successfully!', 'success')
         return redirect(url_for('books'))
     
@@ -216,6 +302,12 @@ def edit_book(book_id):
     book = Book.query.get_or_404(book_id)
     
     if request.method == 'POST':
+        try:
+            cover_image = covers.save_upload(request.files.get('cover_image'))
+        except ValueError as exc:
+            flash(str(exc), 'danger')
+            return redirect(url_for('edit_book', book_id=book_id))
+        old_category_id = book.category_id
         book.title = request.form.get('title')
         book.author = request.form.get('author')
         book.isbn = request.form.get('isbn')
@@ -224,7 +316,13 @@ def edit_book(book_id):
         book.description = request.form.get('description')
         book.publisher = request.form.get('publisher')
         book.category_id = request.form.get('category_id')
+        if cover_image:
+            book.cover_image = cover_image
         db.session.commit()
+        facets.refresh(book_id)
+        homepage.invalidate()
+        response_cache.invalidate('listings', f'book:{book_id}',
+                                  f'category:{old_category_id}', f'category:{book.category_id}')
         flash('Book updated successfully!', 'success')
         return redirect(url_for('book_detail', book_id=book.id))
     
@@ -237,8 +335,12 @@ def edit_book(book_id):
 def delete_book(book_id):
     """Delete book (admin)"""
     book = Book.query.get_or_404(book_id)
+    category_id = book.category_id
     db.session.delete(book)
     db.session.commit()
+    facets.refresh(book_id)
+    homepage.invalidate()
+    response_cache.invalidate('listings', f'book:{book_id}', f'category:{category_id}')
     flash('Book deleted successfully!', 'success')
     return redirect(url_for('books'))
 
@@ -246,18 +348,29 @@ def delete_book(book_id):
 # ==================== CATEGORY ROUTES ====================
 
 @app.route('/categories')
+@db_config.read_only
+@conditional.conditional_view(conditional.catalog_state)
+@response_cache.cached_view('listings', 'categories')
 def categories():
     """Browse all categories"""
-    categories_list = Category.query.all()
+    categories_list = Category.query.options(undefer(Category.book_count)).all()
     return render_template('categories.html', categories=categories_list)
 
 
 @app.route('/category/<int:category_id>')
+@db_config.read_only
+@conditional.conditional_view(conditional.category_state)
+@response_cache.cached_view('listings', 'categories')
 def category_books(category_id):
     """Books in a specific category"""
     category = Category.query.get_or_404(category_id)
-    books = Book.query.filter_by(category_id=category_id).filter(Book.stock_quantity > 0).all()
-    return render_template('category_books.html', category=category, books=books)
+    sort_by = request.args.get('sort', 'title')
+    query = Book.query.filter_by(category_id=category_id).filter(Book.stock_quantity > 0)
+    total = query.count()
+    page = streaming.DeferredPage(lambda: pagination.paginate(
+        query, book_sort_keys(sort_by), request.args.get('cursor'),
+        app.config['BOOKS_PER_PAGE'], scope=sort_by))
+    return streaming.render_listing('category_books.html', category=category, books=page, page=page, total=total)
 
 
 @app.route('/category/add', methods=['GET', 'POST'])
@@ -271,6 +384,8 @@ def add_category():
         )
         db.session.add(category)
         db.session.commit()
+        homepage.invalidate()
+        response_cache.invalidate('categories')
         flash('Category added successfully!', 'success')
         return redirect(url_for('categories'))
     
@@ -282,60 +397,36 @@ def add_category():
 @app.route('/cart')
 def cart():
     """Shopping cart page"""
-    cart_items = []
-    total = 0
-    
-    if 'cart' in session:
-        for item in session['cart']:
-            book = Book.query.get(item['book_id'])
-            if book:
-                subtotal = float(book.price) * item['quantity']
-                cart_items.append({
-                    'book': book,
-                    'quantity': item['quantity'],
-                    'subtotal': subtotal
-                })
-                total += subtotal
-    
-    return render_template('cart.html', cart_items=cart_items, total=total)
+    cart_id = cart_store.current_cart_id()
+    entries = cart_store.get_store().get(cart_id) if cart_id else []
+    priced = price_cart(entries)
+    return render_template('cart.html', cart_items=priced.lines, total=priced.total)
 
 
 @app.route('/cart/add/<int:book_id>')
 def add_to_cart(book_id):
     """Add item to cart"""
-    quantity = int(request.args.get('quantity', 1))
+    quantity = request.args.get('quantity', 1, type=int)
     
-    if 'cart' not in session:
-        session['cart'] = []
+    cart_store.get_store().add(cart_store.current_cart_id(create=True), book_id, quantity)
     
-    # Check if item already in cart
-    found = False
-    for item in session['cart']:
-        if item['book_id'] == book_id:
-            item['quantity'] += quantity
-            found = True
-            break
-    
-    if not found:
-        session['cart'].append({'book_id': book_id, 'quantity': quantity})
-    
-    session.modified = True
-    flash('Item added to cart!', 'success')
+    if quantity > 0:
+        flash('Item added to cart!', 'success')
+    else:
+        flash('Item removed from cart.', 'info')
     return redirect(url_for('cart'))
 
 
 @app.route('/cart/update', methods=['POST'])
 def update_cart():
     """Update cart items"""
-    session['cart'] = []
+    quantities = {}
     for key, value in request.form.items():
         if key.startswith('quantity_'):
             book_id = int(key.split('_')[1])
-            quantity = int(value)
-            if quantity > 0:
-                session['cart'].append({'book_id': book_id, 'quantity': quantity})
+            quantities[book_id] = int(value)
     
-    session.modified = True
+    cart_store.get_store().update(cart_store.current_cart_id(create=True), quantities)
     flash('Cart updated!', 'success')
     return redirect(url_for('cart'))
 
@@ -343,42 +434,79 @@ def update_cart():
 @app.route('/cart/clear')
 def clear_cart():
     """Clear shopping cart"""
-    session.pop('cart', None)
+    cart_id = cart_store.current_cart_id()
+    if cart_id:
+        cart_store.get_store().clear(cart_id)
     flash('Cart cleared!', 'info')
     return redirect(url_for('cart'))
 
 
+def _checkout_stock_failure(lines):
+    """Report every cart line that can't be filled and send the user back to the cart"""
+    current = {
+        book_id: (title, stock)
+        for book_id, title, stock in db.session.query(Book.id, Book.title, Book.stock_quantity)
+        .filter(Book.id.in_([line.book_id for line in lines]))
+    }
+    for line in lines:
+        title, in_stock = current.get(line.book_id, (None, 0))
+        if in_stock > 0:
+            flash(f'Only {in_stock} copies of "{title}" are left in stock.', 'danger')
+        else:
+            flash(f'Book "{title}" is out of stock!', 'danger')
+    return redirect(url_for('cart'))
+
+
 @app.route('/checkout', methods=['GET', 'POST'])
 @login_required
 def checkout():
     """Checkout process"""
-    if 'cart' not in session or not session['cart']:
+    store = cart_store.get_store()
+    cart_id = cart_store.current_cart_id()
+    entries = store.get(cart_id)
+    if not entries:
         flash('Your cart is empty!', 'warning')
         return redirect(url_for('books'))
     
+    priced = price_cart(entries)
+    
     if request.method == 'POST':
-        # Calculate total
-        total = 0
-        order_items = []
+        if priced.missing_book_ids:
+            flash('Some books in your cart are no longer available.', 'danger')
+            return redirect(url_for('cart'))
+        
+        # Lines already known to be short fail without taking the write lock
+        short_lines = [line for line in priced if not line.in_stock]
+        if short_lines:
+            return _checkout_stock_failure(short_lines)
         
-        for item in session['cart']:
-            book = Book.query.get(item['book_id'])
-            if book and book.stock_quantity >= item['quantity']:
-                subtotal = float(book.price) * item['quantity']
-                total += subtotal
-                order_items.append({
-                    'book': book,
-                    'quantity': item['quantity'],
-                    'unit_price': book.price
-                })
-            else:
-                flash(f'Book "{book.title}" is out of stock!', 'danger')
-                return redirect(url_for('cart'))
+        # Reserve stock with conditional single-statement updates; a line fails
+        # if a concurrent checkout took the remaining copies first
+        short_lines = []
+        sold_out = False
+        stock_levels = {}
+        for line in priced:
+            remaining = db.session.execute(
+                update(Book)
+                .where(Book.id == line.book_id, Book.stock_quantity >= line.quantity)
+                .values(stock_quantity=Book.stock_quantity - line.quantity)
+                .returning(Book.stock_quantity)
+                .execution_options(synchronize_session=False)
+            ).scalar()
+            stock_levels[line.book_id] = remaining
+            if remaining is None:
+                short_lines.append(line)
+            elif remaining == 0:
+                sold_out = True
+        
+        if short_lines:
+            db.session.rollback()
+            return _checkout_stock_failure(short_lines)
         
         # Create order
         order = Order(
             user_id=current_user.id,
-            total_amount=total,
+            total_amount=priced.total,
             shipping_address=request.form.get('shipping_address'),
             notes=request.form.get('notes')
         )
@@ -386,46 +514,43 @@ def checkout():
         db.session.flush()
         
         # Create order items
-        for item in order_items:
+        for line in priced:
             order_item = OrderItem(
                 order_id=order.id,
-                book_id=item['book'].id,
-                quantity=item['quantity'],
-                unit_price=item['unit_price']
+                book_id=line.book_id,
+                quantity=line.quantity,
+                unit_price=line.unit_price
             )
             db.session.add(order_item)
-            
-            # Update stock
-            item['book'].stock_quantity -= item['quantity']
+        recommendations.record_order(line.book_id for line in priced)
+        # Emails, stock alerts and analytics run on the job workers
+        tasks.after_checkout(order.id, stock_levels)
         
         db.session.commit()
-        session.pop('cart', None)
+        store.clear(cart_id)
+        facets.refresh(*(line.book_id for line in priced))
+        
+        # Stock figures changed; listings only change when a title sells out.
+        # Bestseller rankings catch up on the homepage refresh interval
+        stale_tags = [f'book:{line.book_id}' for line in priced]
+        if sold_out:
+            stale_tags.append('listings')
+            homepage.invalidate()
+        response_cache.invalidate(*stale_tags)
         
         flash('Order placed successfully!', 'success')
         return redirect(url_for('order_confirmation', order_id=order.id))
     
-    # Calculate total for display
-    total = 0
-    cart_items = []
-    for item in session['cart']:
-        book = Book.query.get(item['book_id'])
-        if book:
-            subtotal = float(book.price) * item['quantity']
-            cart_items.append({
-                'book': book,
-                'quantity': item['quantity'],
-                'subtotal': subtotal
-            })
-            total += subtotal
-    
-    return render_template('checkout.html', cart_items=cart_items, total=total)
+    return render_template('checkout.html', cart_items=priced.lines, total=priced.total)
 
 
 @app.route('/order/<int:order_id>')
 @login_required
 def order_confirmation(order_id):
     """Order confirmation page"""
-    order = Order.query.get_or_404(order_id)
+    order = order_history.order_with_items(order_id)
+    if order is None:
+        abort(404)
     
     if order.user_id != current_user.id:
         abort(403)
@@ -437,8 +562,9 @@ def order_confirmation(order_id):
 @login_required
 def orders():
     """User's order history"""
-    orders = Order.query.filter_by(user_id=current_user.id).order_by(Order.order_date.desc()).all()
-    return render_template('orders.html', orders=orders)
+    page = order_history.history_page(current_user.id, request.args.get('cursor'),
+                                      app.config['ORDERS_PER_PAGE'], with_items=True)
+    return render_template('orders.html', orders=page.items, page=page)
 
 
 # ==================== REVIEW ROUTES ====================
@@ -447,9 +573,29 @@ def orders():
 @login_required
 def add_review(book_id):
     """Add book review"""
-    rating = int(request.form.get('rating'))
+    rating = request.form.get('rating', type=int)
     comment = request.form.get('comment')
     
+    if rating not in range(1, 6):
+        abort(400)
+    
+    # Bump the aggregates with a relative UPDATE in the same transaction as the
+    # review, so concurrent reviews never lose a count
+    stars_column = getattr(Book, f'rating_{rating}_count')
+    result = db.session.execute(
+        update(Book)
+        .where(Book.id == book_id)
+        .values({
+            Book.rating_count: Book.rating_count + 1,
+            Book.rating_sum: Book.rating_sum + rating,
+            Book.rating_average: (Book.rating_sum + rating) * 1.0 / (Book.rating_count + 1),
+            stars_column: stars_column + 1,
+        })
+    )
+    if result.rowcount == 0:
+        db.session.rollback()
+        abort(404)
+    
     review = Review(
         user_id=current_user.id,
         book_id=book_id,
@@ -458,6 +604,8 @@ def add_review(book_id):
     )
     db.session.add(review)
     db.session.commit()
+    facets.refresh(book_id)
+    response_cache.invalidate(f'book:{book_id}', 'ratings')
     
     flash('Review added successfully!', 'success')
     return redirect(url_for('book_detail', book_id=book_id))
@@ -476,6 +624,8 @@ def contact():
             message=request.form.get('message')
         )
         db.session.add(message)
+        db.session.flush()
+        tasks.after_contact(message.id)
         db.session.commit()
         flash('Message sent successfully!', 'success')
         return redirect(url_for('index'))
@@ -507,6 +657,45 @@ def internal_error(error):
 
 # ==================== DATABASE INIT ====================
 
+def backfill_rating_aggregates(batch_size=1000):
+    """Recompute every book's rating aggregates from the reviews table"""
+    star_sums = [func.sum(case((Review.rating == stars, 1), else_=0)) for stars in range(1, 6)]
+    rows = db.session.query(
+        Review.book_id, func.count(Review.id), func.sum(Review.rating), *star_sums
+    ).group_by(Review.book_id).all()
+    
+    # Books without reviews fall back to zero
+    db.session.execute(update(Book).values(
+        rating_count=0, rating_sum=0, rating_average=0,
+        rating_1_count=0, rating_2_count=0, rating_3_count=0, rating_4_count=0, rating_5_count=0
+    ))
+    
+    statement = update(Book.__table__).where(Book.__table__.c.id == bindparam('b_id')).values(
+        rating_count=bindparam('b_count'),
+        rating_sum=bindparam('b_sum'),
+        rating_average=bindparam('b_average'),
+        **{f'rating_{stars}_count': bindparam(f'b_{stars}') for stars in range(1, 6)}
+    )
+    params = [
+        {
+            'b_id': book_id, 'b_count': count, 'b_sum': total, 'b_average': total / count,
+            **{f'b_{stars}': stars_counts[stars - 1] for stars in range(1, 6)}
+        }
+        for book_id, count, total, *stars_counts in rows
+    ]
+    for start in range(0, len(params), batch_size):
+        db.session.execute(statement, params[start:start + batch_size])
+    db.session.commit()
+    return len(params)
+
+
+@app.cli.command('backfill-ratings')
+def backfill_ratings_command():
+    """Rebuild stored rating aggregates from existing reviews"""
+    updated = backfill_rating_aggregates()
+    click.echo(f'Rating aggregates rebuilt for {updated} books.')
+
+
 def create_sample_data():
     """Create sample data for testing"""
     # Create categories
@@ -519,8 +708,9 @@ def create_sample_data():
         Category(name='Self-Help', description='Self-improvement books')
     ]
     
+    existing_names = {name for name, in db.session.query(Category.name)}
     for cat in categories:
-        if not Category.query.filter_by(name=cat.name).first():
+        if cat.name not in existing_names:
             db.session.add(cat)
     
     db.session.commit()
@@ -544,8 +734,9 @@ def create_sample_data():
              publisher='Bantam Dell', category_id=3),
     ]
     
+    existing_isbns = {isbn for isbn, in db.session.query(Book.isbn).filter(Book.isbn.in_([b.isbn for b in sample_books]))}
     for book in sample_books:
-        if not Book.query.filter_by(isbn=book.isbn).first():
+        if book.isbn not in existing_isbns:
             db.session.add(book)
     
     db.session.commit()
@@ -554,6 +745,6 @@ def create_sample_data():
 
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
+        migrations.upgrade()
         create_sample_data()
     app.run(debug=True)
\ No newline at end of file
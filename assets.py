@@ -0,0 +1,254 @@
+"""
+Static Asset Pipeline for Online Bookstore
+`flask assets build` minifies CSS and JS, names every static file after a
+hash of its contents, writes gzip (and brotli, when installed) variants next
+to it and records the mapping in static/dist/manifest.json. Hashed files are
+served from /assets with immutable cache headers, picking the precompressed
+variant the client accepts
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import shutil
+
+import click
+from flask import current_app, request, send_from_directory, url_for
+from flask.cli import AppGroup
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only without it
+    brotli = None
+
+assets_cli = AppGroup('assets', help='Build fingerprinted static assets.')
+
+MANIFEST_NAME = 'manifest.json'
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.txt', '.html', '.map', '.ico'}
+
+# Characters around which whitespace means nothing in CSS
+CSS_TIGHT = set('{};,>')
+# After these, a slash starts a regex literal rather than a division
+JS_REGEX_PREFIX = set('(,=:[!&|?{};+-*%<>~^')
+
+
+def minify_css(source):
+    """Drop comments and collapse whitespace; strings are kept as written"""
+    out, i, n = [], 0, len(source)
+    pending_space = False
+    while i < n:
+        ch = source[i]
+        if ch in '"\'':
+            end = i + 1
+            while end < n and source[end] != ch:
+                end += 2 if source[end] == '\\' else 1
+            token, i = source[i:end + 1], end + 1
+        elif source.startswith('/*', i):
+            end = source.find('*/', i + 2)
+            i = n if end == -1 else end + 2
+            continue
+        elif ch.isspace():
+            pending_space = True
+            i += 1
+            continue
+        else:
+            token, i = ch, i + 1
+        if pending_space and out and out[-1][-1] not in CSS_TIGHT and token[0] not in CSS_TIGHT:
+            out.append(' ')
+        pending_space = False
+        if token == '}' and out and out[-1] == ';':
+            out.pop()
+        out.append(token)
+    return ''.join(out)
+
+
+def _regex_allowed(before):
+    return not before or before[-1] in JS_REGEX_PREFIX or before.endswith(('return', 'typeof'))
+
+
+def _copy_js_regex(source, i, out):
+    """Copy a regex literal starting at source[i] == '/'; returns the index after it"""
+    n, in_class, end = len(source), False, i + 1
+    while end < n and source[end] != '\n':
+        ch = source[end]
+        if ch == '\\':
+            end += 2
+            continue
+        if ch == '[':
+            in_class = True
+        elif ch == ']':
+            in_class = False
+        elif ch == '/' and not in_class:
+            break
+        end += 1
+    end += 1
+    while end < n and source[end].isalpha():
+        end += 1
+    out.append(source[i:end])
+    return end
+
+
+def minify_js(source):
+    """
+    Conservative JS minifier: drops comments, indentation and blank lines
+    Line breaks are kept so automatic semicolon insertion behaves the same
+    """
+    out, i, n = [], 0, len(source)
+    while i < n:
+        ch = source[i]
+        if ch in '"\'`':
+            end = i + 1
+            while end < n and source[end] != ch:
+                end += 2 if source[end] == '\\' else 1
+            out.append(source[i:end + 1])
+            i = end + 1
+        elif source.startswith('//', i):
+            end = source.find('\n', i)
+            i = n if end == -1 else end
+        elif source.startswith('/*', i):
+            end = source.find('*/', i + 2)
+            i = n if end == -1 else end + 2
+        elif ch == '/' and _regex_allowed(''.join(out[-8:]).rstrip()):
+            i = _copy_js_regex(source, i, out)
+        elif ch.isspace():
+            end = i
+            while end < n and source[end].isspace():
+                end += 1
+            newline = '\n' in source[i:end]
+            while out and out[-1] == ' ':
+                out.pop()
+            if newline:
+                if out and out[-1] != '\n':
+                    out.append('\n')
+            elif out and out[-1] != '\n':
+                out.append(' ')
+            i = end
+        else:
+            out.append(ch)
+            i += 1
+    return ''.join(out).strip() + '\n'
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+
+def hashed_name(name, content):
+    root, ext = posixpath.splitext(name)
+    return f'{root}.{hashlib.sha256(content).hexdigest()[:12]}{ext}'
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def _compress(path, content):
+    """Write .gz (and .br) next to a file when they come out smaller; returns the variants made"""
+    made = []
+    # mtime=0 keeps the gzip bytes identical from build to build
+    gzipped = gzip.compress(content, compresslevel=9, mtime=0)
+    if len(gzipped) < len(content):
+        _write(path + '.gz', gzipped)
+        made.append('gzip')
+    if brotli is not None:
+        compressed = brotli.compress(content, quality=11)
+        if len(compressed) < len(content):
+            _write(path + '.br', compressed)
+            made.append('br')
+    return made
+
+
+def build(static_folder, dist_dir, report=None):
+    """Rebuild dist_dir from static_folder; returns the manifest {source name: hashed name}"""
+    if os.path.isdir(dist_dir):
+        shutil.rmtree(dist_dir)
+    sources = []
+    for root, dirs, files in os.walk(static_folder):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != dist_dir]
+        for filename in files:
+            path = os.path.join(root, filename)
+            sources.append(os.path.relpath(path, static_folder).replace(os.sep, '/'))
+
+    manifest = {}
+    for name in sorted(sources):
+        with open(os.path.join(static_folder, name), 'rb') as f:
+            original = f.read()
+        ext = posixpath.splitext(name)[1].lower()
+        minify = MINIFIERS.get(ext)
+        content = minify(original.decode('utf-8')).encode('utf-8') if minify else original
+        target = hashed_name(name, content)
+        path = os.path.join(dist_dir, *target.split('/'))
+        _write(path, content)
+        variants = _compress(path, content) if ext in COMPRESSIBLE else []
+        manifest[name] = target
+        if report:
+            report(f'{name} -> {target} ({len(original)} -> {len(content)} bytes'
+                   f'{", " + "+".join(variants) if variants else ""})')
+
+    _write(os.path.join(dist_dir, MANIFEST_NAME), json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return manifest
+
+
+def load_manifest(dist_dir):
+    try:
+        with open(os.path.join(dist_dir, MANIFEST_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def asset_url(endpoint, **values):
+    """url_for() that sends static files to their fingerprinted build when there is one"""
+    if endpoint == 'static':
+        hashed = current_app.extensions['asset_manifest'].get(values.get('filename'))
+        if hashed is not None:
+            values['filename'] = hashed
+            return url_for('assets', **values)
+    return url_for(endpoint, **values)
+
+
+def serve_asset(filename):
+    """A hashed file, precompressed when the client accepts it; cacheable forever"""
+    dist_dir = current_app.config['ASSETS_DIST_DIR']
+    encoding = None
+    for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[candidate] and \
+                os.path.isfile(os.path.join(dist_dir, *(filename + suffix).split('/'))):
+            encoding = candidate
+            break
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    path = filename + {'br': '.br', 'gzip': '.gz'}.get(encoding, '')
+    response = send_from_directory(dist_dir, path, mimetype=mimetype,
+                                   max_age=current_app.config['ASSETS_MAX_AGE'])
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+@assets_cli.command('build')
+def build_command():
+    """Minify, fingerprint and precompress everything under static/"""
+    app = current_app._get_current_object()
+    manifest = build(app.static_folder, app.config['ASSETS_DIST_DIR'], report=click.echo)
+    app.extensions['asset_manifest'] = manifest
+    if brotli is None:
+        click.echo('brotli is not installed; wrote gzip variants only.')
+    click.echo(f'Built {len(manifest)} assets into {app.config["ASSETS_DIST_DIR"]}.')
+
+
+def init_app(app):
+    """Load the asset manifest and add the /assets route and asset_url() helper"""
+    app.config.setdefault('ASSETS_DIST_DIR', os.path.join(app.static_folder, 'dist'))
+    app.config.setdefault('ASSETS_MAX_AGE', 365 * 24 * 3600)
+    # Without a build (e.g. in development) asset_url() falls back to plain /static URLs
+    app.extensions['asset_manifest'] = load_manifest(app.config['ASSETS_DIST_DIR'])
+    app.add_url_rule('/assets/<path:filename>', 'assets', serve_asset)
+    app.jinja_env.globals['asset_url'] = asset_url
+    app.cli.add_command(assets_cli)
@@ -0,0 +1,5 @@
+"""
+Benchmarks for Online Bookstore
+Each module runs against a scratch database: python -m benchmarks.<name> --help
+Route benchmarks use a catalog built by benchmarks.datagen and compare runs with benchmarks.compare
+"""
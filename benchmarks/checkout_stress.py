@@ -0,0 +1,107 @@
+"""
+Checkout Stress Benchmark
+Many threads check out the same hot title at once against a scratch
+database; verifies stock never oversells and reports orders per second
+
+Usage: python -m benchmarks.checkout_stress --threads 16 --stock 200 --attempts 40
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+def run(threads, stock, attempts, quantity):
+    """Run the stress test and return a summary dict"""
+    scratch = tempfile.mkdtemp(prefix='bookstore-stress-')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(scratch, 'stress.db')}"
+
+    # Imported late so the app picks up the scratch database
+    from app import app
+    from models import db, User, Book, OrderItem
+    import migrations
+    import passwords
+
+    app.config['TESTING'] = True
+    password = 'stress-password'
+    with app.app_context():
+        migrations.upgrade()
+        password_hash = passwords.get_hasher().hash(password)
+        db.session.add_all([
+            User(username=f'stress{i}', email=f'stress{i}@example.com', password_hash=password_hash)
+            for i in range(threads)
+        ])
+        hot_book = Book(title='Hot Title', author='Popular Author', isbn='9999999999999',
+                        price=19.99, stock_quantity=stock)
+        db.session.add(hot_book)
+        db.session.commit()
+        hot_book_id = hot_book.id
+
+    results = {'placed': 0, 'rejected': 0, 'errors': 0}
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(threads + 1)
+
+    def worker(index):
+        client = app.test_client()
+        client.post('/login', data={'username': f'stress{index}', 'password': password})
+        start_barrier.wait()
+        for _ in range(attempts):
+            client.get(f'/cart/add/{hot_book_id}?quantity={quantity}')
+            try:
+                response = client.post('/checkout', data={'shipping_address': 'Benchmark Lane'})
+            except Exception:
+                outcome = 'errors'
+            else:
+                outcome = 'placed' if response.location and '/order/' in response.location else 'rejected'
+            client.get('/cart/clear')
+            with lock:
+                results[outcome] += 1
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    start_barrier.wait()
+    started = time.perf_counter()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        remaining = db.session.get(Book, hot_book_id).stock_quantity
+        sold = db.session.query(db.func.coalesce(db.func.sum(OrderItem.quantity), 0)) \
+            .filter(OrderItem.book_id == hot_book_id).scalar()
+
+    return {
+        'threads': threads,
+        'attempts': threads * attempts,
+        'initial_stock': stock,
+        'placed': results['placed'],
+        'rejected': results['rejected'],
+        'errors': results['errors'],
+        'sold': sold,
+        'remaining_stock': remaining,
+        'oversold': remaining < 0 or sold + remaining != stock,
+        'elapsed_seconds': round(elapsed, 3),
+        'orders_per_second': round(results['placed'] / elapsed, 1) if elapsed else None,
+        'checkouts_per_second': round(threads * attempts / elapsed, 1) if elapsed else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--stock', type=int, default=200)
+    parser.add_argument('--attempts', type=int, default=40, help='checkouts per thread')
+    parser.add_argument('--quantity', type=int, default=1, help='copies per checkout')
+    args = parser.parse_args()
+
+    summary = run(args.threads, args.stock, args.attempts, args.quantity)
+    print(json.dumps(summary, indent=2))
+    raise SystemExit(1 if summary['oversold'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Route Benchmark Comparison
+Compares two benchmarks.route_load JSON reports route by route and exits
+non-zero when a route got slower or started issuing more queries
+
+Usage: python -m benchmarks.compare baseline.json candidate.json --threshold 0.2
+"""
+
+import argparse
+import json
+import sys
+
+METRICS = ('p50_ms', 'p95_ms', 'p99_ms')
+
+
+def load(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare(baseline, candidate, threshold, min_ms):
+    """Return (rows, regressions); rows hold each shared route's before/after numbers"""
+    rows, regressions = [], []
+    for name, before in baseline['routes'].items():
+        after = candidate['routes'].get(name)
+        if after is None:
+            continue
+        row = {'route': name}
+        for metric in METRICS:
+            old, new = before[metric], after[metric]
+            change = (new - old) / old if old else 0.0
+            row[metric] = (old, new, change)
+            # Relative and absolute thresholds together keep sub-millisecond noise out
+            if metric == 'p95_ms' and change > threshold and new - old > min_ms:
+                regressions.append(f'{name}: p95 {old:.2f} -> {new:.2f} ms ({change:+.0%})')
+        old_q, new_q = before.get('queries_per_request'), after.get('queries_per_request')
+        row['queries'] = (old_q, new_q)
+        if old_q is not None and new_q is not None and new_q > old_q:
+            regressions.append(f'{name}: queries per request {old_q} -> {new_q}')
+        if after['errors'] > before['errors']:
+            regressions.append(f"{name}: errors {before['errors']} -> {after['errors']}")
+        rows.append(row)
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Allowed relative p95 increase')
+    parser.add_argument('--min-ms', type=float, default=1.0, help='Ignore p95 increases smaller than this')
+    args = parser.parse_args()
+
+    baseline, candidate = load(args.baseline), load(args.candidate)
+    for key in ('server', 'concurrency', 'response_cache', 'stream', 'rows'):
+        if baseline['meta'].get(key) != candidate['meta'].get(key):
+            print(f"warning: runs differ in {key}: {baseline['meta'].get(key)} vs {candidate['meta'].get(key)}",
+                  file=sys.stderr)
+
+    rows, regressions = compare(baseline, candidate, args.threshold, args.min_ms)
+    print(f"{'route':20} {'p50 ms':>19} {'p95 ms':>19} {'p99 ms':>19} {'queries':>11}")
+    for row in rows:
+        cells = [f'{old:7.2f}>{new:7.2f} {change:+4.0%}' for old, new, change in (row[m] for m in METRICS)]
+        old_q, new_q = row['queries']
+        print(f"{row['route']:20} {cells[0]:>19} {cells[1]:>19} {cells[2]:>19} {f'{old_q}>{new_q}':>11}")
+
+    if regressions:
+        print('\nRegressions:')
+        for line in regressions:
+            print(f'  {line}')
+        raise SystemExit(1)
+    print('\nNo regressions.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+"""
+Synthetic Catalog Generator
+Builds a large, deterministic bookstore database for the route benchmarks:
+the same --seed and --scale always produce the same rows
+
+Usage: python -m benchmarks.datagen --output benchmarks/data/bench.db --scale 0.05
+"""
+
+import argparse
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import bindparam, update
+
+# Row counts at --scale 1
+FULL_SCALE = {
+    'books': 200_000,
+    'users': 50_000,
+    'reviews': 2_000_000,
+    'orders': 500_000,
+}
+
+# Every generated user has this password
+PASSWORD = 'benchmark-password'
+
+CATEGORY_NAMES = [
+    'Fiction', 'Non-Fiction', 'Science', 'Technology', 'History', 'Biography',
+    'Children', 'Fantasy', 'Mystery', 'Romance', 'Poetry', 'Travel',
+    'Cooking', 'Art', 'Philosophy', 'Religion', 'Health', 'Business',
+    'Politics', 'Sports', 'Music', 'Comics', 'Horror', 'Education',
+]
+TITLE_WORDS = [
+    'Silent', 'River', 'Garden', 'Empire', 'Shadow', 'Light', 'Winter', 'Memory',
+    'Stone', 'City', 'Ocean', 'Secret', 'House', 'Journey', 'Crown', 'Night',
+    'Machine', 'Forest', 'Storm', 'Letters', 'Island', 'Glass', 'Fire', 'Road',
+]
+FIRST_NAMES = ['Ada', 'Ben', 'Chloe', 'Dev', 'Elena', 'Farid', 'Grace', 'Hiro', 'Ines', 'Jonas', 'Kemi', 'Liam']
+LAST_NAMES = ['Okafor', 'Silva', 'Nguyen', 'Brown', 'Kowalski', 'Haddad', 'Moreau', 'Tanaka', 'Singh', 'Walsh']
+PRICES = [Decimal(p) for p in ('4.99', '7.99', '9.99', '12.50', '14.99', '19.99', '24.00', '34.95')]
+STATUSES = ['pending', 'processing', 'shipped', 'delivered', 'delivered', 'delivered', 'cancelled']
+RATING_WEIGHTS = [0.05, 0.08, 0.17, 0.35, 0.35]
+
+# Fixed epoch so timestamps don't depend on when the generator runs
+EPOCH = datetime(2022, 1, 1)
+SPAN_MINUTES = 3 * 365 * 24 * 60
+
+
+def scaled_counts(scale):
+    return {name: max(1, int(count * scale)) for name, count in FULL_SCALE.items()}
+
+
+def popular(rnd, count):
+    """Skewed pick in 1..count so a few books get most reviews and sales"""
+    return 1 + min(count - 1, int(count * rnd.random() ** 3))
+
+
+def _insert(table, rows_iter, batch_size):
+    """executemany a row iterator into a table in batches; returns the row count"""
+    from models import db
+
+    total = 0
+    batch = []
+    for row in rows_iter:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            with db.engine.begin() as conn:
+                conn.execute(table.insert(), batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        with db.engine.begin() as conn:
+            conn.execute(table.insert(), batch)
+        total += len(batch)
+    return total
+
+
+def generate(counts, seed, batch_size, password_rounds, report=print):
+    """Fill the app's (empty) database; returns a summary dict"""
+    from models import db, Book, Category, User, Review, Order, OrderItem
+    import passwords
+
+    rnd = random.Random(seed)
+    started = time.perf_counter()
+    n_books, n_users = counts['books'], counts['users']
+
+    def stamp():
+        return EPOCH + timedelta(minutes=rnd.randrange(SPAN_MINUTES))
+
+    _insert(Category.__table__, (
+        {'id': i, 'name': name, 'description': f'Books about {name.lower()}', 'created_at': EPOCH}
+        for i, name in enumerate(CATEGORY_NAMES, start=1)
+    ), batch_size)
+
+    prices = [None] * (n_books + 1)
+
+    def book_rows():
+        for i in range(1, n_books + 1):
+            price = rnd.choice(PRICES)
+            prices[i] = price
+            created = stamp()
+            yield {
+                'id': i,
+                'title': f'The {rnd.choice(TITLE_WORDS)} {rnd.choice(TITLE_WORDS)} {i}',
+                'author': f'{rnd.choice(FIRST_NAMES)} {rnd.choice(LAST_NAMES)}',
+                'isbn': f'978{i:010d}',
+                'price': price,
+                'stock_quantity': 0 if rnd.random() < 0.1 else rnd.randint(1, 500),
+                'description': f'Synthetic book number {i}.',
+                'publisher': f'Press {i % 97}',
+                'pages': rnd.randint(80, 900),
+                'category_id': rnd.randint(1, len(CATEGORY_NAMES)),
+                'created_at': created,
+                'updated_at': created,
+            }
+    report(f'books: {_insert(Book.__table__, book_rows(), batch_size)}')
+
+    password_hash = passwords.PasswordHasher(rounds=password_rounds, workers=0).hash(PASSWORD)
+    user_rows = ({
+        'id': i, 'username': f'user{i}', 'email': f'user{i}@example.com', 'password_hash': password_hash,
+        'first_name': rnd.choice(FIRST_NAMES), 'last_name': rnd.choice(LAST_NAMES),
+        'created_at': stamp(), 'updated_at': EPOCH,
+    } for i in range(1, n_users + 1))
+    report(f'users: {_insert(User.__table__, user_rows, batch_size)}')
+
+    # Rating aggregates are tallied while generating so books match their reviews
+    tallies = [[0] * 6 for _ in range(n_books + 1)]
+
+    def review_rows():
+        for i in range(1, counts['reviews'] + 1):
+            book_id = popular(rnd, n_books)
+            rating = rnd.choices(range(1, 6), RATING_WEIGHTS)[0]
+            tallies[book_id][rating] += 1
+            yield {
+                'id': i, 'user_id': rnd.randint(1, n_users), 'book_id': book_id, 'rating': rating,
+                'comment': f'Review {i}', 'created_at': stamp(),
+            }
+    report(f'reviews: {_insert(Review.__table__, review_rows(), batch_size)}')
+
+    aggregates = []
+    for book_id in range(1, n_books + 1):
+        counts_by_rating = tallies[book_id]
+        total = sum(counts_by_rating)
+        if total:
+            rating_sum = sum(r * c for r, c in enumerate(counts_by_rating))
+            aggregates.append({
+                'b_id': book_id, 'count': total, 'sum': rating_sum, 'avg': round(rating_sum / total, 2),
+                **{f'c{r}': counts_by_rating[r] for r in range(1, 6)},
+            })
+    statement = update(Book.__table__).where(Book.__table__.c.id == bindparam('b_id')).values(
+        rating_count=bindparam('count'), rating_sum=bindparam('sum'), rating_average=bindparam('avg'),
+        **{f'rating_{r}_count': bindparam(f'c{r}') for r in range(1, 6)},
+    )
+    for start in range(0, len(aggregates), batch_size):
+        with db.engine.begin() as conn:
+            conn.execute(statement, aggregates[start:start + batch_size])
+
+    items = []
+
+    def order_rows():
+        item_id = 0
+        for i in range(1, counts['orders'] + 1):
+            total = Decimal('0.00')
+            for _ in range(rnd.choices((1, 2, 3, 4), (0.55, 0.25, 0.12, 0.08))[0]):
+                item_id += 1
+                book_id = popular(rnd, n_books)
+                quantity = rnd.choices((1, 2, 3), (0.85, 0.1, 0.05))[0]
+                total += prices[book_id] * quantity
+                items.append({'id': item_id, 'order_id': i, 'book_id': book_id,
+                              'quantity': quantity, 'unit_price': prices[book_id]})
+            placed = stamp()
+            yield {
+                'id': i, 'user_id': rnd.randint(1, n_users), 'order_date': placed, 'total_amount': total,
+                'status': rnd.choice(STATUSES), 'shipping_address': f'{i} Benchmark Street',
+                'created_at': placed, 'updated_at': placed,
+            }
+    report(f'orders: {_insert(Order.__table__, order_rows(), batch_size)}')
+    report(f'order items: {_insert(OrderItem.__table__, iter(items), batch_size)}')
+
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql('ANALYZE')
+        conn.exec_driver_sql('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    return {
+        'seed': seed,
+        'counts': {**counts, 'order_items': len(items), 'categories': len(CATEGORY_NAMES)},
+        'seconds': round(time.perf_counter() - started, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--output', default=os.path.join('benchmarks', 'data', 'bench.db'))
+    parser.add_argument('--scale', type=float, default=1.0, help='Fraction of the full-size catalog')
+    parser.add_argument('--seed', type=int, default=20240101)
+    parser.add_argument('--batch-size', type=int, default=10_000)
+    parser.add_argument('--password-rounds', type=int, default=12, help='bcrypt cost of the shared user password')
+    parser.add_argument('--force', action='store_true', help='Replace an existing output file')
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output)
+    if os.path.exists(output):
+        if not args.force:
+            parser.error(f'{output} exists; pass --force to replace it')
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(output + suffix):
+                os.remove(output + suffix)
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    os.environ['DATABASE_URL'] = f'sqlite:///{output}'
+    os.environ.setdefault('PASSWORD_HASH_WORKERS', '0')
+
+    # Imported late so the app opens the output database
+    from app import app
+    import migrations
+
+    with app.app_context():
+        migrations.upgrade()
+        summary = generate(scaled_counts(args.scale), args.seed, args.batch_size, args.password_rounds)
+    summary['database'] = output
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == '__main__':
+    main()
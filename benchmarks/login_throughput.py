@@ -0,0 +1,119 @@
+"""
+Login Throughput Benchmark
+Runs a login burst next to steady page traffic, once with bcrypt inline on the
+request threads and once on the password pool, and compares login throughput
+with the latency of the concurrent page loads
+
+Usage: python -m benchmarks.login_throughput --login-threads 8 --page-threads 4 --seconds 10
+"""
+
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_mode(app, hasher, users, password, login_threads, page_threads, seconds):
+    """Drive logins and page loads together for a fixed time with the given hasher"""
+    app.extensions['password_hasher'] = hasher
+    stop = threading.Event()
+    logins = []
+    page_latencies = []
+    busy = []
+    lock = threading.Lock()
+
+    def login_worker(index):
+        client = app.test_client()
+        username = users[index % len(users)]
+        while not stop.is_set():
+            started = time.perf_counter()
+            response = client.post('/login', data={'username': username, 'password': password})
+            elapsed = time.perf_counter() - started
+            client.get('/logout')
+            with lock:
+                (busy if response.status_code == 503 else logins).append(elapsed)
+
+    def page_worker():
+        client = app.test_client()
+        while not stop.is_set():
+            started = time.perf_counter()
+            client.get('/books')
+            with lock:
+                page_latencies.append(time.perf_counter() - started)
+
+    pool = [threading.Thread(target=login_worker, args=(i,)) for i in range(login_threads)]
+    pool += [threading.Thread(target=page_worker) for _ in range(page_threads)]
+    for thread in pool:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in pool:
+        thread.join()
+
+    return {
+        'logins_per_second': round(len(logins) / seconds, 1),
+        'login_p50_ms': round(statistics.median(logins) * 1000, 1) if logins else None,
+        'rejected_busy': len(busy),
+        'pages_per_second': round(len(page_latencies) / seconds, 1),
+        'page_p50_ms': round(percentile(page_latencies, 0.50) * 1000, 2) if page_latencies else None,
+        'page_p95_ms': round(percentile(page_latencies, 0.95) * 1000, 2) if page_latencies else None,
+        'page_p99_ms': round(percentile(page_latencies, 0.99) * 1000, 2) if page_latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--login-threads', type=int, default=8)
+    parser.add_argument('--page-threads', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--rounds', type=int, default=12, help='bcrypt work factor')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help='password pool processes')
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix='bookstore-login-')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(scratch, 'login.db')}"
+
+    # Imported late so the app picks up the scratch database
+    from app import app
+    from models import db, User
+    import migrations
+    from passwords import PasswordHasher
+
+    app.config['TESTING'] = True
+    # Page loads should render every time rather than come from the response cache
+    app.config['RESPONSE_CACHE_ENABLED'] = False
+    password = 'benchmark-password'
+    users = [f'login{i}' for i in range(args.login_threads)]
+    with app.app_context():
+        migrations.upgrade()
+        password_hash = PasswordHasher(rounds=args.rounds, workers=0).hash(password)
+        db.session.add_all([
+            User(username=name, email=f'{name}@example.com', password_hash=password_hash) for name in users
+        ])
+        db.session.commit()
+
+    pooled = PasswordHasher(rounds=args.rounds, workers=args.workers, max_pending=args.workers * 4)
+    pooled.verify(password, password_hash)  # start the pool outside the measurement
+    results = {
+        'inline': run_mode(app, PasswordHasher(rounds=args.rounds, workers=0), users, password,
+                           args.login_threads, args.page_threads, args.seconds),
+        'pool': run_mode(app, pooled, users, password,
+                         args.login_threads, args.page_threads, args.seconds),
+    }
+    pooled.shutdown()
+    print(json.dumps({'rounds': args.rounds, 'workers': args.workers, **results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
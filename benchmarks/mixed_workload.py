@@ -0,0 +1,154 @@
+"""
+Mixed Read/Write Benchmark
+Reader threads browse catalog pages while writer threads check out orders
+against a scratch SQLite database, once with the old engine defaults
+(rollback journal, synchronous=FULL, no read routing) and once with the tuned
+engine configuration; reports reads and writes per second for each
+
+Usage: python -m benchmarks.mixed_workload --readers 8 --writers 4 --seconds 10
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# Environment for each profile; the engine reads it at import time
+PROFILES = {
+    'baseline': {
+        'SQLITE_JOURNAL_MODE': 'DELETE',
+        'SQLITE_SYNCHRONOUS': 'FULL',
+        'SQLITE_CACHE_SIZE_KB': '2000',
+        'SQLITE_MMAP_SIZE': '0',
+        'DB_READ_ROUTING': '0',
+        'DB_POOL_SIZE': '5',
+        'DB_MAX_OVERFLOW': '10',
+    },
+    'tuned': {},
+}
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else None
+
+
+def run_profile(readers, writers, seconds, books):
+    """Run the workload in this process with whatever engine config is in the environment"""
+    scratch = tempfile.mkdtemp(prefix='bookstore-mixed-')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(scratch, 'mixed.db')}"
+    os.environ.setdefault('PASSWORD_HASH_WORKERS', '0')
+
+    # Imported late so the app picks up the scratch database and profile
+    from app import app
+    from models import db, User, Book, Category
+    import migrations
+    import passwords
+
+    app.config['TESTING'] = True
+    app.config['RESPONSE_CACHE_ENABLED'] = False
+    password = 'mixed-password'
+    with app.app_context():
+        migrations.upgrade()
+        password_hash = passwords.PasswordHasher(rounds=4, workers=0).hash(password)
+        db.session.add_all([
+            User(username=f'writer{i}', email=f'writer{i}@example.com', password_hash=password_hash)
+            for i in range(writers)
+        ])
+        db.session.add_all([Category(name=f'Category {i}') for i in range(8)])
+        db.session.flush()
+        rnd = random.Random(42)
+        db.session.add_all([
+            Book(title=f'Mixed Title {i}', author=f'Author {i % 50}', isbn=f'977{i:010d}',
+                 price=rnd.choice([5, 9.99, 14.5, 20]), stock_quantity=1_000_000, category_id=1 + i % 8)
+            for i in range(books)
+        ])
+        db.session.commit()
+
+    stop = threading.Event()
+    counts = {'reads': [], 'writes': [], 'errors': 0}
+    lock = threading.Lock()
+
+    def reader(seed):
+        rnd = random.Random(seed)
+        client = app.test_client()
+        pages = ['/', '/books', '/books?sort=price_low', '/categories', '/category/{}', '/book/{}']
+        while not stop.is_set():
+            page = rnd.choice(pages)
+            url = page.format(rnd.randint(1, 8) if page.startswith('/category/') else rnd.randint(1, books))
+            started = time.perf_counter()
+            response = client.get(url)
+            elapsed = time.perf_counter() - started
+            with lock:
+                if response.status_code >= 500:
+                    counts['errors'] += 1
+                else:
+                    counts['reads'].append(elapsed)
+
+    def writer(index):
+        rnd = random.Random(1000 + index)
+        client = app.test_client()
+        client.post('/login', data={'username': f'writer{index}', 'password': password})
+        while not stop.is_set():
+            client.get(f'/cart/add/{rnd.randint(1, books)}')
+            started = time.perf_counter()
+            response = client.post('/checkout', data={'shipping_address': 'Benchmark Lane'})
+            elapsed = time.perf_counter() - started
+            with lock:
+                if response.location and '/order/' in response.location:
+                    counts['writes'].append(elapsed)
+                else:
+                    counts['errors'] += 1
+
+    pool = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    pool += [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    for thread in pool:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in pool:
+        thread.join()
+
+    return {
+        'reads_per_second': round(len(counts['reads']) / seconds, 1),
+        'read_p95_ms': round(percentile(counts['reads'], 0.95) * 1000, 2) if counts['reads'] else None,
+        'writes_per_second': round(len(counts['writes']) / seconds, 1),
+        'write_p95_ms': round(percentile(counts['writes'], 0.95) * 1000, 2) if counts['writes'] else None,
+        'errors': counts['errors'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--books', type=int, default=2000)
+    parser.add_argument('--profile', choices=sorted(PROFILES), help='Run one profile in this process')
+    args = parser.parse_args()
+
+    if args.profile:
+        print(json.dumps(run_profile(args.readers, args.writers, args.seconds, args.books)))
+        return
+
+    # Each profile runs in a fresh interpreter so its engine config takes effect
+    results = {}
+    for name, overrides in PROFILES.items():
+        env = {**os.environ, **overrides}
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.mixed_workload', '--profile', name,
+             '--readers', str(args.readers), '--writers', str(args.writers),
+             '--seconds', str(args.seconds), '--books', str(args.books)],
+            env=env, check=True, capture_output=True, text=True,
+        ).stdout
+        results[name] = json.loads(output.strip().splitlines()[-1])
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
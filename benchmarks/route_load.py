@@ -0,0 +1,386 @@
+"""
+Route Load Benchmark
+Drives every route of the app against a database from benchmarks.datagen,
+through the Flask test client or a real threaded WSGI server, and writes
+p50/p95/p99 latency and queries per request for each route as JSON
+
+Usage: python -m benchmarks.route_load --database benchmarks/data/bench.db --requests 200
+Compare two runs with: python -m benchmarks.compare old.json new.json
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode
+
+from benchmarks.datagen import PASSWORD
+
+QUERY_COUNT_HEADER = 'X-Benchmark-Queries'
+
+
+class Scenario:
+    """
+    One route under load
+    build(rnd, ids) returns (method, path, form); setup(client, rnd, ids) runs
+    untimed before each request; auth picks the logged-in client
+    """
+
+    def __init__(self, name, build, auth=False, setup=None):
+        self.name = name
+        self.build = build
+        self.auth = auth
+        self.setup = setup
+
+
+def _get(path):
+    return lambda rnd, ids: ('GET', path, None)
+
+
+def _in_stock_book(rnd, ids):
+    return rnd.choice(ids['in_stock_books'])
+
+
+def _add_to_cart(client, rnd, ids):
+    client.request('GET', f'/cart/add/{_in_stock_book(rnd, ids)}')
+
+
+def _restore_login(client, rnd, ids):
+    client.restore()
+
+
+def _log_out(client, rnd, ids):
+    client.clear()
+
+
+SCENARIOS = [
+    Scenario('index', _get('/')),
+    Scenario('books', _get('/books')),
+    Scenario('books_price_low', _get('/books?sort=price_low')),
+    Scenario('books_newest', _get('/books?sort=newest')),
+    Scenario('books_rating', _get('/books?sort=rating&min_rating=3')),
+    Scenario('books_search', lambda rnd, ids: ('GET', f"/books?search={rnd.choice(ids['words'])}", None)),
+    Scenario('books_category', lambda rnd, ids: ('GET', f"/books?category={rnd.choice(ids['categories'])}", None)),
+    Scenario('book_detail', lambda rnd, ids: ('GET', f"/book/{rnd.choice(ids['books'])}", None)),
+    Scenario('categories', _get('/categories')),
+    Scenario('category_books', lambda rnd, ids: ('GET', f"/category/{rnd.choice(ids['categories'])}", None)),
+    Scenario('about', _get('/about')),
+    Scenario('contact', _get('/contact')),
+    Scenario('contact_submit', lambda rnd, ids: ('POST', '/contact', {
+        'name': 'Bench', 'email': 'bench@example.com', 'subject': 'Load', 'message': 'Benchmark message'})),
+    Scenario('register_form', _get('/register')),
+    Scenario('login_form', _get('/login')),
+    Scenario('login', lambda rnd, ids: ('POST', '/login', {'username': ids['username'], 'password': PASSWORD}),
+             setup=_log_out),
+    Scenario('cart', _get('/cart'), auth=True),
+    Scenario('add_to_cart', lambda rnd, ids: ('GET', f'/cart/add/{_in_stock_book(rnd, ids)}', None), auth=True),
+    Scenario('update_cart', lambda rnd, ids: ('POST', '/cart/update', {
+        f'quantity_{_in_stock_book(rnd, ids)}': '1'}), auth=True),
+    Scenario('checkout_form', _get('/checkout'), auth=True, setup=_add_to_cart),
+    Scenario('checkout', lambda rnd, ids: ('POST', '/checkout', {'shipping_address': '1 Benchmark Street'}),
+             auth=True, setup=_add_to_cart),
+    Scenario('clear_cart', _get('/cart/clear'), auth=True, setup=_add_to_cart),
+    Scenario('profile', _get('/profile'), auth=True),
+    Scenario('edit_profile', _get('/profile/edit'), auth=True),
+    Scenario('orders', _get('/orders'), auth=True),
+    Scenario('order_confirmation', lambda rnd, ids: ('GET', f"/order/{rnd.choice(ids['orders'])}", None), auth=True),
+    Scenario('add_review', lambda rnd, ids: ('POST', f"/book/{rnd.choice(ids['books'])}/review", {
+        'rating': str(rnd.randint(1, 5)), 'comment': 'Benchmark review'}), auth=True),
+    Scenario('api_books', _get('/api/books')),
+    Scenario('api_categories', _get('/api/categories')),
+    Scenario('api_orders', _get('/api/orders'), auth=True),
+    Scenario('cache_stats', _get('/cache/stats'), auth=True),
+    Scenario('logout', _get('/logout'), auth=True, setup=_restore_login),
+]
+
+
+class TestClient:
+    """Flask test client with a restorable session cookie"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+        self.saved = None
+
+    def request(self, method, path, form=None):
+        response = self.client.open(path, method=method, data=form)
+        body = response.get_data()
+        return response.status_code, len(body), response.headers.get(QUERY_COUNT_HEADER)
+
+    def save(self):
+        self.saved = self.client.get_cookie('session')
+
+    def restore(self):
+        if self.saved is not None:
+            self.client.set_cookie('session', self.saved.value)
+
+    def clear(self):
+        self.client.delete_cookie('session')
+
+
+class HTTPClient:
+    """Keep-alive HTTP client for the WSGI server; follows no redirects"""
+
+    def __init__(self, host, port):
+        self.connection = http.client.HTTPConnection(host, port, timeout=60)
+        self.cookies = {}
+        self.saved = None
+
+    def request(self, method, path, form=None):
+        headers = {}
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{k}={v}' for k, v in self.cookies.items())
+        self.connection.request(method, path, body=body, headers=headers)
+        response = self.connection.getresponse()
+        data = response.read()
+        for header in response.headers.get_all('Set-Cookie') or []:
+            for name, morsel in SimpleCookie(header).items():
+                if morsel['expires'] and 'Thu, 01 Jan 1970' in morsel['expires']:
+                    self.cookies.pop(name, None)
+                else:
+                    self.cookies[name] = morsel.value
+        return response.status, len(data), response.headers.get(QUERY_COUNT_HEADER)
+
+    def save(self):
+        self.saved = dict(self.cookies)
+
+    def restore(self):
+        if self.saved is not None:
+            self.cookies = dict(self.saved)
+
+    def clear(self):
+        self.cookies = {}
+
+
+def instrument(app):
+    """Count SQL statements per request and report them in a response header"""
+    from flask import g, has_request_context
+    from sqlalchemy import event
+    from models import db
+
+    def count(*args, **kwargs):
+        if has_request_context():
+            g.benchmark_queries = g.get('benchmark_queries', 0) + 1
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', count)
+
+    @app.after_request
+    def add_query_count(response):
+        # A streamed page is still querying when its headers go out
+        if response.is_streamed:
+            return response
+        response.headers[QUERY_COUNT_HEADER] = str(g.get('benchmark_queries', 0))
+        return response
+
+
+def sample_ids(app, seed):
+    """IDs and words the scenarios draw from, chosen deterministically"""
+    from models import db, Book, Category, Order, User
+
+    rnd = random.Random(seed)
+    with app.app_context():
+        books = [row.id for row in db.session.query(Book.id).order_by(Book.id)]
+        in_stock = [row.id for row in db.session.query(Book.id).filter(Book.stock_quantity > 10)
+                    .order_by(Book.id)]
+        categories = [row.id for row in db.session.query(Category.id).order_by(Category.id)]
+        user = db.session.query(User.id, User.username).join(Order, Order.user_id == User.id) \
+            .order_by(User.id).first()
+        orders = [row.id for row in db.session.query(Order.id).filter(Order.user_id == user.id)]
+        titles = [row.title for row in db.session.query(Book.title).order_by(Book.id).limit(200)]
+    words = sorted({word.lower() for title in titles for word in title.split() if word.isalpha() and len(word) > 3})
+    return {
+        'books': rnd.sample(books, min(len(books), 1000)),
+        'in_stock_books': rnd.sample(in_stock, min(len(in_stock), 1000)),
+        'categories': categories,
+        'user_id': user.id,
+        'username': user.username,
+        'orders': orders,
+        'words': words or ['the'],
+    }
+
+
+def summarize(latencies, statuses, sizes, queries):
+    ordered = sorted(latencies)
+
+    def pct(fraction):
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 3)
+
+    counted = [q for q in queries if q is not None]
+    return {
+        'requests': len(ordered),
+        'errors': sum(1 for status in statuses if status >= 500),
+        'statuses': {str(code): statuses.count(code) for code in sorted(set(statuses))},
+        'p50_ms': pct(0.50),
+        'p95_ms': pct(0.95),
+        'p99_ms': pct(0.99),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3),
+        'queries_per_request': round(statistics.fmean(counted), 2) if counted else None,
+        'max_queries': max(counted) if counted else None,
+        'mean_bytes': round(statistics.fmean(sizes)),
+    }
+
+
+def run_scenario(scenario, make_client, ids, requests, warmup, concurrency, seed):
+    """Run one scenario on `concurrency` clients; returns the summary dict"""
+    latencies, statuses, sizes, queries = [], [], [], []
+    lock = threading.Lock()
+    per_client = max(1, requests // concurrency)
+
+    def worker(index):
+        rnd = random.Random(f'{seed}-{scenario.name}-{index}')
+        client = make_client(scenario.auth, ids)
+        for iteration in range(warmup + per_client):
+            if scenario.setup:
+                scenario.setup(client, rnd, ids)
+            method, path, form = scenario.build(rnd, ids)
+            started = time.perf_counter()
+            status, size, count = client.request(method, path, form)
+            elapsed = time.perf_counter() - started
+            if iteration >= warmup:
+                with lock:
+                    latencies.append(elapsed)
+                    statuses.append(status)
+                    sizes.append(size)
+                    queries.append(int(count) if count is not None else None)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, statuses, sizes, queries)
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def table_counts(path):
+    conn = sqlite3.connect(path)
+    try:
+        return {table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                for table in ('books', 'users', 'reviews', 'orders', 'order_items')}
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database', default=os.path.join('benchmarks', 'data', 'bench.db'),
+                        help='Database built by benchmarks.datagen')
+    parser.add_argument('--server', choices=['testclient', 'wsgi'], default='testclient')
+    parser.add_argument('--requests', type=int, default=200, help='Timed requests per route')
+    parser.add_argument('--warmup', type=int, default=5, help='Untimed requests per client first')
+    parser.add_argument('--concurrency', type=int, default=1, help='Clients per route')
+    parser.add_argument('--routes', help='Comma-separated scenario names (default: all)')
+    parser.add_argument('--response-cache', action='store_true', help='Leave the response cache on')
+    parser.add_argument('--stream', action='store_true',
+                        help='Stream listing pages (query counts are then not reported for them)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--in-place', action='store_true',
+                        help='Run on the database itself instead of a scratch copy')
+    parser.add_argument('--output', help='JSON file (default: benchmarks/results/<timestamp>.json)')
+    args = parser.parse_args()
+
+    source = os.path.abspath(args.database)
+    if not os.path.exists(source):
+        parser.error(f'{source} not found; build it with python -m benchmarks.datagen')
+    database = source
+    if not args.in_place:
+        # Writes (checkouts, reviews) go to a copy so every run starts from the same data
+        database = os.path.join(tempfile.mkdtemp(prefix='bookstore-routes-'), 'bench.db')
+        shutil.copyfile(source, database)
+    os.environ['DATABASE_URL'] = f'sqlite:///{database}'
+
+    # Imported late so the app opens the benchmark database
+    from app import app
+
+    app.config['PROPAGATE_EXCEPTIONS'] = False
+    app.config['RESPONSE_CACHE_ENABLED'] = args.response_cache
+    app.config['STREAM_TEMPLATES'] = args.stream
+    instrument(app)
+    ids = sample_ids(app, args.seed)
+
+    server = None
+    if args.server == 'wsgi':
+        from werkzeug.serving import make_server
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        def new_client():
+            return HTTPClient('127.0.0.1', server.server_port)
+    else:
+        def new_client():
+            return TestClient(app)
+
+    def make_client(auth, ids):
+        client = new_client()
+        if auth:
+            client.request('POST', '/login', {'username': ids['username'], 'password': PASSWORD})
+            client.save()
+        return client
+
+    wanted = set(args.routes.split(',')) if args.routes else None
+    results = {}
+    for scenario in SCENARIOS:
+        if wanted and scenario.name not in wanted:
+            continue
+        results[scenario.name] = run_scenario(scenario, make_client, ids, args.requests,
+                                              args.warmup, args.concurrency, args.seed)
+        print(f"{scenario.name:20} p50 {results[scenario.name]['p50_ms']:8.2f} ms  "
+              f"p95 {results[scenario.name]['p95_ms']:8.2f} ms  "
+              f"queries {results[scenario.name]['queries_per_request']}", file=sys.stderr)
+    if server is not None:
+        server.shutdown()
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'server': args.server,
+            'requests': args.requests,
+            'warmup': args.warmup,
+            'concurrency': args.concurrency,
+            'response_cache': args.response_cache,
+            'stream': args.stream,
+            'seed': args.seed,
+            'rows': table_counts(source),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+        },
+        'routes': results,
+    }
+    output = args.output or os.path.join(
+        'benchmarks', 'results', f"routes-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f'Wrote {output}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Cart Pricing Service for Online Bookstore
+Hydrates cart entries with their books in a single query and prices them
+with Decimal arithmetic, for the cart page and both checkout steps
+"""
+
+from decimal import Decimal, ROUND_HALF_UP
+
+from models import Book
+
+CENT = Decimal('0.01')
+
+
+class PricedLine:
+    """A cart entry joined with its book and priced"""
+
+    __slots__ = ('book', 'book_id', 'quantity', 'unit_price', 'subtotal')
+
+    def __init__(self, book, quantity):
+        self.book = book
+        self.book_id = book.id
+        self.quantity = quantity
+        self.unit_price = Decimal(book.price).quantize(CENT, rounding=ROUND_HALF_UP)
+        self.subtotal = (self.unit_price * quantity).quantize(CENT, rounding=ROUND_HALF_UP)
+
+    @property
+    def in_stock(self):
+        """Check if enough copies are in stock for this line"""
+        return self.book.stock_quantity >= self.quantity
+
+
+class PricedCart:
+    """All priced lines of a cart plus its total"""
+
+    def __init__(self, lines, missing_book_ids=()):
+        self.lines = lines
+        self.missing_book_ids = list(missing_book_ids)
+        self.total = sum((line.subtotal for line in lines), Decimal('0.00'))
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __bool__(self):
+        return bool(self.lines)
+
+
+def price_cart(entries):
+    """
+    Price a list of {'book_id', 'quantity'} cart entries
+    Books are loaded with one IN query; entries for deleted books are reported, not priced
+    """
+    book_ids = {entry['book_id'] for entry in entries}
+    books = {}
+    if book_ids:
+        books = {book.id: book for book in Book.query.filter(Book.id.in_(book_ids)).all()}
+
+    lines, missing = [], []
+    for entry in entries:
+        book = books.get(entry['book_id'])
+        if book is None:
+            missing.append(entry['book_id'])
+            continue
+        lines.append(PricedLine(book, entry['quantity']))
+    return PricedCart(lines, missing)
@@ -0,0 +1,306 @@
+"""
+Server-Side Cart Store for Online Bookstore
+Keeps shopping carts on the server with TTL eviction so the session cookie
+only carries a cart ID; anonymous carts merge into the user's cart on login
+"""
+
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+import click
+from flask import current_app, session
+from flask_login import current_user, user_logged_in
+
+
+class CartStore(ABC):
+    """
+    Interface for cart backends
+    A cart is an ordered mapping of book_id -> quantity; entries come back as
+    [{'book_id': ..., 'quantity': ...}] for the pricing service
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+
+    @abstractmethod
+    def get(self, cart_id):
+        """The cart's lines in insertion order; an unknown cart is empty"""
+
+    @abstractmethod
+    def add(self, cart_id, book_id, quantity):
+        """Add copies of a book; a non-positive quantity removes the line"""
+
+    @abstractmethod
+    def update(self, cart_id, quantities):
+        """Set quantities for several books at once; zero removes the line"""
+
+    @abstractmethod
+    def clear(self, cart_id):
+        """Empty the cart"""
+
+    @abstractmethod
+    def merge(self, source_id, target_id):
+        """Move every line of source into target, summing quantities, then drop source"""
+
+    @abstractmethod
+    def evict_expired(self):
+        """Drop carts whose TTL has passed; returns how many were removed"""
+
+
+class MemoryCartStore(CartStore):
+    """In-process backend; carts are lost on restart and not shared between workers"""
+
+    def __init__(self, ttl, sweep_interval=60):
+        super().__init__(ttl)
+        self.sweep_interval = sweep_interval
+        self._carts = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def _live_lines(self, cart_id, now):
+        entry = self._carts.get(cart_id)
+        if entry is None:
+            return None
+        expires_at, lines = entry
+        if expires_at <= now:
+            del self._carts[cart_id]
+            return None
+        return lines
+
+    def _write(self, cart_id, lines, now):
+        if lines:
+            self._carts[cart_id] = (now + self.ttl, lines)
+        else:
+            self._carts.pop(cart_id, None)
+        if now - self._last_sweep >= self.sweep_interval:
+            self._sweep(now)
+
+    def _sweep(self, now):
+        expired = [key for key, (expires_at, _) in self._carts.items() if expires_at <= now]
+        for key in expired:
+            del self._carts[key]
+        self._last_sweep = now
+        return len(expired)
+
+    def get(self, cart_id):
+        with self._lock:
+            lines = self._live_lines(cart_id, time.monotonic())
+            if not lines:
+                return []
+            return [{'book_id': book_id, 'quantity': quantity} for book_id, quantity in lines.items()]
+
+    def add(self, cart_id, book_id, quantity):
+        with self._lock:
+            now = time.monotonic()
+            lines = self._live_lines(cart_id, now) or OrderedDict()
+            total = lines.get(book_id, 0) + quantity if quantity > 0 else 0
+            if total > 0:
+                lines[book_id] = total
+            else:
+                lines.pop(book_id, None)
+            self._write(cart_id, lines, now)
+
+    def update(self, cart_id, quantities):
+        with self._lock:
+            now = time.monotonic()
+            lines = self._live_lines(cart_id, now) or OrderedDict()
+            for book_id, quantity in quantities.items():
+                if quantity > 0:
+                    lines[book_id] = quantity
+                else:
+                    lines.pop(book_id, None)
+            self._write(cart_id, lines, now)
+
+    def clear(self, cart_id):
+        with self._lock:
+            self._carts.pop(cart_id, None)
+
+    def merge(self, source_id, target_id):
+        with self._lock:
+            now = time.monotonic()
+            source = self._live_lines(source_id, now)
+            self._carts.pop(source_id, None)
+            if not source:
+                return
+            target = self._live_lines(target_id, now) or OrderedDict()
+            for book_id, quantity in source.items():
+                target[book_id] = target.get(book_id, 0) + quantity
+            self._write(target_id, target, now)
+
+    def evict_expired(self):
+        with self._lock:
+            return self._sweep(time.monotonic())
+
+
+class SQLiteCartStore(CartStore):
+    """SQLite backend shared by every worker process on the host"""
+
+    SCHEMA = [
+        """CREATE TABLE IF NOT EXISTS carts (
+            cart_id TEXT PRIMARY KEY,
+            expires_at REAL NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS ix_carts_expires_at ON carts (expires_at)",
+        """CREATE TABLE IF NOT EXISTS cart_lines (
+            cart_id TEXT NOT NULL,
+            book_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            added_at REAL NOT NULL,
+            PRIMARY KEY (cart_id, book_id)
+        ) WITHOUT ROWID""",
+    ]
+
+    def __init__(self, ttl, path):
+        super().__init__(ttl)
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as conn:
+            for statement in self.SCHEMA:
+                conn.execute(statement)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _touch(self, conn, cart_id):
+        conn.execute(
+            'INSERT INTO carts (cart_id, expires_at) VALUES (?, ?) '
+            'ON CONFLICT (cart_id) DO UPDATE SET expires_at = excluded.expires_at',
+            (cart_id, time.time() + self.ttl)
+        )
+
+    def _discard_if_expired(self, conn, cart_id):
+        conn.execute(
+            'DELETE FROM cart_lines WHERE cart_id = ? AND cart_id IN '
+            '(SELECT cart_id FROM carts WHERE cart_id = ? AND expires_at <= ?)',
+            (cart_id, cart_id, time.time())
+        )
+
+    def _drop(self, conn, cart_id):
+        conn.execute('DELETE FROM cart_lines WHERE cart_id = ?', (cart_id,))
+        conn.execute('DELETE FROM carts WHERE cart_id = ?', (cart_id,))
+
+    def get(self, cart_id):
+        rows = self._connection().execute(
+            'SELECT l.book_id, l.quantity FROM cart_lines l JOIN carts c ON c.cart_id = l.cart_id '
+            'WHERE l.cart_id = ? AND c.expires_at > ? ORDER BY l.added_at',
+            (cart_id, time.time())
+        ).fetchall()
+        return [{'book_id': book_id, 'quantity': quantity} for book_id, quantity in rows]
+
+    def add(self, cart_id, book_id, quantity):
+        with self._connection() as conn:
+            self._discard_if_expired(conn, cart_id)
+            if quantity > 0:
+                conn.execute(
+                    'INSERT INTO cart_lines (cart_id, book_id, quantity, added_at) VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT (cart_id, book_id) DO UPDATE SET quantity = quantity + excluded.quantity',
+                    (cart_id, book_id, quantity, time.time())
+                )
+            else:
+                conn.execute('DELETE FROM cart_lines WHERE cart_id = ? AND book_id = ?', (cart_id, book_id))
+            self._touch(conn, cart_id)
+
+    def update(self, cart_id, quantities):
+        now = time.time()
+        with self._connection() as conn:
+            self._discard_if_expired(conn, cart_id)
+            conn.executemany(
+                'INSERT INTO cart_lines (cart_id, book_id, quantity, added_at) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (cart_id, book_id) DO UPDATE SET quantity = excluded.quantity',
+                [(cart_id, book_id, quantity, now) for book_id, quantity in quantities.items() if quantity > 0]
+            )
+            conn.executemany(
+                'DELETE FROM cart_lines WHERE cart_id = ? AND book_id = ?',
+                [(cart_id, book_id) for book_id, quantity in quantities.items() if quantity <= 0]
+            )
+            self._touch(conn, cart_id)
+
+    def clear(self, cart_id):
+        with self._connection() as conn:
+            self._drop(conn, cart_id)
+
+    def merge(self, source_id, target_id):
+        with self._connection() as conn:
+            live = conn.execute(
+                'SELECT 1 FROM carts WHERE cart_id = ? AND expires_at > ?', (source_id, time.time())
+            ).fetchone()
+            if live:
+                conn.execute(
+                    'INSERT INTO cart_lines (cart_id, book_id, quantity, added_at) '
+                    'SELECT ?, book_id, quantity, added_at FROM cart_lines WHERE cart_id = ? '
+                    'ON CONFLICT (cart_id, book_id) DO UPDATE SET quantity = quantity + excluded.quantity',
+                    (target_id, source_id)
+                )
+                self._touch(conn, target_id)
+            self._drop(conn, source_id)
+
+    def evict_expired(self):
+        with self._connection() as conn:
+            now = time.time()
+            conn.execute(
+                'DELETE FROM cart_lines WHERE cart_id IN (SELECT cart_id FROM carts WHERE expires_at <= ?)',
+                (now,)
+            )
+            return conn.execute('DELETE FROM carts WHERE expires_at <= ?', (now,)).rowcount
+
+
+def get_store():
+    """The cart store configured for the current app"""
+    return current_app.extensions['cart_store']
+
+
+def current_cart_id(create=False):
+    """
+    Cart ID for the current visitor
+    Logged-in users own a cart keyed by user ID; anonymous visitors get a random
+    ID in the session cookie, created on first write
+    """
+    if current_user.is_authenticated:
+        return f'user:{current_user.id}'
+    cart_id = session.get('cart_id')
+    if cart_id is None and create:
+        cart_id = session['cart_id'] = secrets.token_urlsafe(16)
+    return cart_id
+
+
+def _merge_anonymous_cart(sender, user, **extra):
+    """Fold the visitor's anonymous cart into their account cart on login"""
+    cart_id = session.pop('cart_id', None)
+    if cart_id:
+        get_store().merge(cart_id, f'user:{user.id}')
+
+
+def init_app(app):
+    """Create the configured cart backend and hook login merging"""
+    app.config.setdefault('CART_STORE', os.environ.get('CART_STORE', 'memory'))
+    app.config.setdefault('CART_TTL', int(os.environ.get('CART_TTL', 7 * 24 * 3600)))
+    app.config.setdefault('CART_STORE_PATH', os.environ.get('CART_STORE_PATH',
+                                                            os.path.join(app.instance_path, 'carts.db')))
+
+    backend = app.config['CART_STORE']
+    if backend == 'sqlite':
+        os.makedirs(os.path.dirname(app.config['CART_STORE_PATH']), exist_ok=True)
+        store = SQLiteCartStore(app.config['CART_TTL'], app.config['CART_STORE_PATH'])
+    elif backend == 'memory':
+        store = MemoryCartStore(app.config['CART_TTL'])
+    else:
+        raise ValueError(f'Unknown CART_STORE backend: {backend}')
+    app.extensions['cart_store'] = store
+
+    user_logged_in.connect(_merge_anonymous_cart, app)
+
+    @app.cli.command('evict-carts')
+    def evict_carts_command():
+        """Remove expired carts from the cart store"""
+        click.echo(f'Evicted {store.evict_expired()} expired carts.')
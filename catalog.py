@@ -0,0 +1,94 @@
+"""
+Catalog Queries for Online Bookstore
+Search, filter and sort rules for the book catalog, shared by the HTML
+listings and the JSON API
+"""
+
+from models import Book
+import facets
+import search
+
+
+class CatalogFilter:
+    """The /books search, category, facet, rating and sort arguments applied to a Book query"""
+
+    def __init__(self, args):
+        self.search_query = args.get('search', '')
+        self.category_id = args.get('category', type=int)
+        self.min_rating = args.get('min_rating', type=float)
+        self.price_band = args.get('price', '')
+        self.author = args.get('author', '')
+        self.publisher = args.get('publisher', '')
+        self.sort_by = args.get('sort', 'relevance' if self.search_query else 'title')
+        self.ranked = False
+
+    def apply(self, query):
+        """Restrict a Book query to in-stock books matching the filters"""
+        query = query.filter(Book.stock_quantity > 0)
+
+        # Search filter
+        if self.search_query:
+            query, self.ranked = search.filter_books(query, self.search_query)
+
+        # Category filter
+        if self.category_id:
+            query = query.filter(Book.category_id == self.category_id)
+
+        # Facet filters
+        price_range = facets.price_range(self.price_band)
+        if price_range:
+            low, high = price_range
+            query = query.filter(Book.price >= low)
+            if high is not None:
+                query = query.filter(Book.price < high)
+        if self.author:
+            query = query.filter(Book.author == self.author)
+        if self.publisher:
+            query = query.filter(Book.publisher == self.publisher)
+
+        # Rating filter
+        if self.min_rating:
+            query = query.filter(Book.rating_average >= self.min_rating)
+
+        return query
+
+    def facet_selection(self):
+        """The active filters keyed by facet name, for the facet index"""
+        # Rating bands are whole stars; a fractional minimum has no band to select
+        rating = int(self.min_rating) if self.min_rating and self.min_rating.is_integer() else None
+        return {
+            'category': self.category_id or None,
+            'price': self.price_band if facets.price_range(self.price_band) else None,
+            'author': self.author or None,
+            'publisher': self.publisher or None,
+            'rating': rating,
+        }
+
+    @property
+    def sort_keys(self):
+        return book_sort_keys(self.sort_by, self.ranked)
+
+    @property
+    def uses_ratings(self):
+        """Check if results depend on rating aggregates"""
+        return bool(self.min_rating) or self.sort_by == 'rating'
+
+
+def book_sort_keys(sort_by, ranked=False):
+    """Keyset ordering for a catalog sort mode, ending with the primary key as tie-breaker"""
+    if sort_by == 'price_low':
+        return [(Book.price, False), (Book.id, False)]
+    elif sort_by == 'price_high':
+        return [(Book.price, True), (Book.id, True)]
+    elif sort_by == 'newest':
+        return [(Book.created_at, True), (Book.id, True)]
+    elif sort_by == 'rating':
+        return [(Book.rating_average, True), (Book.id, True)]
+    elif sort_by == 'relevance' and ranked:
+        return [(search.rank(), False), (Book.id, False)]
+    return [(Book.title, False), (Book.id, False)]
+
+
+def order_by_keys(keys):
+    """ORDER BY clauses for a list of (expression, descending) sort keys"""
+    return [expr.desc() if descending else expr.asc() for expr, descending in keys]
@@ -0,0 +1,271 @@
+"""
+Catalog Import / Export for Online Bookstore
+Streams supplier feeds (CSV or JSON Lines) into the books table with
+batched upserts keyed on ISBN, and streams the catalog back out
+"""
+
+import contextlib
+import csv
+import json
+import time
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, Book, Category
+
+catalog_cli = AppGroup('catalog', help='Bulk catalog import and export.')
+
+# Columns a feed row may set; anything else is ignored
+TEXT_FIELDS = ('title', 'author', 'isbn', 'description', 'publisher', 'cover_image')
+REQUIRED_FIELDS = ('title', 'author', 'isbn', 'price')
+
+# Columns an upsert may overwrite on an existing ISBN; aggregates and created_at are kept.
+# Optional ones are only written when the feed row has that column at all
+UPSERT_FIELDS = (
+    'title', 'author', 'price', 'stock_quantity', 'description', 'publisher',
+    'published_date', 'pages', 'cover_image', 'category_id', 'updated_at',
+)
+OPTIONAL_FIELDS = ('stock_quantity', 'description', 'publisher', 'published_date', 'pages', 'cover_image')
+
+# What export writes: every column import reads, so an export re-imports unchanged
+EXPORT_FIELDS = (
+    'id', 'isbn', 'title', 'author', 'price', 'stock_quantity', 'description', 'publisher',
+    'published_date', 'pages', 'cover_image', 'category_id',
+)
+
+
+class RowError(ValueError):
+    """A feed row that can't be imported"""
+
+
+def read_rows(stream, fmt):
+    """Yield (line_number, dict) pairs from a CSV or JSON Lines stream"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_number, line in enumerate(stream, start=1):
+            if line.strip():
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError as exc:
+                    yield line_number, RowError(f'invalid JSON: {exc.msg}')
+                    continue
+                if not isinstance(row, dict):
+                    row = RowError('row must be a JSON object')
+                yield line_number, row
+
+
+class RowConverter:
+    """Validates feed rows and resolves category names through an in-memory map"""
+
+    def __init__(self, create_categories):
+        self.create_categories = create_categories
+        self.categories = {name.lower(): cat_id for cat_id, name in db.session.query(Category.id, Category.name)}
+        self.category_ids = set(self.categories.values())
+
+    def category_id(self, row):
+        name = (row.get('category') or '').strip()
+        if name:
+            cat_id = self.categories.get(name.lower())
+            if cat_id is None:
+                if not self.create_categories:
+                    raise RowError(f'unknown category "{name}"')
+                category = Category(name=name)
+                db.session.add(category)
+                db.session.commit()
+                cat_id = self.categories[name.lower()] = category.id
+                self.category_ids.add(cat_id)
+            return cat_id
+        raw = row.get('category_id')
+        if raw in (None, ''):
+            return None
+        cat_id = int(raw)
+        if cat_id not in self.category_ids:
+            raise RowError(f'unknown category_id {cat_id}')
+        return cat_id
+
+    def convert(self, row, now):
+        """
+        Turn a raw feed row into a books-table parameter dict
+        Optional columns the row doesn't carry are left out, not set to NULL
+        """
+        if isinstance(row, RowError):
+            raise row
+        missing = [field for field in REQUIRED_FIELDS if row.get(field) in (None, '')]
+        if missing:
+            raise RowError(f'missing {", ".join(missing)}')
+
+        values = {field: (str(row[field]).strip() if row.get(field) not in (None, '') else None)
+                  for field in TEXT_FIELDS}
+        try:
+            price = Decimal(str(row['price']))
+            # Decimal reads "NaN" and "Infinity", which no price can be
+            if not price.is_finite():
+                raise RowError(f'invalid price {row["price"]!r}')
+            stock = int(row.get('stock_quantity') or 0)
+            if price < 0 or stock < 0:
+                raise RowError('price and stock_quantity must not be negative')
+            pages = int(row['pages']) if row.get('pages') not in (None, '') else None
+            published = row.get('published_date')
+            published = date.fromisoformat(published) if published else None
+            category_id = self.category_id(row)
+        except (InvalidOperation, ValueError) as exc:
+            raise RowError(str(exc)) from None
+        if len(values['isbn']) > 20 or len(values['title']) > 200:
+            raise RowError('isbn or title too long')
+
+        values.update(
+            price=price, stock_quantity=stock, pages=pages, published_date=published,
+            category_id=category_id, updated_at=now,
+        )
+        for field in OPTIONAL_FIELDS:
+            if field not in row:
+                del values[field]
+        if 'category' not in row and 'category_id' not in row:
+            del values['category_id']
+        return values
+
+
+def upsert_statement(fields=UPSERT_FIELDS):
+    """INSERT ... ON CONFLICT (isbn) DO UPDATE of `fields` for the current database"""
+    dialects = {'sqlite': sqlite, 'postgresql': postgresql}
+    dialect = dialects.get(db.engine.dialect.name)
+    if dialect is None:
+        raise click.ClickException(f'Upserts are not supported on {db.engine.dialect.name}')
+    statement = dialect.insert(Book.__table__)
+    return statement.on_conflict_do_update(
+        index_elements=[Book.__table__.c.isbn],
+        set_={field: statement.excluded[field] for field in UPSERT_FIELDS if field in fields},
+    )
+
+
+def import_rows(rows, batch_size, create_categories, max_errors=20, report=None):
+    """Upsert validated rows in batches, one transaction each; returns a stats dict"""
+    converter = RowConverter(create_categories)
+    # One statement per set of columns present; a feed normally has just one
+    statements = {}
+    stats = {'imported': 0, 'rejected': 0, 'errors': []}
+    started = time.perf_counter()
+    batch = []
+
+    def flush():
+        groups = {}
+        for values in batch:
+            groups.setdefault(frozenset(values), []).append(values)
+        # executemany inside one short transaction per batch
+        with db.engine.begin() as conn:
+            for fields, rows in groups.items():
+                if fields not in statements:
+                    statements[fields] = upsert_statement(fields)
+                conn.execute(statements[fields], rows)
+        stats['imported'] += len(batch)
+        batch.clear()
+        if report:
+            report(stats['imported'], time.perf_counter() - started)
+
+    now = datetime.utcnow()
+    for line_number, row in rows:
+        try:
+            batch.append(converter.convert(row, now))
+        except RowError as exc:
+            stats['rejected'] += 1
+            if len(stats['errors']) < max_errors:
+                stats['errors'].append(f'line {line_number}: {exc}')
+            continue
+        if len(batch) >= batch_size:
+            flush()
+            now = datetime.utcnow()
+    if batch:
+        flush()
+
+    stats['seconds'] = time.perf_counter() - started
+    return stats
+
+
+def export_record(book):
+    """A book as a feed row, in the form import reads back"""
+    record = {field: getattr(book, field) for field in EXPORT_FIELDS}
+    record['price'] = str(book.price)
+    if book.published_date is not None:
+        record['published_date'] = book.published_date.isoformat()
+    return record
+
+
+def export_rows(stream, fmt, batch_size):
+    """Write every book as a feed row to the stream; returns the row count"""
+    writer = None
+    count = 0
+    for book in Book.query.order_by(Book.id).yield_per(batch_size):
+        record = export_record(book)
+        if fmt == 'csv':
+            if writer is None:
+                writer = csv.DictWriter(stream, fieldnames=EXPORT_FIELDS)
+                writer.writeheader()
+            writer.writerow(record)
+        else:
+            stream.write(json.dumps(record, separators=(',', ':')) + '\n')
+        count += 1
+    return count
+
+
+def _open(path, mode):
+    """Open a feed file, or stdin/stdout for '-'; CSV needs newline translation off"""
+    if path == '-':
+        return contextlib.nullcontext(click.get_text_stream('stdin' if mode == 'r' else 'stdout'))
+    return open(path, mode, encoding='utf-8', newline='')
+
+
+def _format_for(path, fmt):
+    if fmt:
+        return fmt
+    return 'csv' if path.lower().endswith('.csv') else 'jsonl'
+
+
+@catalog_cli.command('import')
+@click.argument('path', type=click.Path(allow_dash=True))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='Defaults from the file extension.')
+@click.option('--batch-size', default=5000, show_default=True, help='Rows per upsert transaction.')
+@click.option('--create-categories/--no-create-categories', default=True, show_default=True,
+              help='Create categories that are named in the feed but missing.')
+def import_command(path, fmt, batch_size, create_categories):
+    """Upsert books from a CSV or JSON Lines feed, keyed on ISBN"""
+    fmt = _format_for(path, fmt)
+
+    def report(done, elapsed):
+        click.echo(f'\r{done} rows ({done / elapsed:,.0f} rows/sec)', nl=False, err=True)
+
+    with _open(path, 'r') as stream:
+        stats = import_rows(read_rows(stream, fmt), batch_size, create_categories, report=report)
+
+    click.echo('', err=True)
+    rate = stats['imported'] / stats['seconds'] if stats['seconds'] else 0
+    click.echo(f"Imported {stats['imported']} rows, rejected {stats['rejected']} "
+               f"in {stats['seconds']:.1f}s ({rate:,.0f} rows/sec).")
+    for error in stats['errors']:
+        click.echo(f'  {error}', err=True)
+
+
+@catalog_cli.command('export')
+@click.argument('path', type=click.Path(allow_dash=True), default='-')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='Defaults from the file extension.')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows fetched per round trip.')
+def export_command(path, fmt, batch_size):
+    """Stream the catalog out as CSV or JSON Lines (default: stdout)"""
+    fmt = _format_for(path, fmt)
+    started = time.perf_counter()
+    with _open(path, 'w') as stream:
+        count = export_rows(stream, fmt, batch_size)
+    elapsed = time.perf_counter() - started
+    rate = count / elapsed if elapsed else 0
+    click.echo(f'Exported {count} rows in {elapsed:.1f}s ({rate:,.0f} rows/sec).', err=True)
+
+
+def init_app(app):
+    """Register the catalog command group"""
+    app.cli.add_command(catalog_cli)
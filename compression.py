@@ -0,0 +1,95 @@
+"""
+Response Compression for Online Bookstore
+Gzips text responses for clients that accept it, above a size threshold.
+Streamed pages are compressed chunk by chunk with a sync flush, so each
+chunk still reaches the browser as soon as it is rendered
+"""
+
+import gzip
+import zlib
+
+from flask import current_app, request
+
+
+def _should_compress(response):
+    config = current_app.config
+    if not config['COMPRESS_ENABLED'] or request.method == 'HEAD':
+        return False
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    # Files sent as-is (send_file, precompressed /assets) and bodies already encoded
+    if response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return False
+    if response.cache_control.no_transform:
+        return False
+    return response.mimetype in config['COMPRESS_MIMETYPES'] and bool(request.accept_encodings['gzip'])
+
+
+def _mark_encoded(response):
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    # The compressed bytes differ from the identity ones, so only a weak match holds
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+
+
+def _gzip_stream(head, rest, level):
+    """Compress a streamed body, flushing after every chunk so none is held back"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 16+15: gzip container
+    for chunk in (head, rest):
+        for part in chunk:
+            if isinstance(part, str):
+                part = part.encode('utf-8')
+            if part:
+                yield compressor.compress(part) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def _compress_streamed(response, min_size, level):
+    """
+    Hold back chunks until min_size bytes are in hand
+    A stream that ends before then is sent uncompressed, as a short body would be
+    """
+    chunks = iter(response.response)
+    head, size = [], 0
+    for chunk in chunks:
+        head.append(chunk)
+        size += len(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+        if size >= min_size:
+            break
+    else:
+        response.response = head
+        return response
+    response.response = _gzip_stream(head, chunks, level)
+    response.headers.pop('Content-Length', None)
+    _mark_encoded(response)
+    return response
+
+
+def compress_response(response):
+    """after_request hook: gzip the body when it is worth it"""
+    if not _should_compress(response):
+        return response
+    config = current_app.config
+    if response.is_streamed:
+        return _compress_streamed(response, config['COMPRESS_MIN_SIZE'], config['COMPRESS_LEVEL'])
+    body = response.get_data()
+    if len(body) < config['COMPRESS_MIN_SIZE']:
+        return response
+    # mtime=0 keeps the output, and so anything derived from it, stable
+    response.set_data(gzip.compress(body, compresslevel=config['COMPRESS_LEVEL'], mtime=0))
+    _mark_encoded(response)
+    return response
+
+
+def init_app(app):
+    """Compression settings; COMPRESS_LEVEL trades CPU per request for bytes on the wire"""
+    app.config.setdefault('COMPRESS_ENABLED', True)
+    app.config.setdefault('COMPRESS_MIN_SIZE', 500)
+    app.config.setdefault('COMPRESS_LEVEL', 6)
+    app.config.setdefault('COMPRESS_MIMETYPES', {
+        'text/html', 'text/css', 'text/plain', 'text/javascript', 'application/javascript',
+        'application/json', 'image/svg+xml',
+    })
+    app.after_request(compress_response)
@@ -0,0 +1,105 @@
+"""
+Conditional GET for Online Bookstore
+Derives ETags for catalog pages from the newest updated_at and the row
+counts of the tables involved, and answers 304 before any rendering.
+No Last-Modified is sent: a deleted row leaves max(updated_at) where it
+was, so If-Modified-Since alone would keep answering 304 for a stale page
+"""
+
+import hashlib
+from functools import wraps
+
+from flask import current_app, make_response, request, session
+from flask_login import current_user
+from sqlalchemy import func, select
+from sqlalchemy.orm import aliased
+from werkzeug.http import is_resource_modified
+
+from models import db, Book, Category
+
+
+def catalog_state():
+    """Validators for pages built from the whole catalog and category list"""
+    row = db.session.execute(select(
+        select(func.max(Book.updated_at)).scalar_subquery(),
+        select(func.count(Book.id)).scalar_subquery(),
+        select(func.max(Category.created_at)).scalar_subquery(),
+        select(func.count(Category.id)).scalar_subquery(),
+    )).one()
+    return tuple(row)
+
+
+def category_state(category_id):
+    """Validators for a single category's listing"""
+    row = db.session.execute(select(
+        select(Category.created_at).where(Category.id == category_id).scalar_subquery(),
+        select(func.max(Book.updated_at)).where(Book.category_id == category_id).scalar_subquery(),
+        select(func.count(Book.id)).where(Book.category_id == category_id).scalar_subquery(),
+    )).one()
+    if row[0] is None:
+        return None
+    return tuple(row)
+
+
+def book_state(book_id):
+    """Validators for a book page: the book itself (reviews bump it) and its related books"""
+    related = aliased(Book)
+    row = db.session.query(
+        Book.updated_at,
+        select(func.max(related.updated_at)).where(related.category_id == Book.category_id).scalar_subquery(),
+        select(func.count(related.id)).where(related.category_id == Book.category_id).scalar_subquery(),
+    ).filter(Book.id == book_id).first()
+    if row is None:
+        return None
+    return tuple(row)
+
+
+def make_etag(parts):
+    """Hash the validator parts with everything else the page depends on"""
+    material = repr((
+        current_app.config['ETAG_VERSION'],
+        request.endpoint,
+        current_user.get_id() if current_user.is_authenticated else None,
+        parts,
+    ))
+    return hashlib.sha1(material.encode('utf-8')).hexdigest()
+
+
+def conditional_view(state):
+    """
+    Answer revalidation requests for a view from cheap validators
+    state(**view_args) returns the validator parts, or None to skip
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Flashed messages make the body differ from what the validators describe
+            if request.method != 'GET' or '_flashes' in session:
+                return view(*args, **kwargs)
+
+            parts = state(**kwargs)
+            if parts is None:
+                return view(*args, **kwargs)
+            etag = make_etag(parts)
+
+            # No last_modified, so If-Modified-Since alone never yields a 304
+            if not is_resource_modified(request.environ, etag=etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            response.cache_control.no_cache = True
+            if current_user.is_authenticated:
+                response.cache_control.private = True
+            response.vary.add('Cookie')
+            return response
+        return wrapper
+    return decorator
+
+
+def init_app(app):
+    """Set the validator version; bump ETAG_VERSION to invalidate all ETags on deploy"""
+    app.config.setdefault('ETAG_VERSION', '1')
@@ -0,0 +1,376 @@
+"""
+Cover Images for Online Bookstore
+Uploaded covers are stored under the SHA-256 of their bytes. Thumbnails in
+each COVER_SIZES width, as WebP and JPEG, are rendered into a size-bounded
+on-disk cache keyed by that hash and served with immutable cache headers.
+`flask covers build` renders every book's thumbnails with a process pool
+"""
+
+import hashlib
+import io
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import click
+from flask import abort, current_app, send_file, url_for
+from flask.cli import AppGroup
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # optional: without Pillow covers are not shown or accepted
+    Image = ImageOps = None
+
+from models import db, Book
+import jobs
+
+covers_cli = AppGroup('covers', help='Manage cover image thumbnails.')
+
+# Pillow format -> extension an accepted upload is stored under
+UPLOAD_FORMATS = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp', 'GIF': '.gif'}
+STORED_NAME = re.compile(r'^([0-9a-f]{64})(\.jpg|\.png|\.webp|\.gif)$')
+DIGEST = re.compile(r'^[0-9a-f]{64}$')
+# URL extension -> (Pillow format, mimetype) of a thumbnail
+THUMBNAIL_FORMATS = {'webp': ('WEBP', 'image/webp'), 'jpg': ('JPEG', 'image/jpeg')}
+# Covers are portrait: a thumbnail fits a box 1.5 times as tall as it is wide
+ASPECT = 1.5
+
+
+def thumbnail_box(width):
+    return width, round(width * ASPECT)
+
+
+def thumbnail_path(cache_dir, digest, width, ext):
+    # Two-character shards keep directories small with many covers
+    return os.path.join(cache_dir, digest[:2], f'{digest}-{width}.{ext}')
+
+
+def _write_atomic(path, write):
+    """Write through a temporary file so readers never see half a file"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with open(temporary, 'wb') as f:
+            write(f)
+        os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+
+def _flatten(image):
+    """JPEG has no alpha channel: composite transparent covers onto white"""
+    background = Image.new('RGB', image.size, 'white')
+    background.paste(image, mask=image.getchannel('A'))
+    return background
+
+
+def render_thumbnails(source, cache_dir, digest, widths, quality, force=False):
+    """
+    Render one original into every width and thumbnail format it is missing
+    Runs in pool workers, so it takes plain arguments and no app; returns the
+    paths written
+    """
+    written = []
+    with Image.open(source) as original:
+        # JPEGs decode straight at a reduced scale when the largest thumbnail allows
+        original.draft('RGB', thumbnail_box(max(widths)))
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'RGBA'):
+            transparent = image.mode in ('LA', 'PA') or 'transparency' in image.info
+            image = image.convert('RGBA' if transparent else 'RGB')
+        for width in sorted(widths, reverse=True):
+            thumbnail = image.copy()
+            thumbnail.thumbnail(thumbnail_box(width), Image.LANCZOS)
+            for ext, (image_format, _) in THUMBNAIL_FORMATS.items():
+                path = thumbnail_path(cache_dir, digest, width, ext)
+                if not force and os.path.exists(path):
+                    continue
+                out = _flatten(thumbnail) if image_format == 'JPEG' and thumbnail.mode == 'RGBA' else thumbnail
+                options = {'quality': quality, 'method': 4} if image_format == 'WEBP' else \
+                    {'quality': quality, 'optimize': True, 'progressive': True}
+                _write_atomic(path, lambda f: out.save(f, image_format, **options))
+                written.append(path)
+            # Each width is scaled from the previous, larger one
+            image = thumbnail
+    return written
+
+
+class ThumbnailCache:
+    """
+    Thumbnail files under one directory, kept under max_bytes
+    File mtimes record last use; trimming removes the least recently used
+    down to LOW_WATER of the budget so it does not run on every write
+    """
+
+    LOW_WATER = 0.9
+    # Refresh a served file's mtime at most this often (seconds)
+    TOUCH_INTERVAL = 3600
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._size = None
+        self._lock = threading.Lock()
+
+    def _files(self):
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield stat.st_mtime, stat.st_size, path
+
+    def usage(self):
+        """(files, bytes) currently on disk"""
+        files = list(self._files())
+        return len(files), sum(size for _, size, _ in files)
+
+    def touch(self, path):
+        try:
+            if time.time() - os.stat(path).st_mtime > self.TOUCH_INTERVAL:
+                os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    def added(self, paths):
+        """Account for newly written files, trimming when over budget"""
+        added = 0
+        for path in paths:
+            try:
+                added += os.stat(path).st_size
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            if self._size is None:
+                # Other processes write here too, so the running total is
+                # an estimate that each trim resets from disk
+                self._size = self.usage()[1]
+            else:
+                self._size += added
+            if self._size > self.max_bytes:
+                self._trim()
+
+    def trim(self):
+        with self._lock:
+            return self._trim()
+
+    def _trim(self):
+        files = sorted(self._files())
+        total = sum(size for _, size, _ in files)
+        target = self.max_bytes * self.LOW_WATER
+        removed = 0
+        for _, size, path in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        self._size = total
+        return removed
+
+
+def get_cache():
+    """The thumbnail cache of the current app"""
+    return current_app.extensions['cover_cache']
+
+
+def original_path(name):
+    return os.path.join(current_app.config['COVER_ORIGINALS_DIR'], name)
+
+
+def _find_original(digest):
+    for ext in UPLOAD_FORMATS.values():
+        path = original_path(digest + ext)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def store_original(data):
+    """
+    Check bytes are a supported image and store them under their hash
+    Returns the stored name; raises ValueError for anything else
+    """
+    if Image is None:
+        raise ValueError('Cover uploads are not available on this server.')
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image_format = image.format
+            image.verify()
+    except Exception:
+        raise ValueError('The cover must be a JPEG, PNG, WebP or GIF image.')
+    if image_format not in UPLOAD_FORMATS:
+        raise ValueError('The cover must be a JPEG, PNG, WebP or GIF image.')
+    name = hashlib.sha256(data).hexdigest() + UPLOAD_FORMATS[image_format]
+    path = original_path(name)
+    # The same bytes always land on the same name, so an existing file is already right
+    if not os.path.exists(path):
+        _write_atomic(path, lambda f: f.write(data))
+    return name
+
+
+def save_upload(upload):
+    """
+    Store an uploaded cover and queue its thumbnails
+    Returns the name for Book.cover_image, or None when no file was sent
+    """
+    if upload is None or not upload.filename:
+        return None
+    limit = current_app.config['COVER_MAX_UPLOAD_BYTES']
+    data = upload.read(limit + 1)
+    if len(data) > limit:
+        raise ValueError(f'Cover images must be smaller than {limit // (1024 * 1024)} MB.')
+    name = store_original(data)
+    jobs.enqueue('cover_thumbnails', {'name': name}, key=f'cover-thumbnails:{name}')
+    return name
+
+
+def cover_url(name, size='md', ext='jpg'):
+    """URL of a stored cover's thumbnail; None for books without one"""
+    match = STORED_NAME.match(name or '')
+    if match is None or Image is None:
+        return None
+    return url_for('cover', digest=match.group(1), size=size, ext=ext)
+
+
+def cover_srcset(name, ext='jpg'):
+    """srcset listing every configured width of a cover"""
+    return ', '.join(f'{cover_url(name, size, ext)} {width}w'
+                     for size, width in current_app.config['COVER_SIZES'].items())
+
+
+def serve_cover(digest, size, ext):
+    """A cover thumbnail, rendered on first request; cacheable forever"""
+    config = current_app.config
+    width = config['COVER_SIZES'].get(size)
+    if width is None or ext not in THUMBNAIL_FORMATS or not DIGEST.match(digest) or Image is None:
+        abort(404)
+    cache = get_cache()
+    path = thumbnail_path(cache.directory, digest, width, ext)
+    # Rendering is cheap next to a second stat-then-render race, so just retry once
+    for _ in range(2):
+        if os.path.exists(path):
+            cache.touch(path)
+        else:
+            source = _find_original(digest)
+            if source is None:
+                abort(404)
+            cache.added(render_thumbnails(source, cache.directory, digest, [width], config['COVER_QUALITY']))
+        try:
+            # send_file hands the open file to the server's file wrapper
+            # (sendfile(2) where supported), or to X-Sendfile with USE_X_SENDFILE
+            response = send_file(path, mimetype=THUMBNAIL_FORMATS[ext][1], max_age=config['COVER_MAX_AGE'])
+            break
+        except FileNotFoundError:  # evicted in between
+            continue
+    else:
+        abort(404)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+@jobs.handler('cover_thumbnails')
+def cover_thumbnails(name):
+    """Render every thumbnail of a freshly uploaded cover"""
+    match = STORED_NAME.match(name)
+    if match is None or Image is None or not os.path.isfile(original_path(name)):
+        return
+    config = current_app.config
+    cache = get_cache()
+    cache.added(render_thumbnails(original_path(name), cache.directory, match.group(1),
+                                  list(config['COVER_SIZES'].values()), config['COVER_QUALITY']))
+
+
+def _import_legacy(book, report):
+    """Move a cover_image path from before content addressing into the store"""
+    for base in (current_app.config['COVER_ORIGINALS_DIR'], current_app.static_folder, current_app.root_path):
+        path = os.path.join(base, book.cover_image.lstrip('/'))
+        if os.path.isfile(path):
+            break
+    else:
+        report(f'Book {book.id}: cover {book.cover_image!r} not found, skipped')
+        return None
+    with open(path, 'rb') as f:
+        data = f.read()
+    try:
+        return store_original(data)
+    except ValueError as exc:
+        report(f'Book {book.id}: {exc}')
+        return None
+
+
+@covers_cli.command('build')
+@click.option('--workers', type=int, default=None, help='Worker processes (default: COVER_BUILD_WORKERS).')
+@click.option('--force', is_flag=True, help='Re-render thumbnails that already exist.')
+def build_command(workers, force):
+    """Render thumbnails for every book cover"""
+    if Image is None:
+        raise click.ClickException('Pillow is not installed.')
+    config = current_app.config
+    cache = get_cache()
+
+    digests = {}
+    for book in Book.query.filter(Book.cover_image.isnot(None), Book.cover_image != ''):
+        if STORED_NAME.match(book.cover_image) is None:
+            name = _import_legacy(book, click.echo)
+            if name is None:
+                continue
+            book.cover_image = name
+        match = STORED_NAME.match(book.cover_image)
+        digests[match.group(1)] = original_path(book.cover_image)
+    db.session.commit()
+
+    widths = list(config['COVER_SIZES'].values())
+    written, failed = [], 0
+    # Decoding and resizing are CPU bound, so they get a process each
+    with ProcessPoolExecutor(max_workers=workers or config['COVER_BUILD_WORKERS']) as pool:
+        futures = {
+            pool.submit(render_thumbnails, source, cache.directory, digest, widths, config['COVER_QUALITY'], force): digest
+            for digest, source in digests.items() if os.path.isfile(source)
+        }
+        for future in as_completed(futures):
+            try:
+                written.extend(future.result())
+            except Exception as exc:
+                failed += 1
+                click.echo(f'{futures[future]}: {exc}')
+    cache.added(written)
+    files, size = cache.usage()
+    click.echo(f'Rendered {len(written)} thumbnails for {len(digests)} covers ({failed} failed); '
+               f'cache holds {files} files, {size // 1024} KiB.')
+
+
+@covers_cli.command('trim')
+def trim_command():
+    """Evict least recently used thumbnails down to the cache budget"""
+    removed = get_cache().trim()
+    click.echo(f'Removed {removed} thumbnails.')
+
+
+def init_app(app):
+    """Cover settings, the thumbnail cache, the /covers route and template helpers"""
+    app.config.setdefault('COVER_SIZES', {'sm': 160, 'md': 320, 'lg': 640})
+    app.config.setdefault('COVER_QUALITY', 80)
+    app.config.setdefault('COVER_MAX_UPLOAD_BYTES', 10 * 1024 * 1024)
+    app.config.setdefault('COVER_ORIGINALS_DIR', os.path.join(app.instance_path, 'covers'))
+    app.config.setdefault('COVER_CACHE_DIR', os.path.join(app.instance_path, 'cover_cache'))
+    app.config.setdefault('COVER_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+    app.config.setdefault('COVER_MAX_AGE', 365 * 24 * 3600)
+    app.config.setdefault('COVER_BUILD_WORKERS', os.cpu_count() or 1)
+    app.extensions['cover_cache'] = ThumbnailCache(app.config['COVER_CACHE_DIR'],
+                                                   app.config['COVER_CACHE_MAX_BYTES'])
+    app.add_url_rule('/covers/<digest>/<size>.<ext>', 'cover', serve_cover)
+    app.jinja_env.globals['cover_url'] = cover_url
+    app.jinja_env.globals['cover_srcset'] = cover_srcset
+    app.cli.add_command(covers_cli)
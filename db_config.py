@@ -0,0 +1,132 @@
+"""
+Database Engine Configuration for Online Bookstore
+Builds engine and pool options from the environment, tunes SQLite connections
+(WAL, synchronous, cache and mmap sizes) and routes read-only views to a
+separate read-only connection pool
+"""
+
+import functools
+import os
+
+import sqlalchemy as sa
+from flask import g, has_request_context
+from flask_sqlalchemy.session import Session
+
+# Bind key of the read-only engine
+READ_BIND = 'read'
+
+
+def _env(name, default, cast=str):
+    value = os.environ.get(name)
+    return default if value in (None, '') else cast(value)
+
+
+def _is_sqlite(url):
+    return url.get_backend_name() == 'sqlite'
+
+
+def _is_sqlite_memory(url):
+    return _is_sqlite(url) and url.database in (None, '', ':memory:')
+
+
+def read_only_url(url):
+    """Read-only URI for a SQLite file; other databases need DATABASE_READ_URL"""
+    url = sa.engine.make_url(url)
+    if not _is_sqlite(url) or _is_sqlite_memory(url):
+        return None
+    database = url.database if url.query.get('uri') else f'file:{url.database}'
+    return url.set(database=database, query={**url.query, 'mode': 'ro', 'uri': 'true'}).render_as_string(False)
+
+
+def pool_options(url, config):
+    """QueuePool sizing; in-memory SQLite keeps Flask-SQLAlchemy's StaticPool"""
+    if _is_sqlite_memory(url):
+        return {}
+    return {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        # SQLite files never drop connections; network databases can
+        'pool_pre_ping': not _is_sqlite(url),
+    }
+
+
+class RoutingSession(Session):
+    """
+    Session that sends reads made inside @read_only views to the read bind
+    Flushes and INSERT/UPDATE/DELETE statements always use the primary
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and not getattr(clause, 'is_dml', False) \
+                and has_request_context() and g.get('db_read_only'):
+            engine = self._db.engines.get(READ_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def read_only(view):
+    """Route a view's queries to the read-only pool"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_read_only = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def _sqlite_pragmas(config, writable):
+    statements = [
+        f"PRAGMA busy_timeout = {int(config['SQLITE_BUSY_TIMEOUT_MS'])}",
+        f"PRAGMA cache_size = {-int(config['SQLITE_CACHE_SIZE_KB'])}",
+        f"PRAGMA mmap_size = {int(config['SQLITE_MMAP_SIZE'])}",
+        "PRAGMA temp_store = MEMORY",
+    ]
+    if writable:
+        # journal_mode is stored in the file, so only the primary sets it
+        statements.insert(0, f"PRAGMA journal_mode = {config['SQLITE_JOURNAL_MODE']}")
+        statements.append(f"PRAGMA synchronous = {config['SQLITE_SYNCHRONOUS']}")
+    else:
+        statements.append('PRAGMA query_only = 1')
+
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.close()
+    return on_connect
+
+
+def configure(app):
+    """Fill in engine options and the read bind; call before db.init_app"""
+    config = app.config
+    config.setdefault('DB_POOL_SIZE', _env('DB_POOL_SIZE', 10, int))
+    config.setdefault('DB_MAX_OVERFLOW', _env('DB_MAX_OVERFLOW', 20, int))
+    config.setdefault('DB_POOL_TIMEOUT', _env('DB_POOL_TIMEOUT', 30, int))
+    config.setdefault('DB_POOL_RECYCLE', _env('DB_POOL_RECYCLE', 1800, int))
+    config.setdefault('DB_READ_ROUTING', _env('DB_READ_ROUTING', '1') not in ('0', 'false', 'no'))
+    config.setdefault('SQLITE_JOURNAL_MODE', _env('SQLITE_JOURNAL_MODE', 'WAL').upper())
+    config.setdefault('SQLITE_SYNCHRONOUS', _env('SQLITE_SYNCHRONOUS', 'NORMAL').upper())
+    config.setdefault('SQLITE_CACHE_SIZE_KB', _env('SQLITE_CACHE_SIZE_KB', 64 * 1024, int))
+    config.setdefault('SQLITE_MMAP_SIZE', _env('SQLITE_MMAP_SIZE', 256 * 1024 * 1024, int))
+    config.setdefault('SQLITE_BUSY_TIMEOUT_MS', _env('SQLITE_BUSY_TIMEOUT_MS', 5000, int))
+
+    url = sa.engine.make_url(config['SQLALCHEMY_DATABASE_URI'])
+    options = config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    for key, value in pool_options(url, config).items():
+        options.setdefault(key, value)
+
+    read_url = _env('DATABASE_READ_URL', None) or read_only_url(url)
+    if config['DB_READ_ROUTING'] and read_url:
+        binds = config.setdefault('SQLALCHEMY_BINDS', {})
+        binds.setdefault(READ_BIND, {'url': read_url, **pool_options(sa.engine.make_url(read_url), config)})
+
+
+def init_app(app):
+    """Attach the SQLite pragmas to the app's engines; call after db.init_app"""
+    with app.app_context():
+        engines = app.extensions['sqlalchemy'].engines
+        for key, engine in engines.items():
+            if _is_sqlite(engine.url):
+                sa.event.listen(engine, 'connect', _sqlite_pragmas(app.config, writable=key != READ_BIND))
@@ -0,0 +1,411 @@
+"""
+Facet Index for Online Bookstore
+Keeps one bitmap of book IDs per category, price band and rating so /books
+can show filter counts for the current search without GROUP BY queries.
+Bitmaps are Python ints where bit n is book n; a count is a bitwise AND plus
+bit_count(). Author and publisher can have a value per book, and a bitmap
+each would cost max(book_id) / 8 bytes, so they keep sorted ID arrays and
+are counted by walking the matching books
+"""
+
+import threading
+from array import array
+from bisect import bisect_left
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from flask import current_app, request, url_for
+from sqlalchemy import func
+
+from models import db, Book
+import search
+
+FACETS = ('category', 'price', 'author', 'publisher', 'rating')
+# Facets with too many values for a bitmap per value
+SPARSE_FACETS = ('author', 'publisher')
+
+# (key, label, low, high): low <= price < high
+PRICE_BANDS = (
+    ('0-10', 'Under $10', 0, 10),
+    ('10-20', '$10 to $20', 10, 20),
+    ('20-35', '$20 to $35', 20, 35),
+    ('35-', '$35 and over', 35, None),
+)
+RATING_LEVELS = (4, 3, 2, 1)
+
+# Updates older than the watermark by up to this much are re-read on sync,
+# for transactions that stamped updated_at before a later one committed
+SYNC_OVERLAP_SECONDS = 5
+
+
+def price_band(price):
+    if price is None:
+        return None
+    for key, _, low, high in PRICE_BANDS:
+        if price >= low and (high is None or price < high):
+            return key
+    return None
+
+
+def price_range(key):
+    """(low, high) for a price band key, or None if the key is unknown"""
+    for band_key, _, low, high in PRICE_BANDS:
+        if band_key == key:
+            return low, high
+    return None
+
+
+def facet_values(row):
+    """Facet values of a book row, in FACETS order"""
+    return (
+        row.category_id,
+        price_band(row.price),
+        row.author or None,
+        row.publisher or None,
+        int(row.rating_average or 0),
+    )
+
+
+def iter_bits(bitmap):
+    """Positions of the set bits, lowest first"""
+    bits = format(bitmap, 'b')[::-1]
+    position = bits.find('1')
+    while position != -1:
+        yield position
+        position = bits.find('1', position + 1)
+
+
+def bitmap_from_ids(ids):
+    ids = list(ids)
+    if not ids:
+        return 0
+    buffer = bytearray(max(ids) // 8 + 1)
+    for book_id in ids:
+        buffer[book_id >> 3] |= 1 << (book_id & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def _insert_id(ids, book_id):
+    position = bisect_left(ids, book_id)
+    if position == len(ids) or ids[position] != book_id:
+        ids.insert(position, book_id)
+
+
+def _remove_id(ids, book_id):
+    position = bisect_left(ids, book_id)
+    if position < len(ids) and ids[position] == book_id:
+        del ids[position]
+
+
+def _book_rows(query):
+    return query.with_entities(
+        Book.id, Book.category_id, Book.price, Book.author, Book.publisher,
+        Book.rating_average, Book.stock_quantity, Book.updated_at,
+    )
+
+
+class FacetIndex:
+    """
+    Bitmaps per dense facet value, sorted ID arrays per sparse facet value
+    and an in-stock bitmap, kept in process memory
+    Routes call refresh() for the books they change; sync() picks up writes
+    made elsewhere (other workers, imports) from Book.updated_at
+    """
+
+    def __init__(self, sync_interval=5, value_limit=10, tally_limit=20000, memo_size=256):
+        self.sync_interval = sync_interval
+        self.value_limit = value_limit
+        self.tally_limit = tally_limit
+        self.memo_size = memo_size
+        self.version = 0
+        self._rows = {}
+        self._bitmaps = {facet: {} for facet in FACETS if facet not in SPARSE_FACETS}
+        self._members = {facet: {} for facet in SPARSE_FACETS}
+        self._in_stock = 0
+        self._watermark = None
+        self._last_sync = None
+        self._memo = OrderedDict()
+        self._search_memo = OrderedDict()
+        self._lock = threading.RLock()
+        # Serializes loads from the database so concurrent requests don't each run one
+        self._sync_lock = threading.Lock()
+
+    # ---- maintenance ----
+
+    def rebuild(self):
+        """Load every book with one streamed query and swap in a fresh index"""
+        ids_by_value = {facet: {} for facet in FACETS}
+        in_stock, rows, watermark = [], {}, None
+        for row in _book_rows(Book.query).yield_per(10000):
+            values = facet_values(row)
+            rows[row.id] = values
+            for facet, value in zip(FACETS, values):
+                if value is not None:
+                    ids_by_value[facet].setdefault(value, []).append(row.id)
+            if row.stock_quantity > 0:
+                in_stock.append(row.id)
+            if row.updated_at is not None and (watermark is None or row.updated_at > watermark):
+                watermark = row.updated_at
+        bitmaps = {facet: {value: bitmap_from_ids(ids) for value, ids in values.items()}
+                   for facet, values in ids_by_value.items() if facet not in SPARSE_FACETS}
+        members = {facet: {value: array('L', sorted(ids)) for value, ids in ids_by_value[facet].items()}
+                   for facet in SPARSE_FACETS}
+        with self._lock:
+            self._rows, self._bitmaps, self._members = rows, bitmaps, members
+            self._in_stock = bitmap_from_ids(in_stock)
+            self._watermark = watermark
+            self._last_sync = time.monotonic()
+            self._changed()
+
+    def _changed(self):
+        self.version += 1
+        self._memo.clear()
+        self._search_memo.clear()
+
+    def _apply(self, book_id, values, in_stock):
+        """Move one book to new facet values; values=None removes it"""
+        bit = 1 << book_id
+        old = self._rows.pop(book_id, None)
+        if old is not None:
+            for facet, value in zip(FACETS, old):
+                if value is None:
+                    continue
+                if facet in SPARSE_FACETS:
+                    ids = self._members[facet].get(value)
+                    if ids is not None:
+                        _remove_id(ids, book_id)
+                        if not ids:
+                            del self._members[facet][value]
+                    continue
+                remaining = self._bitmaps[facet].get(value, 0) & ~bit
+                if remaining:
+                    self._bitmaps[facet][value] = remaining
+                else:
+                    self._bitmaps[facet].pop(value, None)
+        self._in_stock &= ~bit
+        if values is None:
+            return
+        self._rows[book_id] = values
+        for facet, value in zip(FACETS, values):
+            if value is None:
+                continue
+            if facet in SPARSE_FACETS:
+                _insert_id(self._members[facet].setdefault(value, array('L')), book_id)
+            else:
+                self._bitmaps[facet][value] = self._bitmaps[facet].get(value, 0) | bit
+        if in_stock:
+            self._in_stock |= bit
+
+    def refresh(self, book_ids):
+        """Re-read the given books after a write; missing ones are dropped"""
+        book_ids = set(book_ids)
+        if not book_ids or self._last_sync is None:
+            return
+        rows = _book_rows(Book.query).filter(Book.id.in_(book_ids)).all()
+        with self._lock:
+            for row in rows:
+                self._apply(row.id, facet_values(row), row.stock_quantity > 0)
+            for book_id in book_ids - {row.id for row in rows}:
+                self._apply(book_id, None, False)
+            self._changed()
+
+    def sync(self, force=False):
+        """Catch up with writes made outside this process, at most once per interval"""
+        if self._last_sync is not None and not force and time.monotonic() - self._last_sync < self.sync_interval:
+            return
+        with self._sync_lock:
+            # Whoever held the lock may have just built or synced the index
+            now = time.monotonic()
+            if self._last_sync is None:
+                self.rebuild()
+                return
+            if not force and now - self._last_sync < self.sync_interval:
+                return
+            self._last_sync = now
+            self._sync()
+
+    def _sync(self):
+        newest, count = db.session.query(func.max(Book.updated_at), func.count(Book.id)).one()
+        if newest == self._watermark and count == len(self._rows):
+            return
+        if newest is not None and self._watermark is not None:
+            since = self._watermark - timedelta(seconds=SYNC_OVERLAP_SECONDS)
+            rows = _book_rows(Book.query).filter(Book.updated_at >= since).all()
+            with self._lock:
+                for row in rows:
+                    self._apply(row.id, facet_values(row), row.stock_quantity > 0)
+                self._watermark = newest
+                self._changed()
+        # Deletes leave no updated_at trail; a count mismatch means a rebuild
+        if count != len(self._rows) or self._watermark is None:
+            self.rebuild()
+
+    # ---- queries ----
+
+    def _selected_bitmap(self, facet, selected):
+        if facet == 'rating':
+            bitmap = 0
+            for band, band_bitmap in self._bitmaps['rating'].items():
+                if band >= selected:
+                    bitmap |= band_bitmap
+            return bitmap
+        if facet in SPARSE_FACETS:
+            return bitmap_from_ids(self._members[facet].get(selected, ()))
+        return self._bitmaps[facet].get(selected, 0)
+
+    def _candidates(self, selected, base, exclude=None):
+        bitmap = base
+        for facet, selected_bitmap in selected.items():
+            if facet != exclude:
+                bitmap &= selected_bitmap
+        return bitmap
+
+    def _counts(self, facet, candidates):
+        if facet == 'rating':
+            return {level: (candidates & self._selected_bitmap('rating', level)).bit_count()
+                    for level in RATING_LEVELS}
+        values = self._bitmaps.get(facet)
+        if values is None or (len(values) > 64 and candidates.bit_count() <= self.tally_limit):
+            # Sparse facets, or few matching books and many values: walk the matches
+            position = FACETS.index(facet)
+            counts = {}
+            for book_id in iter_bits(candidates):
+                value = self._rows[book_id][position]
+                if value is not None:
+                    counts[value] = counts.get(value, 0) + 1
+            return counts
+        counts = {}
+        for value, bitmap in values.items():
+            count = (candidates & bitmap).bit_count()
+            if count:
+                counts[value] = count
+        return counts
+
+    def _remembered(self, memo, key):
+        value = memo.get(key)
+        if value is not None:
+            memo.move_to_end(key)
+        return value
+
+    def _remember(self, memo, key, value):
+        memo[key] = value
+        while len(memo) > self.memo_size:
+            memo.popitem(last=False)
+
+    def _search_bitmap(self, search_key, matching):
+        """Bitmap of the books a search matches; matching() only runs on a memo miss"""
+        version = self.version
+        with self._lock:
+            bitmap = self._remembered(self._search_memo, (version, search_key))
+        if bitmap is None:
+            # Outside the lock: a search can take a while on a broad query
+            bitmap = bitmap_from_ids(matching())
+            with self._lock:
+                if self.version == version:
+                    self._remember(self._search_memo, (version, search_key), bitmap)
+        return bitmap
+
+    def summary(self, selection, matching=None, search_key=None):
+        """
+        Counts per facet value for the books matching every selection except
+        the facet's own (so picking an author still lists the other authors)
+        matching, when given, returns the IDs matching search_key; it runs only
+        when no summary for this version, search and selection is memoized
+        Returns {'total': n, facet: {value: count}}
+        """
+        selection_key = tuple(sorted(selection.items(), key=lambda item: item[0]))
+        with self._lock:
+            cached = self._remembered(self._memo, (self.version, search_key, selection_key))
+            if cached is not None:
+                return cached
+        search_bitmap = self._search_bitmap(search_key, matching) if matching is not None else None
+        with self._lock:
+            key = (self.version, search_key, selection_key)
+            cached = self._remembered(self._memo, key)
+            if cached is not None:
+                return cached
+            base = self._in_stock
+            if search_bitmap is not None:
+                base &= search_bitmap
+            selected = {facet: self._selected_bitmap(facet, value)
+                        for facet, value in selection.items() if value is not None}
+            result = {'total': self._candidates(selected, base).bit_count()}
+            for facet in FACETS:
+                counts = self._counts(facet, self._candidates(selected, base, exclude=facet))
+                if facet in ('author', 'publisher'):
+                    top = sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:self.value_limit]
+                    if selection.get(facet) is not None and selection[facet] not in dict(top):
+                        top.append((selection[facet], counts.get(selection[facet], 0)))
+                    counts = dict(top)
+                result[facet] = counts
+            self._remember(self._memo, key, result)
+            return result
+
+
+def get_index():
+    """The facet index of the current app, synced if it's due"""
+    index = current_app.extensions['facet_index']
+    index.sync()
+    return index
+
+
+def refresh(*book_ids):
+    """Update the facet index for books a route just changed"""
+    index = current_app.extensions.get('facet_index')
+    if index is not None and current_app.config['FACETS_ENABLED']:
+        index.refresh(book_ids)
+
+
+def facets_for(catalog_filter, categories):
+    """
+    Facet groups for the /books sidebar: {facet: [(value, label, count), ...]}
+    plus 'total'; None when facets are turned off
+    """
+    if not current_app.config['FACETS_ENABLED']:
+        return None
+    index = get_index()
+
+    def matching():
+        query, _ = search.filter_books(db.session.query(Book.id), catalog_filter.search_query)
+        return [row.id for row in query]
+
+    summary = index.summary(catalog_filter.facet_selection(), matching if catalog_filter.search_query else None,
+                            search_key=catalog_filter.search_query or None)
+
+    price_labels = {key: label for key, label, _, _ in PRICE_BANDS}
+    return {
+        'total': summary['total'],
+        'category': [(category.id, category.name, summary['category'].get(category.id, 0))
+                     for category in categories],
+        'price': [(key, price_labels[key], summary['price'][key]) for key, _, _, _ in PRICE_BANDS
+                  if summary['price'].get(key)],
+        'author': [(value, value, count) for value, count in summary['author'].items()],
+        'publisher': [(value, value, count) for value, count in summary['publisher'].items()],
+        'rating': [(level, f'{level}+ stars', summary['rating'][level]) for level in RATING_LEVELS],
+    }
+
+
+def facet_url(name, value=None):
+    """The current /books URL with one facet argument set (or cleared), back on page one"""
+    args = request.args.to_dict()
+    args.pop('cursor', None)
+    if value is None or args.get(name) == str(value):
+        args.pop(name, None)
+    else:
+        args[name] = value
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
+
+
+def init_app(app):
+    """Create the facet index; it is built on first use"""
+    app.config.setdefault('FACETS_ENABLED', True)
+    app.config.setdefault('FACET_SYNC_SECONDS', 5)
+    app.config.setdefault('FACET_VALUE_LIMIT', 10)
+    app.config.setdefault('FACET_TALLY_LIMIT', 20000)
+    app.extensions['facet_index'] = FacetIndex(
+        sync_interval=app.config['FACET_SYNC_SECONDS'],
+        value_limit=app.config['FACET_VALUE_LIMIT'],
+        tally_limit=app.config['FACET_TALLY_LIMIT'],
+    )
+    app.jinja_env.globals['facet_url'] = facet_url
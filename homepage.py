@@ -0,0 +1,159 @@
+"""
+Homepage Feed for Online Bookstore
+Builds everything the homepage shows (featured and recent books, bestsellers,
+categories with counts) into one immutable snapshot held in memory. Requests
+read the current snapshot without touching the database; catalog writes mark
+it stale and the next request swaps in a rebuilt one
+"""
+
+import hashlib
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from flask import current_app
+from sqlalchemy import func
+
+from models import db, Book, Category, Order, OrderItem
+
+
+@dataclass(frozen=True)
+class BookCard:
+    """The fields a homepage book card shows"""
+    id: int
+    title: str
+    author: str
+    price: Decimal
+    stock_quantity: int
+    category_name: str = None
+    cover_image: str = None
+
+
+@dataclass(frozen=True)
+class CategoryCard:
+    id: int
+    name: str
+    book_count: int
+
+
+@dataclass(frozen=True)
+class HomepageFeed:
+    """One built homepage; replaced whole, never modified"""
+    featured: tuple
+    recent: tuple
+    bestsellers: tuple
+    categories: tuple
+    built_at: datetime
+    digest: str
+
+
+def _card(row):
+    return BookCard(row.id, row.title, row.author, row.price, row.stock_quantity, row.category_name,
+                    row.cover_image)
+
+
+def build_feed(config):
+    """Query the homepage data and freeze it into a HomepageFeed"""
+    book_columns = (Book.id, Book.title, Book.author, Book.price, Book.stock_quantity,
+                    Category.name.label('category_name'), Book.cover_image)
+
+    # Recent books are the head of the featured list, so one query serves both
+    featured = tuple(_card(row) for row in (
+        db.session.query(*book_columns)
+        .outerjoin(Category, Category.id == Book.category_id)
+        .filter(Book.stock_quantity > 0)
+        .order_by(Book.created_at.desc())
+        .limit(config['HOMEPAGE_FEATURED'])
+    ))
+
+    units = func.sum(OrderItem.quantity).label('units')
+    since = datetime.utcnow() - timedelta(days=config['HOMEPAGE_BESTSELLER_DAYS'])
+    bestsellers = tuple(_card(row) for row in (
+        db.session.query(*book_columns, units)
+        .join(OrderItem, OrderItem.book_id == Book.id)
+        .join(Order, Order.id == OrderItem.order_id)
+        .outerjoin(Category, Category.id == Book.category_id)
+        .filter(Order.order_date >= since, Order.status != 'cancelled', Book.stock_quantity > 0)
+        .group_by(Book.id)
+        .order_by(units.desc(), Book.id)
+        .limit(config['HOMEPAGE_BESTSELLERS'])
+    ))
+
+    categories = tuple(CategoryCard(row.id, row.name, row.book_count) for row in (
+        db.session.query(Category.id, Category.name, func.count(Book.id).label('book_count'))
+        .outerjoin(Book, Book.category_id == Category.id)
+        .group_by(Category.id)
+        .order_by(Category.id)
+    ))
+
+    recent = featured[:config['HOMEPAGE_RECENT']]
+    # Content hash, so every worker derives the same ETag for the same feed
+    digest = hashlib.sha1(repr((featured, bestsellers, categories)).encode('utf-8')).hexdigest()
+    return HomepageFeed(featured, recent, bestsellers, categories, datetime.utcnow(), digest)
+
+
+class FeedHolder:
+    """
+    The current HomepageFeed plus staleness tracking
+    While one request rebuilds, others keep serving the previous snapshot
+    """
+
+    def __init__(self, refresh_seconds):
+        self.refresh_seconds = refresh_seconds
+        self.builds = 0
+        self._feed = None
+        self._stale = True
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, config):
+        feed = self._feed
+        if feed is not None and not self._stale and time.monotonic() < self._expires_at:
+            return feed
+        # Only the first build makes callers wait
+        if not self._lock.acquire(blocking=feed is None):
+            return feed
+        try:
+            if self._feed is None or self._stale or time.monotonic() >= self._expires_at:
+                # Cleared before building so a write during the build marks it stale again
+                self._stale = False
+                try:
+                    self._feed = build_feed(config)
+                except Exception:
+                    self._stale = True
+                    raise
+                self._expires_at = time.monotonic() + self.refresh_seconds
+                self.builds += 1
+            return self._feed
+        finally:
+            self._lock.release()
+
+    def invalidate(self):
+        self._stale = True
+
+
+def get_feed():
+    """The current homepage snapshot, rebuilt first if it is stale"""
+    return current_app.extensions['homepage_feed'].get(current_app.config)
+
+
+def invalidate():
+    """Mark the homepage snapshot stale after a catalog or stock change"""
+    current_app.extensions['homepage_feed'].invalidate()
+
+
+def feed_state():
+    """Conditional GET validators for the homepage, taken from the snapshot"""
+    return (get_feed().digest,)
+
+
+def init_app(app):
+    """Create the homepage snapshot holder; the first request builds it"""
+    app.config.setdefault('HOMEPAGE_REFRESH_SECONDS', 60)
+    app.config.setdefault('HOMEPAGE_FEATURED', 8)
+    app.config.setdefault('HOMEPAGE_RECENT', 4)
+    app.config.setdefault('HOMEPAGE_BESTSELLERS', 4)
+    app.config.setdefault('HOMEPAGE_BESTSELLER_DAYS', 30)
+    app.extensions['homepage_feed'] = FeedHolder(app.config['HOMEPAGE_REFRESH_SECONDS'])
@@ -0,0 +1,155 @@
+"""
+Identity Cache for Online Bookstore
+Rebuilds current_user from a short-lived in-process cache of lightweight
+user snapshots instead of loading the users row on every request
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+from flask_login import UserMixin, user_logged_in, user_logged_out
+
+from models import db, User
+
+
+class UserSnapshot:
+    """
+    Read-only copy of the profile columns a request needs for current_user
+    Routes that change the account load the full User row with full_user().
+    Provides the Flask-Login user interface itself: UserMixin has no
+    __slots__, so subclassing it would give every snapshot a __dict__ again
+    """
+
+    FIELDS = ('id', 'username', 'email', 'first_name', 'last_name', 'address', 'phone', 'created_at')
+    __slots__ = FIELDS
+
+    is_active = True
+    is_authenticated = True
+    is_anonymous = False
+    # Defining __eq__ would otherwise make snapshots unhashable
+    __hash__ = object.__hash__
+
+    def __init__(self, **values):
+        for field in self.FIELDS:
+            setattr(self, field, values.get(field))
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(**{field: getattr(user, field) for field in cls.FIELDS})
+
+    def get_id(self):
+        return str(self.id)
+
+    def __eq__(self, other):
+        # Equal to the User row it was taken from, as UserMixin objects compare
+        if isinstance(other, (UserSnapshot, UserMixin)):
+            return self.get_id() == other.get_id()
+        return NotImplemented
+
+    def __repr__(self):
+        return f'<UserSnapshot {self.username}>'
+
+
+class IdentityCache:
+    """LRU of user_id -> (expires_at, UserSnapshot) with a TTL; ttl=0 disables it"""
+
+    def __init__(self, ttl=60, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] <= time.monotonic():
+                self._entries.pop(user_id, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, snapshot):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[snapshot.id] = (time.monotonic() + self.ttl, snapshot)
+            self._entries.move_to_end(snapshot.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+def get_cache():
+    """The identity cache of the current app"""
+    return current_app.extensions['identity_cache']
+
+
+def load_user(user_id):
+    """
+    Flask-Login user_loader: a cached snapshot, or one narrow column query
+    Returns None for unknown or malformed IDs so Flask-Login treats them as anonymous
+    """
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+    cache = get_cache()
+    snapshot = cache.get(user_id)
+    if snapshot is None:
+        columns = [getattr(User, field) for field in UserSnapshot.FIELDS]
+        row = db.session.query(*columns).filter(User.id == user_id).first()
+        if row is None:
+            return None
+        snapshot = UserSnapshot(**row._asdict())
+        cache.put(snapshot)
+    return snapshot
+
+
+def full_user(user):
+    """The User row behind current_user, for routes that modify the account"""
+    if isinstance(user, User):
+        return user
+    return db.get_or_404(User, user.id)
+
+
+def invalidate(user_id):
+    """Drop a user's snapshot after their profile changes"""
+    get_cache().invalidate(user_id)
+
+
+def _prime_on_login(sender, user, **extra):
+    get_cache().put(UserSnapshot.from_user(user))
+
+
+def _drop_on_logout(sender, user, **extra):
+    if user is not None and user.is_authenticated:
+        invalidate(user.id)
+
+
+def init_app(app):
+    """Create the identity cache and keep it in step with login and logout"""
+    app.config.setdefault('IDENTITY_CACHE_TTL', 60)
+    app.config.setdefault('IDENTITY_CACHE_MAX_ENTRIES', 10000)
+    app.extensions['identity_cache'] = IdentityCache(
+        ttl=app.config['IDENTITY_CACHE_TTL'],
+        max_entries=app.config['IDENTITY_CACHE_MAX_ENTRIES'],
+    )
+    user_logged_in.connect(_prime_on_login, app)
+    user_logged_out.connect(_drop_on_logout, app)
@@ -0,0 +1,348 @@
+"""
+Background Jobs for Online Bookstore
+A durable queue in the jobs table: requests only insert rows (in their own
+transaction, so a job exists exactly when the data it refers to does) and
+worker threads claim, run and retry them with exponential backoff
+
+Delivery is at least once: a worker that dies mid-job leaves it running
+until JOBS_TIMEOUT passes, then it is queued again
+"""
+
+import json
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import func, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, Job
+
+jobs_cli = AppGroup('jobs', help='Run and inspect background jobs.')
+
+# kind -> callable(**payload); filled by the @handler decorator
+HANDLERS = {}
+
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+PENDING_STATUSES = ('queued', 'running', 'failed')
+
+
+def handler(kind):
+    """Register a function as the handler for a job kind"""
+    def decorator(func):
+        HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(kind, payload=None, key=None, delay=0, max_attempts=None):
+    """
+    Add a job to the current transaction; it runs once the caller commits
+    A job whose idempotency key already exists is not added again
+    """
+    config = current_app.config
+    values = {
+        'kind': kind,
+        'payload': json.dumps(payload or {}, separators=(',', ':'), default=str),
+        'status': 'queued',
+        'idempotency_key': key,
+        'attempts': 0,
+        'max_attempts': max_attempts or config['JOBS_MAX_ATTEMPTS'],
+        'run_at': datetime.utcnow() + timedelta(seconds=delay),
+        'created_at': datetime.utcnow(),
+    }
+    dialects = {'sqlite': sqlite, 'postgresql': postgresql}
+    dialect = dialects.get(db.engine.dialect.name)
+    if key is not None and dialect is not None:
+        db.session.execute(dialect.insert(Job.__table__).values(values)
+                           .on_conflict_do_nothing(index_elements=['idempotency_key']))
+    elif key is None or not Job.query.filter_by(idempotency_key=key).first():
+        db.session.execute(Job.__table__.insert().values(values))
+    _ensure_in_process_workers()
+
+
+def backoff_seconds(attempts):
+    """Delay before retry number `attempts`: exponential, capped, with jitter"""
+    config = current_app.config
+    delay = min(config['JOBS_BACKOFF_MAX'], config['JOBS_BACKOFF_BASE'] * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def _metrics():
+    return current_app.extensions.get('metrics')
+
+
+def _claim(worker_id):
+    """Take the next runnable job; returns (job id, run_at), None if idle, or False on a lost race"""
+    now = datetime.utcnow()
+    candidate = (db.session.query(Job.id, Job.run_at)
+                 .filter(Job.status == 'queued', Job.run_at <= now)
+                 .order_by(Job.run_at, Job.id)
+                 .first())
+    if candidate is None:
+        db.session.rollback()
+        return None
+    # Compare-and-set on status, so two workers can't both claim the row
+    claimed = db.session.execute(
+        update(Job)
+        .where(Job.id == candidate.id, Job.status == 'queued')
+        .values(status='running', attempts=Job.attempts + 1, locked_by=worker_id, started_at=now)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    if not claimed:
+        return False
+    return candidate.id, candidate.run_at
+
+
+def run_one(worker_id):
+    """Claim and run one job; returns False when nothing was runnable"""
+    claim = _claim(worker_id)
+    if claim is None:
+        return False
+    if claim is False:
+        return True
+    job_id, run_at = claim
+    job = db.session.get(Job, job_id)
+    registry = _metrics()
+    if registry is not None:
+        registry.histogram('bookstore_job_queue_seconds', 'Time jobs waited after becoming runnable',
+                           LATENCY_BUCKETS, ('kind',)).observe(
+            max(0.0, (job.started_at - run_at).total_seconds()), kind=job.kind)
+
+    started = time.perf_counter()
+    try:
+        func = HANDLERS.get(job.kind)
+        if func is None:
+            raise LookupError(f'No handler for job kind {job.kind!r}')
+        func(**json.loads(job.payload))
+    except Exception:
+        error = traceback.format_exc(limit=5)
+        # The handler's own writes go; the job row is re-read for the bookkeeping
+        db.session.rollback()
+        job = db.session.get(Job, job_id)
+        job.last_error = error[-4000:]
+        job.locked_by = None
+        if job.attempts < job.max_attempts:
+            job.status = 'queued'
+            job.run_at = datetime.utcnow() + timedelta(seconds=backoff_seconds(job.attempts))
+            outcome = 'retried'
+        else:
+            job.status = 'failed'
+            job.finished_at = datetime.utcnow()
+            outcome = 'failed'
+        current_app.logger.warning('Job %s (%s) attempt %s %s:\n%s', job.id, job.kind, job.attempts, outcome, error)
+    else:
+        job.status = 'done'
+        job.locked_by = None
+        job.finished_at = datetime.utcnow()
+        outcome = 'done'
+    kind = job.kind
+    db.session.commit()
+
+    if registry is not None:
+        registry.counter('bookstore_jobs_total', 'Job attempts by outcome',
+                         ('kind', 'outcome')).inc(kind=kind, outcome=outcome)
+        registry.histogram('bookstore_job_duration_seconds', 'Job run time',
+                           LATENCY_BUCKETS, ('kind',)).observe(time.perf_counter() - started, kind=kind)
+    return True
+
+
+def requeue_stale():
+    """Put jobs whose worker stopped reporting back on the queue; returns how many"""
+    cutoff = datetime.utcnow() - timedelta(seconds=current_app.config['JOBS_TIMEOUT'])
+    count = db.session.execute(
+        update(Job)
+        .where(Job.status == 'running', Job.started_at < cutoff)
+        .values(status='queued', locked_by=None, run_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return count
+
+
+class WorkerPool:
+    """Threads that each loop: claim a job, run it, sleep when the queue is empty"""
+
+    def __init__(self, app, threads, poll_interval=1.0, name=None):
+        self.app = app
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}'
+        self._stop = threading.Event()
+        self._workers = []
+        self._last_stale_check = 0.0
+
+    def _loop(self, index):
+        worker_id = f'{self.name}:{index}'
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    ran = run_one(worker_id)
+                    if not ran and index == 0:
+                        self._check_stale()
+            except Exception:
+                # Database unavailable or similar; keep the thread alive
+                self.app.logger.exception('Job worker %s failed', worker_id)
+                ran = False
+            if not ran:
+                self._stop.wait(self.poll_interval)
+
+    def _check_stale(self):
+        now = time.monotonic()
+        if now - self._last_stale_check >= self.app.config['JOBS_TIMEOUT'] / 2:
+            self._last_stale_check = now
+            requeue_stale()
+
+    def start(self):
+        for index in range(self.threads):
+            thread = threading.Thread(target=self._loop, args=(index,), name=f'jobs-{index}', daemon=True)
+            thread.start()
+            self._workers.append(thread)
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        for thread in self._workers:
+            thread.join(timeout)
+
+    def drain(self):
+        """Run jobs on the calling thread until none is runnable; returns how many ran"""
+        ran = 0
+        with self.app.app_context():
+            requeue_stale()
+            while run_one(f'{self.name}:drain'):
+                ran += 1
+        return ran
+
+
+_in_process = {}
+_in_process_lock = threading.Lock()
+
+
+def _ensure_in_process_workers():
+    """Start JOBS_IN_PROCESS_WORKERS threads in this process on first use"""
+    app = current_app._get_current_object()
+    threads = app.config['JOBS_IN_PROCESS_WORKERS']
+    if not threads:
+        return
+    key = (id(app), os.getpid())
+    if key in _in_process:
+        return
+    with _in_process_lock:
+        if key not in _in_process:
+            _in_process[key] = WorkerPool(app, threads, app.config['JOBS_POLL_INTERVAL']).start()
+
+
+def queue_stats():
+    """Job counts by pending status plus the age of the oldest runnable job"""
+    counts = dict(db.session.query(Job.status, func.count(Job.id))
+                  .filter(Job.status.in_(PENDING_STATUSES)).group_by(Job.status).all())
+    oldest = (db.session.query(func.min(Job.run_at))
+              .filter(Job.status == 'queued', Job.run_at <= datetime.utcnow()).scalar())
+    stats = {status: counts.get(status, 0) for status in PENDING_STATUSES}
+    stats['oldest_queued_seconds'] = (datetime.utcnow() - oldest).total_seconds() if oldest else 0.0
+    return stats
+
+
+def _queue_gauges():
+    stats = queue_stats()
+    gauges = {f'bookstore_jobs_{status}': (f'Jobs currently {status}', stats[status])
+              for status in PENDING_STATUSES}
+    gauges['bookstore_jobs_oldest_queued_seconds'] = (
+        'Age of the oldest runnable job', stats['oldest_queued_seconds'])
+    return gauges
+
+
+def _serve_metrics(app, port):
+    from werkzeug.serving import make_server
+    from flask import Response
+
+    def metrics_app(environ, start_response):
+        with app.app_context():
+            response = Response(app.extensions['metrics'].render(), mimetype='text/plain; version=0.0.4')
+        return response(environ, start_response)
+
+    server = make_server('0.0.0.0', port, metrics_app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='jobs-metrics', daemon=True).start()
+
+
+@jobs_cli.command('work')
+@click.option('--threads', type=int, default=None, help='Worker threads (default JOBS_WORKER_THREADS).')
+@click.option('--burst', is_flag=True, help='Run until the queue is empty, then exit.')
+@click.option('--metrics-port', type=int, default=None, help='Serve this process\'s metrics on a port.')
+def work_command(threads, burst, metrics_port):
+    """Run job workers until interrupted"""
+    app = current_app._get_current_object()
+    pool = WorkerPool(app, threads or app.config['JOBS_WORKER_THREADS'], app.config['JOBS_POLL_INTERVAL'])
+    if burst:
+        click.echo(f'Ran {pool.drain()} jobs.')
+        return
+    if metrics_port:
+        _serve_metrics(app, metrics_port)
+    click.echo(f'Started {pool.threads} job workers as {pool.name}; Ctrl+C to stop.')
+    pool.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        click.echo('Stopping workers...')
+        pool.stop(timeout=30)
+
+
+@jobs_cli.command('status')
+def status_command():
+    """Show queue depth and recent failures"""
+    stats = queue_stats()
+    click.echo(', '.join(f'{status}: {stats[status]}' for status in PENDING_STATUSES) +
+               f", oldest runnable: {stats['oldest_queued_seconds']:.1f}s")
+    for job in Job.query.filter_by(status='failed').order_by(Job.finished_at.desc()).limit(10):
+        last_line = (job.last_error or '').strip().splitlines()[-1:] or ['']
+        click.echo(f'  failed #{job.id} {job.kind} after {job.attempts} attempts: {last_line[0]}')
+
+
+@jobs_cli.command('retry-failed')
+def retry_failed_command():
+    """Queue every failed job again"""
+    count = db.session.execute(
+        update(Job).where(Job.status == 'failed')
+        .values(status='queued', attempts=0, run_at=datetime.utcnow(), finished_at=None)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    click.echo(f'Queued {count} jobs again.')
+
+
+@jobs_cli.command('prune')
+@click.option('--days', type=int, default=7, help='Delete finished jobs older than this.')
+def prune_command(days):
+    """Delete old finished jobs"""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    count = Job.query.filter(Job.status == 'done', Job.finished_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    click.echo(f'Deleted {count} finished jobs.')
+
+
+def init_app(app):
+    """Register queue settings, metrics gauges and the jobs CLI group"""
+    app.config.setdefault('JOBS_MAX_ATTEMPTS', 5)
+    app.config.setdefault('JOBS_BACKOFF_BASE', 2.0)
+    app.config.setdefault('JOBS_BACKOFF_MAX', 600.0)
+    app.config.setdefault('JOBS_TIMEOUT', 300)
+    app.config.setdefault('JOBS_POLL_INTERVAL', 1.0)
+    app.config.setdefault('JOBS_WORKER_THREADS', 4)
+    # Worker threads inside the web process, started on the first enqueue; 0 leaves
+    # jobs to `flask jobs work`
+    app.config.setdefault('JOBS_IN_PROCESS_WORKERS', int(os.environ.get('JOBS_IN_PROCESS_WORKERS', 0)))
+
+    registry = app.extensions.get('metrics')
+    if registry is not None:
+        registry.gauges(_queue_gauges)
+    app.cli.add_command(jobs_cli)
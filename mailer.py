@@ -0,0 +1,56 @@
+"""
+Email Delivery for Online Bookstore
+Sends plain-text email over SMTP, or writes each message as an .eml file to
+a local sink directory when MAIL_BACKEND is 'sink' (the default)
+"""
+
+import os
+import smtplib
+import uuid
+from datetime import datetime
+from email.message import EmailMessage
+
+from flask import current_app
+
+
+def build_message(to, subject, body):
+    config = current_app.config
+    message = EmailMessage()
+    message['From'] = config['MAIL_SENDER']
+    message['To'] = to
+    message['Subject'] = subject
+    message['Message-ID'] = f'<{uuid.uuid4().hex}@{config["MAIL_SENDER"].rpartition("@")[2] or "localhost"}>'
+    message.set_content(body)
+    return message
+
+
+def send_email(to, subject, body):
+    """Deliver one message through the configured backend"""
+    config = current_app.config
+    message = build_message(to, subject, body)
+    if config['MAIL_BACKEND'] == 'sink':
+        directory = config['MAIL_SINK_DIR']
+        os.makedirs(directory, exist_ok=True)
+        name = f'{datetime.utcnow():%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:8]}.eml'
+        with open(os.path.join(directory, name), 'wb') as f:
+            f.write(bytes(message))
+        return
+    with smtplib.SMTP(config['MAIL_SERVER'], config['MAIL_PORT'], timeout=30) as smtp:
+        if config['MAIL_USE_TLS']:
+            smtp.starttls()
+        if config['MAIL_USERNAME']:
+            smtp.login(config['MAIL_USERNAME'], config['MAIL_PASSWORD'])
+        smtp.send_message(message)
+
+
+def init_app(app):
+    """Mail settings; everything lands in instance/mail until MAIL_BACKEND is 'smtp'"""
+    app.config.setdefault('MAIL_BACKEND', os.environ.get('MAIL_BACKEND', 'sink'))
+    app.config.setdefault('MAIL_SINK_DIR', os.path.join(app.instance_path, 'mail'))
+    app.config.setdefault('MAIL_SERVER', os.environ.get('MAIL_SERVER', 'localhost'))
+    app.config.setdefault('MAIL_PORT', int(os.environ.get('MAIL_PORT', 25)))
+    app.config.setdefault('MAIL_USE_TLS', os.environ.get('MAIL_USE_TLS', '0') == '1')
+    app.config.setdefault('MAIL_USERNAME', os.environ.get('MAIL_USERNAME'))
+    app.config.setdefault('MAIL_PASSWORD', os.environ.get('MAIL_PASSWORD'))
+    app.config.setdefault('MAIL_SENDER', os.environ.get('MAIL_SENDER', 'orders@bookstore.local'))
+    app.config.setdefault('MAIL_ADMIN', os.environ.get('MAIL_ADMIN', 'admin@bookstore.local'))
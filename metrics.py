@@ -0,0 +1,323 @@
+"""
+Request Metrics for Online Bookstore
+Records per-endpoint wall time, SQL statement count and time, template render
+time and response size into histograms served in Prometheus text format at
+/metrics, with an opt-in slow-request log and sampled cProfile dumps
+
+Metrics live in process memory: each worker process exposes its own
+"""
+
+import cProfile
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime
+
+from flask import Response, current_app, g, has_request_context, request
+from flask.signals import before_render_template, template_rendered
+from sqlalchemy import event
+
+from models import db
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count per label set"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, None, value) for key, value in sorted(self._values.items())]
+
+
+class Histogram:
+    """Cumulative buckets, sum and count per label set"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        rows = []
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                running = 0
+                for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                    running += bucket_count
+                    rows.append((f'{self.name}_bucket', key, ('le', _number(bound)), running))
+                rows.append((f'{self.name}_sum', key, None, total))
+                rows.append((f'{self.name}_count', key, None, count))
+        return rows
+
+
+class Registry:
+    """Named metrics plus gauge callbacks read at scrape time"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._gauges = []
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._get_or_create(Counter, name, help_text, labelnames)
+
+    def histogram(self, name, help_text, buckets, labelnames=()):
+        return self._get_or_create(Histogram, name, help_text, buckets, labelnames)
+
+    def gauges(self, callback):
+        """Register callback() -> {name: (help, value)} for values owned elsewhere"""
+        self._gauges.append(callback)
+
+    def render(self):
+        """Everything in Prometheus text exposition format"""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for sample_name, key, extra, value in metric.samples():
+                lines.append(f'{sample_name}{_labels(metric.labelnames, key, extra)} {_number(value)}')
+        for callback in self._gauges:
+            for name, (help_text, value) in callback().items():
+                if value is None:
+                    continue
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} gauge')
+                lines.append(f'{name} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def get_registry():
+    """The metrics registry of the current app"""
+    return current_app.extensions['metrics']
+
+
+def _endpoint():
+    # Route names, not URLs, keep label cardinality bounded
+    return request.url_rule.endpoint if request.url_rule else 'unmatched'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('metrics_started')
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    if has_request_context() and 'metrics_started' in g:
+        g.metrics_sql_count += 1
+        g.metrics_sql_time += elapsed
+        if g.metrics_sql_log is not None:
+            g.metrics_sql_log.append((elapsed, statement))
+
+
+def _on_sql_error(exception_context):
+    # A failed statement never reaches after_cursor_execute
+    connection = exception_context.connection
+    if connection is not None and connection.info.get('metrics_started'):
+        connection.info['metrics_started'].pop()
+
+
+def _before_render(sender, template, context, **extra):
+    if has_request_context():
+        g.setdefault('metrics_render_started', []).append(time.perf_counter())
+
+
+def _after_render(sender, template, context, **extra):
+    if has_request_context() and g.get('metrics_render_started'):
+        g.metrics_template_time = g.get('metrics_template_time', 0.0) + \
+            time.perf_counter() - g.metrics_render_started.pop()
+
+
+def _start_request():
+    config = current_app.config
+    if not config['METRICS_ENABLED']:
+        return
+    g.metrics_started = time.perf_counter()
+    g.metrics_sql_count = 0
+    g.metrics_sql_time = 0.0
+    g.metrics_sql_log = [] if config['METRICS_SLOW_REQUEST_MS'] else None
+    rate = config['METRICS_PROFILE_SAMPLE_RATE']
+    if rate and random.random() < rate:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is already running on this thread
+            return
+        g.metrics_profiler = profiler
+
+
+def _finish_request(response):
+    if 'metrics_started' not in g:
+        return response
+    # A streamed body renders (and queries) after this hook, once the request
+    # context is gone, so the recording closes over the objects themselves
+    state = g._get_current_object()
+    app = current_app._get_current_object()
+    endpoint = _endpoint()
+    method, path = request.method, request.full_path.rstrip('?')
+    status = response.status_code
+    profiler = g.pop('metrics_profiler', None)
+
+    def record(size):
+        elapsed = time.perf_counter() - state.metrics_started
+        if profiler is not None:
+            profiler.disable()
+            _dump_profile(app, profiler, endpoint)
+
+        registry = app.extensions['metrics']
+        registry.counter('bookstore_requests_total', 'Requests by endpoint and status',
+                         ('endpoint', 'method', 'status')).inc(endpoint=endpoint, method=method, status=status)
+        registry.histogram('bookstore_request_duration_seconds', 'Wall time per request',
+                           LATENCY_BUCKETS, ('endpoint',)).observe(elapsed, endpoint=endpoint)
+        registry.histogram('bookstore_request_sql_statements', 'SQL statements per request',
+                           SQL_COUNT_BUCKETS, ('endpoint',)).observe(state.metrics_sql_count, endpoint=endpoint)
+        registry.histogram('bookstore_request_sql_seconds', 'Time spent executing SQL per request',
+                           LATENCY_BUCKETS, ('endpoint',)).observe(state.metrics_sql_time, endpoint=endpoint)
+        registry.histogram('bookstore_request_template_seconds', 'Jinja render time per request',
+                           LATENCY_BUCKETS, ('endpoint',)).observe(state.get('metrics_template_time', 0.0),
+                                                                   endpoint=endpoint)
+        registry.histogram('bookstore_response_size_bytes', 'Response body size',
+                           SIZE_BUCKETS, ('endpoint',)).observe(size, endpoint=endpoint)
+
+        threshold = app.config['METRICS_SLOW_REQUEST_MS']
+        if threshold and elapsed * 1000 >= threshold:
+            _log_slow_request(app, state, f'{method} {path}', endpoint, elapsed)
+
+    if response.is_streamed:
+        response.response = _measured(response.response, record)
+    else:
+        record(response.calculate_content_length() or 0)
+    return response
+
+
+def _measured(chunks, record):
+    """Pass a streamed body through and record the request once it is sent (or abandoned)"""
+    size = 0
+    try:
+        for chunk in chunks:
+            size += len(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+            yield chunk
+    finally:
+        record(size)
+
+
+def _log_slow_request(app, state, request_line, endpoint, elapsed):
+    slowest = sorted(state.metrics_sql_log, key=lambda item: item[0], reverse=True)
+    lines = [f'Slow request {request_line} ({endpoint}): '
+             f'{elapsed * 1000:.1f} ms, {state.metrics_sql_count} SQL statements in '
+             f'{state.metrics_sql_time * 1000:.1f} ms, templates {state.get("metrics_template_time", 0.0) * 1000:.1f} ms']
+    for duration, statement in slowest[:app.config['METRICS_SLOW_REQUEST_SQL_LIMIT']]:
+        lines.append(f'  {duration * 1000:8.2f} ms  {" ".join(statement.split())}')
+    app.logger.warning('\n'.join(lines))
+
+
+def _dump_profile(app, profiler, endpoint):
+    directory = app.config['METRICS_PROFILE_DIR']
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')
+    profiler.dump_stats(os.path.join(directory, f'{endpoint}-{stamp}-{os.getpid()}.prof'))
+
+
+def _cache_gauges():
+    gauges = {}
+    cache = current_app.extensions.get('response_cache')
+    if cache is not None:
+        for key, value in cache.stats().items():
+            gauges[f'bookstore_response_cache_{key}'] = (f'Response cache {key.replace("_", " ")}', value)
+    identity_cache = current_app.extensions.get('identity_cache')
+    if identity_cache is not None:
+        for key, value in identity_cache.stats().items():
+            gauges[f'bookstore_identity_cache_{key}'] = (f'Identity cache {key}', value)
+    return gauges
+
+
+def init_app(app):
+    """Hook request timing, SQL and template events, and add /metrics"""
+    app.config.setdefault('METRICS_ENABLED', True)
+    app.config.setdefault('METRICS_SLOW_REQUEST_MS', None)
+    app.config.setdefault('METRICS_SLOW_REQUEST_SQL_LIMIT', 10)
+    app.config.setdefault('METRICS_PROFILE_SAMPLE_RATE', 0.0)
+    app.config.setdefault('METRICS_PROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
+
+    registry = Registry()
+    registry.gauges(_cache_gauges)
+    app.extensions['metrics'] = registry
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+            event.listen(engine, 'handle_error', _on_sql_error)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+
+    @app.route('/metrics')
+    def metrics():
+        """Prometheus scrape endpoint"""
+        return Response(get_registry().render(), mimetype='text/plain; version=0.0.4')
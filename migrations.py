@@ -0,0 +1,74 @@
+"""
+Schema Migrations for Online Bookstore
+Brings an existing database up to date with the models without dropping
+data: creates new tables, adds new columns and creates missing indexes
+"""
+
+import click
+from sqlalchemy import inspect
+
+from models import db
+import search
+
+
+def _column_default_sql(column):
+    """Literal DEFAULT clause for a column with a scalar Python default"""
+    default = column.default
+    if default is None or not default.is_scalar:
+        return ''
+    value = default.arg
+    if isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, (int, float)):
+        return f' DEFAULT {value}'
+    return " DEFAULT '{}'".format(str(value).replace("'", "''"))
+
+
+def add_missing_columns(conn):
+    """ALTER existing tables to add columns declared on the models; returns the names added"""
+    inspector = inspect(conn)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        present = {col['name'] for col in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in present:
+                continue
+            column_type = column.type.compile(dialect=conn.dialect)
+            default_sql = _column_default_sql(column)
+            not_null = ' NOT NULL' if not column.nullable and default_sql else ''
+            conn.exec_driver_sql(
+                f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}{not_null}{default_sql}'
+            )
+            added.append(f'{table.name}.{column.name}')
+    return added
+
+
+def create_missing_indexes(conn):
+    """Create indexes declared on the models that don't exist yet"""
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
+def upgrade():
+    """Run every migration step; safe to call on every start-up"""
+    db.create_all()
+    with db.engine.begin() as conn:
+        added = add_missing_columns(conn)
+        create_missing_indexes(conn)
+    search.ensure_index()
+    return added
+
+
+def init_app(app):
+    """Register the schema upgrade command"""
+    @app.cli.command('upgrade-db')
+    def upgrade_db_command():
+        """Create missing tables, columns and indexes"""
+        added = upgrade()
+        for name in added:
+            click.echo(f'Added column {name}')
+        click.echo('Database schema is up to date.')
@@ -7,7 +7,9 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime
 
-db = SQLAlchemy()
+from db_config import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(db.Model, UserMixin):
     """
@@ -69,7 +71,7 @@ class Category(db.Model):
             'id': self.id,
             'name': self.name,
             'description': self.description,
-            'book_count': len(self.books)
+            'book_count': self.book_count
         }
 
 
@@ -80,20 +82,34 @@ class Book(db.Model):
     One-to-many relationship with OrderItems and Reviews
     """
     __tablename__ = 'books'
+    __table_args__ = (
+        # Category pages and counts: one category's in-stock books
+        db.Index('ix_books_category_stock', 'category_id', 'stock_quantity'),
+    )
     
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     title = db.Column(db.String(200), nullable=False, index=True)
     author = db.Column(db.String(100), nullable=False, index=True)
     isbn = db.Column(db.String(20), unique=True, nullable=False, index=True)
-    price = db.Column(db.Numeric(10, 2), nullable=False)
+    price = db.Column(db.Numeric(10, 2), nullable=False, index=True)
     stock_quantity = db.Column(db.Integer, default=0, nullable=False)
     description = db.Column(db.Text, nullable=True)
     publisher = db.Column(db.String(100), nullable=True)
     published_date = db.Column(db.Date, nullable=True)
     pages = db.Column(db.Integer, nullable=True)
     cover_image = db.Column(db.String(255), nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    
+    # Rating aggregates, maintained incrementally as reviews are added
+    rating_count = db.Column(db.Integer, default=0, nullable=False)
+    rating_sum = db.Column(db.Integer, default=0, nullable=False)
+    rating_average = db.Column(db.Float, default=0, nullable=False, index=True)
+    rating_1_count = db.Column(db.Integer, default=0, nullable=False)
+    rating_2_count = db.Column(db.Integer, default=0, nullable=False)
+    rating_3_count = db.Column(db.Integer, default=0, nullable=False)
+    rating_4_count = db.Column(db.Integer, default=0, nullable=False)
+    rating_5_count = db.Column(db.Integer, default=0, nullable=False)
     
     # Foreign Key to Category
     category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=True)
@@ -122,10 +138,14 @@ class Book(db.Model):
         return self.stock_quantity > 0
     
     def get_average_rating(self):
-        """Calculate average rating from reviews"""
-        if not self.reviews:
+        """Average rating from the stored aggregates"""
+        if not self.rating_count:
             return 0
-        return sum(r.rating for r in self.reviews) / len(self.reviews)
+        return self.rating_sum / self.rating_count
+    
+    def get_rating_histogram(self):
+        """Number of reviews per star rating, highest first"""
+        return {stars: getattr(self, f'rating_{stars}_count') for stars in range(5, 0, -1)}
 
 
 class Order(db.Model):
@@ -135,10 +155,14 @@ class Order(db.Model):
     One-to-many relationship with OrderItems
     """
     __tablename__ = 'orders'
+    __table_args__ = (
+        # Order history: one user's orders by date
+        db.Index('ix_orders_user_date', 'user_id', 'order_date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
-    order_date = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    order_date = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
     total_amount = db.Column(db.Numeric(10, 2), nullable=False)
     status = db.Column(db.String(20), default='pending', nullable=False)  # pending, processing, shipped, delivered, cancelled
     shipping_address = db.Column(db.Text, nullable=True)
@@ -160,7 +184,7 @@ class Order(db.Model):
             'order_date': self.order_date.isoformat(),
             'total_amount': float(self.total_amount),
             'status': self.status,
-            'item_count': len(self.items)
+            'item_count': self.item_count
         }
     
     def get_status_display(self):
@@ -183,8 +207,8 @@ class OrderItem(db.Model):
     __tablename__ = 'order_items'
     
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False)
-    book_id = db.Column(db.Integer, db.ForeignKey('books.id'), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False, index=True)
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id'), nullable=False, index=True)
     quantity = db.Column(db.Integer, nullable=False, default=1)
     unit_price = db.Column(db.Numeric(10, 2), nullable=False)
     
@@ -212,6 +236,10 @@ class Review(db.Model):
     Many-to-one relationships with User and Book
     """
     __tablename__ = 'reviews'
+    __table_args__ = (
+        # Review pages: one book's reviews by date
+        db.Index('ix_reviews_book_created', 'book_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
@@ -239,6 +267,84 @@ class Review(db.Model):
         return '★' * self.rating + '☆' * (5 - self.rating)
 
 
+class CoPurchase(db.Model):
+    """
+    CoPurchase model: how many orders contained both books
+    Stored in both directions, maintained by the recommendations module
+    """
+    __tablename__ = 'book_co_purchases'
+    __table_args__ = (
+        # "Customers also bought": one book's partners, most shared orders first
+        db.Index('ix_co_purchases_book_count', 'book_id', 'order_count', 'related_book_id'),
+    )
+
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id'), primary_key=True)
+    related_book_id = db.Column(db.Integer, db.ForeignKey('books.id'), primary_key=True)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<CoPurchase {self.book_id}-{self.related_book_id}>'
+
+
+class Job(db.Model):
+    """
+    Job model for the background queue
+    Requests insert rows; workers claim, run and retry them (see jobs.py)
+    """
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        # Workers: the next runnable job in a status
+        db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')  # JSON keyword arguments
+    status = db.Column(db.String(20), default='queued', nullable=False)  # queued, running, done, failed
+    idempotency_key = db.Column(db.String(200), unique=True, nullable=True)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    max_attempts = db.Column(db.Integer, default=5, nullable=False)
+    run_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    locked_by = db.Column(db.String(100), nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind}>'
+
+    def to_dict(self):
+        """Convert job to dictionary"""
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'attempts': self.attempts,
+            'run_at': self.run_at.isoformat(),
+            'last_error': self.last_error
+        }
+
+
+# Aggregate counts as correlated subqueries, so listings can load them in the
+# same SELECT as the parent rows with undefer() instead of loading collections
+Category.book_count = db.column_property(
+    db.select(db.func.count(Book.id))
+    .where(Book.category_id == Category.id)
+    .correlate_except(Book)
+    .scalar_subquery(),
+    deferred=True
+)
+
+Order.item_count = db.column_property(
+    db.select(db.func.count(OrderItem.id))
+    .where(OrderItem.order_id == Order.id)
+    .correlate_except(OrderItem)
+    .scalar_subquery(),
+    deferred=True
+)
+
+
 class ContactMessage(db.Model):
     """
     ContactMessage model for storing contact form submissions
@@ -0,0 +1,74 @@
+"""
+Order History for Online Bookstore
+Summaries of a customer's orders (line and unit counts next to the order
+columns) from one aggregate query per page, paged by keyset on order date
+"""
+
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
+
+from models import db, Order, OrderItem
+import pagination
+
+# Newest first; the id breaks ties between orders placed in the same instant
+ORDER_KEYS = [(Order.order_date, True), (Order.id, True)]
+
+
+@dataclass(frozen=True)
+class OrderSummary:
+    """One row of a customer's order history"""
+    id: int
+    order_date: datetime
+    status: str
+    total_amount: Decimal
+    shipping_address: str
+    item_count: int
+    unit_count: int
+    items: tuple = ()
+
+    # Only reads self.status, so the model's own method works here unchanged
+    get_status_display = Order.get_status_display
+
+
+def summary_query(user_id):
+    """Order columns plus per-order line and unit counts, grouped in SQL"""
+    return (
+        db.session.query(
+            Order.id, Order.order_date, Order.status, Order.total_amount, Order.shipping_address,
+            func.count(OrderItem.id), func.coalesce(func.sum(OrderItem.quantity), 0),
+        )
+        .outerjoin(OrderItem, OrderItem.order_id == Order.id)
+        .filter(Order.user_id == user_id)
+        .group_by(Order.id)
+    )
+
+
+def _items_by_order(order_ids):
+    """Every line of the given orders with its book, in one query"""
+    grouped = {order_id: [] for order_id in order_ids}
+    if order_ids:
+        items = (OrderItem.query.options(joinedload(OrderItem.book))
+                 .filter(OrderItem.order_id.in_(order_ids)).order_by(OrderItem.id))
+        for item in items:
+            grouped[item.order_id].append(item)
+    return grouped
+
+
+def history_page(user_id, cursor=None, per_page=20, with_items=False):
+    """A KeysetPage of OrderSummary; with_items also attaches each order's lines"""
+    page = pagination.paginate(summary_query(user_id), ORDER_KEYS, cursor, per_page, scope='orders')
+    items = _items_by_order([row[0] for row in page.items]) if with_items else {}
+    page.items = [OrderSummary(*row, items=tuple(items.get(row[0], ()))) for row in page.items]
+    return page
+
+
+def order_with_items(order_id):
+    """An order with its lines and their books loaded in the same SELECT"""
+    return (Order.query
+            .options(joinedload(Order.items).joinedload(OrderItem.book))
+            .filter(Order.id == order_id)
+            .one_or_none())
@@ -0,0 +1,151 @@
+"""
+Keyset Pagination for Online Bookstore
+Pages through ordered queries with opaque cursors instead of OFFSET,
+so every page costs the same no matter how deep it is
+"""
+
+import base64
+import binascii
+import json
+from datetime import datetime, date
+from decimal import Decimal
+
+from flask import request, url_for
+from sqlalchemy import and_, or_
+
+
+class KeysetPage:
+    """One page of results plus the cursors needed to move around it"""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def _encode_value(value):
+    """Tag values that JSON can't round-trip on its own"""
+    if isinstance(value, Decimal):
+        return ['d', str(value)]
+    if isinstance(value, datetime):
+        return ['t', value.isoformat()]
+    if isinstance(value, date):
+        return ['D', value.isoformat()]
+    return ['v', value]
+
+
+def _decode_value(tagged):
+    tag, value = tagged
+    if tag == 'd':
+        return Decimal(value)
+    if tag == 't':
+        return datetime.fromisoformat(value)
+    if tag == 'D':
+        return date.fromisoformat(value)
+    return value
+
+
+def encode_cursor(values, direction, scope=''):
+    """Serialize sort key values into a URL-safe cursor token"""
+    payload = {'s': scope, 'd': direction, 'k': [_encode_value(v) for v in values]}
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, scope=''):
+    """Parse a cursor token; returns (direction, values) or None if invalid or stale"""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        payload = json.loads(raw)
+        if payload['s'] != scope or payload['d'] not in ('next', 'prev'):
+            return None
+        return payload['d'], [_decode_value(v) for v in payload['k']]
+    except (ValueError, KeyError, TypeError, binascii.Error):
+        return None
+
+
+def _after(keys, values, reverse=False):
+    """
+    Build a lexicographic "row comes after values" condition
+    keys is a list of (expression, descending) pairs; mixed directions are allowed
+    """
+    clauses = []
+    for i, (expr, descending) in enumerate(keys):
+        forward = descending == reverse
+        step = expr > values[i] if forward else expr < values[i]
+        equal = [keys[j][0] == values[j] for j in range(i)]
+        clauses.append(and_(*equal, step) if equal else step)
+    return or_(*clauses)
+
+
+def _order_by(keys, reverse=False):
+    return [expr.asc() if descending == reverse else expr.desc() for expr, descending in keys]
+
+
+def paginate(query, keys, cursor=None, per_page=24, scope=''):
+    """
+    Fetch one page of an ORM query ordered by keys
+    keys must end with a unique column (usually the primary key) so the order is total
+    Items are entities for a single-entity query, or row tuples for a projection
+    """
+    decoded = decode_cursor(cursor, scope)
+    direction, values = decoded if decoded else ('next', None)
+    if values is not None and len(values) != len(keys):
+        direction, values = 'next', None
+    backwards = direction == 'prev'
+
+    width = len(query.column_descriptions)
+    query = query.add_columns(*[expr for expr, _ in keys])
+    if values is not None:
+        query = query.filter(_after(keys, values, reverse=backwards))
+    rows = query.order_by(None).order_by(*_order_by(keys, reverse=backwards)).limit(per_page + 1).all()
+
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    items = [row[0] if width == 1 else tuple(row[:width]) for row in rows]
+    if not rows:
+        # Stepping past either end leaves a way back only
+        if values is None:
+            return KeysetPage(items)
+        back = 'next' if backwards else 'prev'
+        return KeysetPage(items, **{f'{back}_cursor': encode_cursor(values, back, scope)})
+
+    first_keys, last_keys = list(rows[0][width:]), list(rows[-1][width:])
+    has_next = more if not backwards else True
+    has_prev = more if backwards else values is not None
+    return KeysetPage(
+        items,
+        next_cursor=encode_cursor(last_keys, 'next', scope) if has_next else None,
+        prev_cursor=encode_cursor(first_keys, 'prev', scope) if has_prev else None,
+    )
+
+
+def page_url(cursor):
+    """URL for the current view with the cursor swapped, keeping other query args"""
+    args = request.args.to_dict()
+    args['cursor'] = cursor
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
+
+
+def init_app(app):
+    """Expose pagination helpers to templates"""
+    app.jinja_env.globals['page_url'] = page_url
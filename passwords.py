@@ -0,0 +1,143 @@
+"""
+Password Hashing for Online Bookstore
+Runs bcrypt hashing and verification on a bounded process pool so login
+bursts don't tie up request workers, and upgrades hashes when the cost changes
+"""
+
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+from flask import current_app
+
+COST_PATTERN = re.compile(r'^\$2[abxy]?\$(\d{2})\$')
+
+
+class HasherBusy(Exception):
+    """Raised when too many hashing jobs are queued, a job times out or the pool keeps failing"""
+
+
+def _hash_password(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check_password(password, password_hash):
+    try:
+        return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+    except ValueError:
+        return False
+
+
+def hash_cost(password_hash):
+    """The bcrypt work factor stored in a hash, or None if it isn't a bcrypt hash"""
+    match = COST_PATTERN.match(password_hash or '')
+    return int(match.group(1)) if match else None
+
+
+class PasswordHasher:
+    """
+    bcrypt on a process pool with a cap on queued jobs
+    With workers=0 the work runs inline on the calling thread
+    """
+
+    def __init__(self, rounds=12, workers=2, max_pending=8, timeout=10):
+        self.rounds = rounds
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        # Created lazily, and again after a fork, so each worker process owns its pool
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _discard(self, executor):
+        """Drop a broken pool so the next job starts a fresh one"""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, func, args):
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy()
+        executor = self._pool()
+        try:
+            future = executor.submit(func, *args)
+        except BrokenProcessPool:
+            self._slots.release()
+            self._discard(executor)
+            raise
+        # The slot is held until the job ends rather than until the caller gives
+        # up waiting, so jobs that outlive their timeout still count against max_pending
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            # Frees the slot right away if the job never started
+            future.cancel()
+            raise HasherBusy() from None
+        except BrokenProcessPool:
+            self._discard(executor)
+            raise
+
+    def _run(self, func, *args):
+        if not self.workers:
+            return func(*args)
+        try:
+            return self._submit(func, args)
+        except BrokenProcessPool:
+            # A pool process died (killed, out of memory); retry once on a new pool
+            try:
+                return self._submit(func, args)
+            except BrokenProcessPool:
+                raise HasherBusy() from None
+
+    def hash(self, password):
+        """Hash a password at the configured cost"""
+        return self._run(_hash_password, password, self.rounds)
+
+    def verify(self, password, password_hash):
+        """Check a password against a stored hash"""
+        return self._run(_check_password, password, password_hash)
+
+    def needs_rehash(self, password_hash):
+        """Check if a hash was made with a different cost than the configured one"""
+        return hash_cost(password_hash) != self.rounds
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+def get_hasher():
+    """The password hasher of the current app"""
+    return current_app.extensions['password_hasher']
+
+
+def init_app(app):
+    """Create the app's password hasher from config"""
+    app.config.setdefault('BCRYPT_LOG_ROUNDS', 12)
+    app.config.setdefault('PASSWORD_HASH_WORKERS', max(1, (os.cpu_count() or 2) // 2))
+    app.config.setdefault('PASSWORD_HASH_MAX_PENDING', app.config['PASSWORD_HASH_WORKERS'] * 4)
+    app.config.setdefault('PASSWORD_HASH_TIMEOUT', 10)
+    app.extensions['password_hasher'] = PasswordHasher(
+        rounds=app.config['BCRYPT_LOG_ROUNDS'],
+        workers=app.config['PASSWORD_HASH_WORKERS'],
+        max_pending=app.config['PASSWORD_HASH_MAX_PENDING'],
+        timeout=app.config['PASSWORD_HASH_TIMEOUT'],
+    )
@@ -0,0 +1,135 @@
+"""
+Query Plan Checks for Online Bookstore
+Replays the read routes against the configured SQLite database, runs
+EXPLAIN QUERY PLAN on every SELECT they issue and reports full-table scans
+"""
+
+import re
+
+import click
+from flask import current_app
+from sqlalchemy import event
+
+from models import db, Book, Category, Order, User
+import facets
+
+# Tables small enough that scanning them whole is the right plan
+SCAN_ALLOWED = {'categories'}
+
+# SQLite prints "SCAN books" (3.36+) or "SCAN TABLE books"; index scans add "USING ..."
+FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+INDEX_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)? USING (?:COVERING )?INDEX')
+TEMP_SORT = re.compile(r'USE TEMP B-TREE FOR (?:RIGHT PART OF )?ORDER BY')
+FULL_SORT = 'USE TEMP B-TREE FOR ORDER BY'
+
+
+def sample_urls():
+    """GET URLs covering each read route, built from rows that exist"""
+    book_id = db.session.query(Book.id).order_by(Book.id).limit(1).scalar()
+    category_id = db.session.query(Category.id).order_by(Category.id).limit(1).scalar()
+    order = db.session.query(Order.id, Order.user_id).order_by(Order.id).limit(1).first()
+    user_id = order.user_id if order else db.session.query(User.id).order_by(User.id).limit(1).scalar()
+
+    urls = ['/', '/categories', '/books', '/books?search=the', '/books?min_rating=3']
+    urls += [f'/books?sort={sort}' for sort in ('price_low', 'price_high', 'newest', 'rating')]
+    urls += ['/api/books', '/api/categories']
+    if book_id:
+        urls.append(f'/book/{book_id}')
+    if category_id:
+        urls += [f'/category/{category_id}', f'/books?category={category_id}',
+                 f'/category/{category_id}?sort=newest']
+    if user_id:
+        urls += ['/profile', '/orders', '/api/orders']
+    if order:
+        urls.append(f'/order/{order.id}')
+    return urls, user_id
+
+
+def capture_statements(app, urls, user_id):
+    """Request each URL and collect (url, sql, params) for the SELECTs it runs"""
+    captured = []
+    current = {}
+
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            captured.append((current['url'], statement, parameters))
+
+    engines = list(db.engines.values())
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', before_execute)
+    try:
+        client = app.test_client()
+        if user_id:
+            with client.session_transaction() as session:
+                session['_user_id'] = str(user_id)
+                session['_fresh'] = True
+        for url in urls:
+            current['url'] = url
+            client.get(url)
+    finally:
+        for engine in engines:
+            event.remove(engine, 'before_cursor_execute', before_execute)
+    return captured
+
+
+def explain(statement, parameters):
+    """EXPLAIN QUERY PLAN rows as detail strings"""
+    with db.engine.connect() as conn:
+        rows = conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).fetchall()
+    return [row[-1] for row in rows]
+
+
+def check_plans(app):
+    """Return (scans, sorts): lists of (url, sql, plan detail) worth a look"""
+    urls, user_id = sample_urls()
+    # The facet index loads every book once per process; that load is not a request plan
+    if app.config['FACETS_ENABLED']:
+        facets.get_index()
+    # Skip the caches so every route reaches the database
+    saved = app.config['RESPONSE_CACHE_ENABLED']
+    app.config['RESPONSE_CACHE_ENABLED'] = False
+    try:
+        captured = capture_statements(app, urls, user_id)
+    finally:
+        app.config['RESPONSE_CACHE_ENABLED'] = saved
+
+    scans, sorts, seen = [], [], set()
+    for url, statement, parameters in captured:
+        if statement in seen:
+            continue
+        seen.add(statement)
+        plan = explain(statement, parameters)
+        # Walking a whole index only to sort the rows afterwards reads the full table too
+        fully_sorted = FULL_SORT in plan
+        for detail in plan:
+            match = FULL_SCAN.match(detail) or (fully_sorted and INDEX_SCAN.match(detail))
+            if match and match.group(1) not in SCAN_ALLOWED:
+                scans.append((url, statement, detail))
+            elif TEMP_SORT.search(detail):
+                sorts.append((url, statement, detail))
+    return scans, sorts
+
+
+def format_sql(statement, width=160):
+    """A statement on one line, cut to width, for reports"""
+    text = ' '.join(statement.split())
+    return text if len(text) <= width else text[:width - 3] + '...'
+
+
+def init_app(app):
+    """Register the query plan check command"""
+    @app.cli.command('check-query-plans')
+    @click.option('--show-sorts', is_flag=True, help='Also list queries that sort in a temp b-tree.')
+    def check_query_plans_command(show_sorts):
+        """Fail if a read route's query does a full-table scan"""
+        if db.engine.dialect.name != 'sqlite':
+            raise click.ClickException('Query plan checks need a SQLite database.')
+        scans, sorts = check_plans(current_app._get_current_object())
+        for url, statement, detail in scans:
+            click.echo(f'FULL SCAN  {url}\n  {detail}\n  {format_sql(statement)}')
+        if show_sorts:
+            for url, statement, detail in sorts:
+                click.echo(f'TEMP SORT  {url}\n  {detail}\n  {format_sql(statement)}')
+        if scans:
+            raise click.ClickException(f'{len(scans)} full-table scans found.')
+        click.echo('No full-table scans in the read routes.')
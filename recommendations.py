@@ -0,0 +1,114 @@
+"""
+Co-Purchase Recommendations for Online Bookstore
+Counts how often two books were bought in the same order. A batch job builds
+the pair table from order_items with one set-based self-join; checkout bumps
+the pairs of each new order, and book pages read the top partners by index
+"""
+
+import time
+
+import click
+from flask import current_app
+from sqlalchemy import and_, delete, func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, Book, CoPurchase, Order, OrderItem
+
+
+def _pairs_query(keep):
+    """SELECT of (book_id, related_book_id, order_count), top `keep` partners per book"""
+    a = OrderItem.__table__.alias('a')
+    b = OrderItem.__table__.alias('b')
+    orders = Order.__table__
+    pairs = (
+        select(
+            a.c.book_id,
+            b.c.book_id.label('related_book_id'),
+            func.count(a.c.order_id.distinct()).label('order_count'),
+        )
+        .select_from(
+            a.join(b, and_(a.c.order_id == b.c.order_id, a.c.book_id != b.c.book_id))
+            .join(orders, orders.c.id == a.c.order_id)
+        )
+        .where(orders.c.status != 'cancelled')
+        .group_by(a.c.book_id, b.c.book_id)
+        .subquery('pairs')
+    )
+    ranked = select(
+        pairs,
+        func.row_number().over(
+            partition_by=pairs.c.book_id,
+            order_by=(pairs.c.order_count.desc(), pairs.c.related_book_id.desc()),
+        ).label('position'),
+    ).subquery('ranked')
+    return select(ranked.c.book_id, ranked.c.related_book_id, ranked.c.order_count).where(
+        ranked.c.position <= keep)
+
+
+def rebuild(keep=None):
+    """Replace the pair table from the order history; returns the number of pairs kept"""
+    keep = keep or current_app.config['RECOMMENDATIONS_KEEP']
+    table = CoPurchase.__table__
+    with db.engine.begin() as conn:
+        conn.execute(delete(table))
+        result = conn.execute(insert(table).from_select(
+            ['book_id', 'related_book_id', 'order_count'], _pairs_query(keep)))
+    return result.rowcount
+
+
+def _increment_statement():
+    dialects = {'sqlite': sqlite, 'postgresql': postgresql}
+    dialect = dialects.get(db.engine.dialect.name)
+    if dialect is None:
+        return None
+    statement = dialect.insert(CoPurchase.__table__)
+    return statement.on_conflict_do_update(
+        index_elements=['book_id', 'related_book_id'],
+        set_={'order_count': CoPurchase.__table__.c.order_count + 1},
+    )
+
+
+def record_order(book_ids):
+    """
+    Count one more shared order for every pair of books in a new order
+    Runs in the caller's transaction, so the counts commit with the order
+    """
+    book_ids = sorted(set(book_ids))
+    if len(book_ids) < 2:
+        return
+    statement = _increment_statement()
+    if statement is None:
+        # No upsert on this database; the next rebuild picks the order up
+        return
+    db.session.execute(statement, [
+        {'book_id': book_id, 'related_book_id': related_id, 'order_count': 1}
+        for book_id in book_ids for related_id in book_ids if book_id != related_id
+    ])
+
+
+def also_bought(book_id, limit=None):
+    """In-stock books most often bought together with a book, best first"""
+    limit = limit or current_app.config['RECOMMENDATIONS_LIMIT']
+    return (
+        Book.query
+        .join(CoPurchase, CoPurchase.related_book_id == Book.id)
+        .filter(CoPurchase.book_id == book_id, Book.stock_quantity > 0)
+        .order_by(CoPurchase.order_count.desc(), CoPurchase.related_book_id.desc())
+        .limit(limit)
+        .all()
+    )
+
+
+def init_app(app):
+    """Register recommendation settings and the rebuild command"""
+    app.config.setdefault('RECOMMENDATIONS_LIMIT', 4)
+    # Partners kept per book by a rebuild; checkout can add more until the next one
+    app.config.setdefault('RECOMMENDATIONS_KEEP', 50)
+
+    @app.cli.command('build-recommendations')
+    @click.option('--keep', type=int, default=None, help='Partners to keep per book.')
+    def build_recommendations_command(keep):
+        """Rebuild the co-purchase table from order history"""
+        started = time.perf_counter()
+        pairs = rebuild(keep)
+        click.echo(f'Stored {pairs} co-purchase pairs in {time.perf_counter() - started:.1f}s.')
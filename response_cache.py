@@ -0,0 +1,218 @@
+"""
+Response Cache for Online Bookstore
+Bounded LRU + TTL cache of rendered pages for anonymous visitors, keyed on
+route and normalized query args and invalidated by tags when data changes
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, g, jsonify, make_response, request, session
+from flask_login import current_user, login_required
+
+
+class CacheEntry:
+    """A stored response body with the tags that invalidate it"""
+
+    __slots__ = ('body', 'status', 'headers', 'tags', 'expires_at')
+
+    def __init__(self, body, status, headers, tags, expires_at):
+        self.body = body
+        self.status = status
+        self.headers = headers
+        self.tags = tags
+        self.expires_at = expires_at
+
+
+class ResponseCache:
+    """Thread-safe LRU cache bounded by total body size, with per-entry TTL"""
+
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._size = 0
+        # Bumped by every invalidation; a render that started before one must not be stored
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at <= time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def generation(self):
+        """Pass to set() for a response rendered from data read after this call"""
+        return self._generation
+
+    def set(self, key, body, status, headers, tags, generation=None):
+        """Store a response, unless the cache was invalidated since `generation`"""
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = CacheEntry(body, status, headers, frozenset(tags), time.monotonic() + self.ttl)
+            self._size += len(body)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while self._size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, *tags):
+        """Drop every entry carrying any of the tags"""
+        with self._lock:
+            self._generation += 1
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._tags.clear()
+            self._size = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._size -= len(entry.body)
+        for tag in entry.tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+def get_cache():
+    """The response cache of the current app"""
+    return current_app.extensions['response_cache']
+
+
+def add_tags(*tags):
+    """Attach extra invalidation tags to the response being rendered"""
+    g.setdefault('cache_tags', set()).update(tags)
+
+
+def invalidate(*tags):
+    """Invalidate cached responses by tag"""
+    get_cache().invalidate(*tags)
+
+
+def cache_key():
+    """Route plus normalized query args; blank and reordered args share an entry"""
+    args = tuple(sorted(
+        (name, value) for name, values in request.args.lists() for value in values if value != ''
+    ))
+    view_args = tuple(sorted((request.view_args or {}).items()))
+    return request.endpoint, view_args, args
+
+
+def _is_cacheable_request():
+    if not current_app.config['RESPONSE_CACHE_ENABLED'] or request.method != 'GET':
+        return False
+    # Pages show the user menu and flashed messages, so only serve them to anonymous
+    # visitors with nothing pending
+    return not current_user.is_authenticated and '_flashes' not in session
+
+
+def _tee(chunks, cache, key, headers, tags, generation):
+    """
+    Pass a streamed body through while keeping a copy
+    The copy is cached only once the last chunk is out, so a client that
+    disconnects mid-page never leaves a truncated entry behind
+    """
+    # The body is sent after the request context is gone, so hold on to the session itself
+    current_session = session._get_current_object()
+
+    def generate():
+        parts = []
+        for chunk in chunks:
+            parts.append(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+            yield chunk
+        if not current_session.modified:
+            cache.set(key, b''.join(parts), 200, headers, tags, generation)
+    return generate()
+
+
+def cached_view(*tags):
+    """Cache a view's rendered response, invalidated by the given tags"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not _is_cacheable_request():
+                return view(*args, **kwargs)
+
+            cache = get_cache()
+            key = cache_key()
+            entry = cache.get(key)
+            if entry is not None:
+                response = current_app.response_class(entry.body, entry.status, entry.headers)
+                response.headers['X-Cache'] = 'HIT'
+                return response
+
+            # Taken before rendering: a write that invalidates mid-render keeps
+            # this (possibly stale) response out of the cache
+            generation = cache.generation()
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                entry_tags = set(tags) | g.pop('cache_tags', set())
+                headers = [('Content-Type', response.headers['Content-Type'])]
+                if response.is_streamed:
+                    response.response = _tee(response.response, cache, key, headers, entry_tags, generation)
+                elif not session.modified:
+                    cache.set(key, response.get_data(), response.status_code, headers, entry_tags, generation)
+            response.headers['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
+
+
+def init_app(app):
+    """Create the app's response cache and its stats endpoint"""
+    app.config.setdefault('RESPONSE_CACHE_ENABLED', True)
+    app.config.setdefault('RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024)
+    app.config.setdefault('RESPONSE_CACHE_TTL', 300)
+    app.extensions['response_cache'] = ResponseCache(
+        app.config['RESPONSE_CACHE_MAX_BYTES'], app.config['RESPONSE_CACHE_TTL']
+    )
+
+    @app.route('/cache/stats')
+    @login_required
+    def response_cache_stats():
+        """Hit/miss counters for sizing the response cache"""
+        return jsonify(get_cache().stats())
@@ -0,0 +1,133 @@
+"""
+Full-Text Search for Online Bookstore
+Keeps an SQLite FTS5 index in sync with the books table and turns
+search box input into ranked, prefix-matching queries
+"""
+
+import re
+
+import click
+from sqlalchemy import DDL, event, func, literal_column, table, column
+
+from models import db, Book
+
+FTS_TABLE = 'books_fts'
+
+# Column weights for bm25 ranking: title, author, isbn
+RANK_WEIGHTS = (10.0, 5.0, 1.0)
+
+ISBN_PATTERN = re.compile(r'^(?:\d{9}[\dX]|97[89]\d{10})$')
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+# External-content FTS5 table: the index stores only tokens, the text lives in books
+CREATE_INDEX_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "title, author, isbn, "
+    "content='books', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+)
+
+# Triggers keep the index in sync with every insert, update and delete,
+# including bulk statements that bypass the ORM
+CREATE_TRIGGER_SQL = [
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON books BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, author, isbn)
+        VALUES (new.id, new.title, new.author, new.isbn);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON books BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author, isbn)
+        VALUES ('delete', old.id, old.title, old.author, old.isbn);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF title, author, isbn ON books BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author, isbn)
+        VALUES ('delete', old.id, old.title, old.author, old.isbn);
+        INSERT INTO {FTS_TABLE}(rowid, title, author, isbn)
+        VALUES (new.id, new.title, new.author, new.isbn);
+    END""",
+]
+
+REBUILD_INDEX_SQL = f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+
+books_fts = table(FTS_TABLE, column('rowid'))
+
+# Create the index alongside the books table on fresh databases
+for _statement in [CREATE_INDEX_SQL] + CREATE_TRIGGER_SQL:
+    event.listen(Book.__table__, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
+
+
+def is_available():
+    """Check if the current database supports the FTS5 index"""
+    return db.engine.dialect.name == 'sqlite'
+
+
+def ensure_index():
+    """Create the index and triggers on an existing database if missing"""
+    if not is_available():
+        return
+    with db.engine.begin() as conn:
+        exists = conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (FTS_TABLE,)
+        ).first()
+        for statement in [CREATE_INDEX_SQL] + CREATE_TRIGGER_SQL:
+            conn.exec_driver_sql(statement)
+        if not exists:
+            conn.exec_driver_sql(REBUILD_INDEX_SQL)
+
+
+def rebuild_index():
+    """Rebuild the whole index from the books table"""
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql(REBUILD_INDEX_SQL)
+
+
+def normalize_isbn(value):
+    """Strip separators from an ISBN-looking string, or return None"""
+    candidate = re.sub(r'[\s-]', '', value).upper()
+    return candidate if ISBN_PATTERN.match(candidate) else None
+
+
+def build_match_expression(search_query):
+    """Convert free text into an FTS5 query: every token must match, as a prefix"""
+    tokens = TOKEN_PATTERN.findall(search_query)
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def filter_books(query, search_query):
+    """
+    Restrict a Book query to rows matching the search text
+    Returns the filtered query and whether relevance ranking is available
+    """
+    isbn = normalize_isbn(search_query)
+    if isbn:
+        # Exact ISBN lookups go straight through the unique isbn index
+        return query.filter(Book.isbn.in_({isbn, search_query.strip()})), False
+
+    if not is_available():
+        return query.filter(
+            (Book.title.ilike(f'%{search_query}%')) |
+            (Book.author.ilike(f'%{search_query}%')) |
+            (Book.isbn.ilike(f'%{search_query}%'))
+        ), False
+
+    match = build_match_expression(search_query)
+    if not match:
+        return query.filter(db.false()), False
+
+    query = query.join(books_fts, books_fts.c.rowid == Book.id)
+    query = query.filter(literal_column(FTS_TABLE).op('MATCH')(match))
+    return query, True
+
+
+def rank():
+    """bm25 relevance expression for a query joined by filter_books (lower is better)"""
+    return func.bm25(literal_column(FTS_TABLE), *RANK_WEIGHTS)
+
+
+def init_app(app):
+    """Register search maintenance commands"""
+    @app.cli.command('rebuild-search-index')
+    def rebuild_search_index_command():
+        """Rebuild the full-text search index from the books table"""
+        ensure_index()
+        rebuild_index()
+        click.echo('Search index rebuilt.')
@@ -0,0 +1,80 @@
+"""
+Streamed Rendering for Online Bookstore
+Listing pages render with stream_template so the header and filter sidebar
+reach the browser while the book grid is still being queried and rendered
+"""
+
+from flask import current_app, g, render_template, stream_template
+from markupsafe import Markup
+
+# Written by stream_flush() and stripped out by the chunker; a harmless
+# HTML comment should it ever reach a page
+FLUSH_MARKER = '<!--stream-flush-->'
+
+
+class DeferredPage:
+    """
+    A page of results fetched on first use
+    Handed to a streamed template, the query runs only when rendering reaches
+    the grid, after everything above it has been sent
+    """
+
+    def __init__(self, fetch):
+        self._fetch = fetch
+        self._page = None
+
+    def _resolve(self):
+        if self._page is None:
+            self._page = self._fetch()
+        return self._page
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __iter__(self):
+        return iter(self._resolve())
+
+    def __len__(self):
+        return len(self._resolve())
+
+    def __bool__(self):
+        return len(self._resolve()) > 0
+
+
+def stream_flush():
+    """Template helper: send everything rendered so far before going on"""
+    return Markup(FLUSH_MARKER) if g.get('streaming_template') else ''
+
+
+def _chunked(fragments, size):
+    """Join Jinja's many small fragments into chunks of about `size` characters"""
+    buffer, buffered = [], 0
+    for fragment in fragments:
+        flush = FLUSH_MARKER in fragment
+        if flush:
+            fragment = fragment.replace(FLUSH_MARKER, '')
+        buffer.append(fragment)
+        buffered += len(fragment)
+        if flush or buffered >= size:
+            yield ''.join(buffer)
+            buffer, buffered = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def render_listing(template_name, **context):
+    """Stream a listing template when STREAM_TEMPLATES is on, else render it whole"""
+    app = current_app
+    if not app.config['STREAM_TEMPLATES']:
+        return render_template(template_name, **context)
+    g.streaming_template = True
+    # stream_template keeps the request context alive until the last chunk is sent
+    fragments = stream_template(template_name, **context)
+    return app.response_class(_chunked(fragments, app.config['STREAM_CHUNK_SIZE']), mimetype='text/html')
+
+
+def init_app(app):
+    """Streaming settings; STREAM_CHUNK_SIZE trades flush frequency for overhead"""
+    app.config.setdefault('STREAM_TEMPLATES', True)
+    app.config.setdefault('STREAM_CHUNK_SIZE', 4096)
+    app.jinja_env.globals['stream_flush'] = stream_flush
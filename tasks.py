@@ -0,0 +1,101 @@
+"""
+Background Tasks for Online Bookstore
+Job handlers for the side effects of registration, checkout and the contact
+form, plus the helpers routes call to enqueue them
+"""
+
+import json
+import os
+from datetime import date, datetime
+
+from flask import current_app
+
+from models import db, Book, ContactMessage, User
+from order_history import order_with_items
+import jobs
+import mailer
+
+
+# ---- enqueue helpers (request path) ----
+
+def track(event, key=None, **properties):
+    """Record an analytics event off the request path"""
+    jobs.enqueue('analytics_event', {'event': event, 'at': datetime.utcnow().isoformat(),
+                                     'properties': properties}, key=key)
+
+
+def after_registration(user_id):
+    jobs.enqueue('welcome_email', {'user_id': user_id}, key=f'welcome:{user_id}')
+    track('user_registered', key=f'analytics:user_registered:{user_id}', user_id=user_id)
+
+
+def after_checkout(order_id, stock_levels):
+    """stock_levels maps each purchased book ID to the copies left after the order"""
+    jobs.enqueue('order_confirmation', {'order_id': order_id}, key=f'order-confirmation:{order_id}')
+    threshold = current_app.config['LOW_STOCK_THRESHOLD']
+    for book_id, remaining in stock_levels.items():
+        if remaining is not None and remaining <= threshold:
+            # One alert per book per day, however many orders cross the threshold
+            jobs.enqueue('low_stock_alert', {'book_id': book_id},
+                         key=f'low-stock:{book_id}:{date.today().isoformat()}')
+    track('order_placed', key=f'analytics:order_placed:{order_id}', order_id=order_id)
+
+
+def after_contact(message_id):
+    jobs.enqueue('contact_acknowledgement', {'message_id': message_id}, key=f'contact-ack:{message_id}')
+
+
+# ---- handlers (worker side) ----
+
+@jobs.handler('welcome_email')
+def welcome_email(user_id):
+    user = db.session.get(User, user_id)
+    if user is None:
+        return
+    mailer.send_email(user.email, 'Welcome to Online Bookstore',
+                      f'Hi {user.first_name or user.username},\n\n'
+                      'Thanks for registering. Happy reading!\n')
+
+
+@jobs.handler('order_confirmation')
+def order_confirmation(order_id):
+    order = order_with_items(order_id)
+    if order is None:
+        return
+    lines = '\n'.join(f'  {item.quantity} x {item.book.title} @ ${item.unit_price}' for item in order.items)
+    mailer.send_email(order.user.email, f'Order #{order.id} confirmed',
+                      f'Thank you for your order.\n\n{lines}\n\nTotal: ${order.total_amount}\n'
+                      f'Shipping to: {order.shipping_address or "-"}\n')
+
+
+@jobs.handler('low_stock_alert')
+def low_stock_alert(book_id):
+    book = db.session.get(Book, book_id)
+    if book is None or book.stock_quantity > current_app.config['LOW_STOCK_THRESHOLD']:
+        return
+    mailer.send_email(current_app.config['MAIL_ADMIN'], f'Low stock: {book.title}',
+                      f'{book.title} (ISBN {book.isbn}) has {book.stock_quantity} copies left.\n')
+
+
+@jobs.handler('contact_acknowledgement')
+def contact_acknowledgement(message_id):
+    message = db.session.get(ContactMessage, message_id)
+    if message is None:
+        return
+    mailer.send_email(message.email, f'Re: {message.subject}',
+                      f'Hi {message.name},\n\nWe received your message and will reply soon.\n')
+
+
+@jobs.handler('analytics_event')
+def analytics_event(event, at, properties):
+    """Append the event to a JSON Lines file for the analytics pipeline to collect"""
+    path = current_app.config['ANALYTICS_SINK_PATH']
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({'event': event, 'at': at, **properties}) + '\n')
+
+
+def init_app(app):
+    """Settings for the task handlers"""
+    app.config.setdefault('LOW_STOCK_THRESHOLD', 5)
+    app.config.setdefault('ANALYTICS_SINK_PATH', os.path.join(app.instance_path, 'analytics', 'events.jsonl'))
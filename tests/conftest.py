@@ -0,0 +1,48 @@
+"""
+Shared test fixtures: one app on a scratch SQLite database, filled by the
+benchmark data generator at a small scale
+"""
+
+import os
+
+import pytest
+
+# Rows generated per table, as a fraction of benchmarks.datagen.FULL_SCALE
+SCALE = 0.002
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    root = tmp_path_factory.mktemp('bookstore')
+    os.environ['DATABASE_URL'] = f'sqlite:///{root / "bookstore.db"}'
+    os.environ['PASSWORD_HASH_WORKERS'] = '0'
+    os.environ['BCRYPT_LOG_ROUNDS'] = '4'
+
+    # Imported late so the app opens the scratch database
+    from app import app as flask_app
+    from benchmarks import datagen
+    import migrations
+
+    flask_app.config.update(
+        TESTING=True,
+        JOBS_IN_PROCESS_WORKERS=0,
+        MAIL_SINK_DIR=str(root / 'mail'),
+        ANALYTICS_SINK_PATH=str(root / 'analytics' / 'events.jsonl'),
+    )
+    with flask_app.app_context():
+        migrations.upgrade()
+        datagen.generate(datagen.scaled_counts(SCALE), seed=1, batch_size=1000, password_rounds=4,
+                         report=lambda line: None)
+    return flask_app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def log_in(client, user_id):
+    """Sign the test client in as a user without going through the login form"""
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
@@ -0,0 +1,87 @@
+"""
+Catalog import / export
+"""
+
+import io
+
+import pytest
+
+import catalog_io
+from models import db, Book
+
+COMPARED = ('isbn', 'title', 'author', 'price', 'stock_quantity', 'description', 'publisher',
+            'published_date', 'pages', 'cover_image', 'category_id')
+
+
+def snapshot():
+    return {book.isbn: tuple(getattr(book, field) for field in COMPARED)
+            for book in Book.query.order_by(Book.id)}
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'jsonl'])
+def test_export_round_trips_through_import(app, fmt):
+    with app.app_context():
+        book = db.session.get(Book, 1)
+        book.description, book.publisher, book.pages = 'A description', 'A publisher', 321
+        db.session.commit()
+        before = snapshot()
+
+        stream = io.StringIO()
+        assert catalog_io.export_rows(stream, fmt, batch_size=100) == len(before)
+        stream.seek(0)
+        stats = catalog_io.import_rows(catalog_io.read_rows(stream, fmt), batch_size=100,
+                                       create_categories=False)
+        db.session.expire_all()
+
+        assert stats['rejected'] == 0
+        assert stats['imported'] == len(before)
+        assert snapshot() == before
+
+
+def test_import_leaves_columns_the_feed_lacks(app):
+    with app.app_context():
+        book = db.session.get(Book, 2)
+        book.description, book.publisher = 'Kept description', 'Kept publisher'
+        db.session.commit()
+        stock = book.stock_quantity
+
+        feed = io.StringIO(f'isbn,title,author,price\n{book.isbn},New title,{book.author},9.99\n')
+        stats = catalog_io.import_rows(catalog_io.read_rows(feed, 'csv'), batch_size=100,
+                                       create_categories=False)
+        db.session.expire_all()
+        book = db.session.get(Book, 2)
+
+        assert stats['imported'] == 1
+        assert book.title == 'New title'
+        assert (book.description, book.publisher, book.stock_quantity) == ('Kept description', 'Kept publisher', stock)
+
+
+def test_non_finite_prices_are_rejected_per_row(app):
+    with app.app_context():
+        feed = io.StringIO(
+            'isbn,title,author,price\n'
+            'NAN-0001,Not a number,Someone,NaN\n'
+            'NAN-0002,Signalling,Someone,sNaN\n'
+            'NAN-0003,Endless,Someone,Infinity\n'
+            'NAN-0004,Priced,Someone,4.50\n'
+        )
+        stats = catalog_io.import_rows(catalog_io.read_rows(feed, 'csv'), batch_size=100,
+                                       create_categories=False)
+
+        assert (stats['imported'], stats['rejected']) == (1, 3)
+        assert Book.query.filter(Book.isbn.like('NAN-%')).count() == 1
+
+
+def test_jsonl_rows_that_are_not_objects_are_rejected(app):
+    with app.app_context():
+        feed = io.StringIO(
+            '[1, 2]\n'
+            '"x"\n'
+            '3\n'
+            '{"isbn": "JSON-0001", "title": "An object", "author": "Someone", "price": "7.25"}\n'
+        )
+        stats = catalog_io.import_rows(catalog_io.read_rows(feed, 'jsonl'), batch_size=100,
+                                       create_categories=False)
+
+        assert (stats['imported'], stats['rejected']) == (1, 3)
+        assert stats['errors'][0] == 'line 1: row must be a JSON object'
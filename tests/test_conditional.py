@@ -0,0 +1,17 @@
+"""
+Conditional GET on catalog pages
+"""
+
+import pytest
+
+
+@pytest.mark.parametrize('url', ['/', '/books', '/category/1', '/book/1'])
+def test_etag_revalidates_and_if_modified_since_does_not(client, url):
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.headers.get('ETag')
+    assert 'Last-Modified' not in response.headers
+
+    assert client.get(url, headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+    # Without Last-Modified a date can't vouch for the page: a deletion doesn't move it
+    assert client.get(url, headers={'If-Modified-Since': 'Fri, 01 Jan 2100 00:00:00 GMT'}).status_code == 200
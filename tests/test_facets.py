@@ -0,0 +1,89 @@
+"""
+Facet index
+"""
+
+import threading
+
+from facets import FacetIndex
+from models import db, Book
+
+SELECTION = {'category': 1, 'price': None, 'author': None, 'publisher': None, 'rating': None}
+
+
+def test_counts_match_the_database(app):
+    with app.app_context():
+        index = FacetIndex()
+        index.sync()
+        summary = index.summary(SELECTION)
+        in_stock = Book.query.filter(Book.stock_quantity > 0)
+        assert summary['total'] == in_stock.filter(Book.category_id == 1).count()
+        # The category facet ignores its own selection
+        assert summary['category'][2] == in_stock.filter(Book.category_id == 2).count()
+
+
+def test_search_runs_only_on_a_memo_miss(app):
+    with app.app_context():
+        index = FacetIndex()
+        index.sync()
+        ids = [row.id for row in db.session.query(Book.id).limit(50)]
+        calls = []
+
+        def search():
+            calls.append(1)
+            return ids
+
+        first = index.summary(SELECTION, search, search_key='river')
+        assert index.summary(SELECTION, search, search_key='river') == first
+        # Another selection on the same search reuses the matched IDs
+        index.summary({**SELECTION, 'category': 2}, search, search_key='river')
+        assert len(calls) == 1
+
+        index.refresh([ids[0]])
+        index.summary(SELECTION, search, search_key='river')
+        assert len(calls) == 2
+
+
+def test_concurrent_cold_start_builds_once(app):
+    index = FacetIndex()
+    builds = []
+    rebuild = index.rebuild
+
+    def counting_rebuild():
+        builds.append(1)
+        rebuild()
+    index.rebuild = counting_rebuild
+
+    def first_request():
+        with app.app_context():
+            index.sync()
+
+    threads = [threading.Thread(target=first_request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(builds) == 1
+
+
+def test_author_counts_follow_selection_and_refresh(app):
+    with app.app_context():
+        index = FacetIndex()
+        index.sync()
+        book = Book.query.filter(Book.stock_quantity > 0, Book.author.isnot(None)).first()
+        in_stock = Book.query.filter(Book.stock_quantity > 0)
+        selection = {**SELECTION, 'category': None, 'author': book.author}
+        summary = index.summary(selection)
+        assert summary['total'] == in_stock.filter(Book.author == book.author).count()
+        assert summary['author'][book.author] == summary['total']
+
+        original = book.author
+        book.author = 'Facet Test Author'
+        db.session.commit()
+        try:
+            index.refresh([book.id])
+            summary = index.summary({**selection, 'author': 'Facet Test Author'})
+            assert summary['total'] == 1
+            assert summary['author']['Facet Test Author'] == 1
+        finally:
+            book.author = original
+            db.session.commit()
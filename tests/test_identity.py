@@ -0,0 +1,19 @@
+"""
+Identity cache
+"""
+
+from identity import UserSnapshot
+from models import db, User
+
+
+def test_snapshots_are_slotted_and_stand_in_for_users(app):
+    with app.app_context():
+        user = db.session.get(User, 1)
+        snapshot = UserSnapshot.from_user(user)
+
+    assert not hasattr(snapshot, '__dict__')
+    assert snapshot.is_authenticated and snapshot.is_active and not snapshot.is_anonymous
+    assert snapshot.get_id() == user.get_id() == '1'
+    assert snapshot == user and user == snapshot
+    assert snapshot != UserSnapshot(id=2)
+    assert len({snapshot, UserSnapshot.from_user(user)}) == 2
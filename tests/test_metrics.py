@@ -0,0 +1,40 @@
+"""
+Request metrics
+"""
+
+HISTOGRAMS = ('bookstore_request_sql_statements', 'bookstore_request_template_seconds',
+              'bookstore_response_size_bytes')
+
+
+def observed(app, endpoint):
+    """{histogram: (sum, count)} for one endpoint"""
+    result = {}
+    for name in HISTOGRAMS:
+        _, total, count = app.extensions['metrics']._metrics[name]._values.get((endpoint,), (None, 0.0, 0))
+        result[name] = (total, count)
+    return result
+
+
+def measure(app, client, url):
+    before = observed(app, 'books')
+    body = client.get(url).get_data()
+    after = observed(app, 'books')
+    return body, {name: (after[name][0] - before[name][0], after[name][1] - before[name][1])
+                  for name in HISTOGRAMS}
+
+
+def test_streamed_pages_are_measured_like_rendered_ones(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, 'RESPONSE_CACHE_ENABLED', False)
+    # Keep the periodic facet sync from adding a query to one of the two requests
+    monkeypatch.setattr(app.extensions['facet_index'], 'sync_interval', 3600)
+    client.get('/books')
+
+    monkeypatch.setitem(app.config, 'STREAM_TEMPLATES', False)
+    _, rendered = measure(app, client, '/books')
+    monkeypatch.setitem(app.config, 'STREAM_TEMPLATES', True)
+    body, streamed = measure(app, client, '/books')
+
+    assert streamed['bookstore_request_sql_statements'] == rendered['bookstore_request_sql_statements']
+    template_seconds, renders = streamed['bookstore_request_template_seconds']
+    assert renders == 1 and template_seconds > 0
+    assert streamed['bookstore_response_size_bytes'] == (len(body), 1)
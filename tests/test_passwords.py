@@ -0,0 +1,47 @@
+"""
+Password hasher process pool
+"""
+
+import time
+
+import pytest
+
+from passwords import HasherBusy, PasswordHasher
+
+
+@pytest.fixture
+def hasher():
+    hasher = PasswordHasher(rounds=4, workers=1, max_pending=1, timeout=10)
+    yield hasher
+    hasher.shutdown()
+
+
+def test_recovers_from_a_dead_pool_process(hasher):
+    password_hash = hasher.hash('secret')
+    for process in list(hasher._executor._processes.values()):
+        process.kill()
+        process.join()
+
+    assert hasher.verify('secret', password_hash)
+    assert hasher.verify('wrong', password_hash) is False
+
+
+def test_timed_out_job_keeps_its_slot_until_it_finishes(hasher):
+    hasher.hash('warm up the pool')
+    hasher.rounds, hasher.timeout = 14, 0.01
+    with pytest.raises(HasherBusy):
+        hasher.hash('slow')
+    # The slow job is still running in the pool, so there is no room for another
+    hasher.rounds, hasher.timeout = 4, 10
+    with pytest.raises(HasherBusy):
+        hasher.hash('next')
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            assert hasher.hash('next')
+            break
+        except HasherBusy:
+            time.sleep(0.05)
+    else:
+        pytest.fail('the slot was never released')
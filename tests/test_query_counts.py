@@ -0,0 +1,80 @@
+"""
+Per-route query counts: listing and detail pages must not grow a query per row
+"""
+
+import pytest
+from sqlalchemy import event
+
+import homepage
+from models import db, Book, Category, Order
+from tests.conftest import log_in
+
+# Upper bounds on SQL statements per request with the response cache off; an
+# N+1 on a page of 24 books or 20 orders blows well past them
+BOUNDS = {
+    'books': 2,
+    'category': 3,
+    'book': 6,
+    'orders': 2,
+    'home': 3,
+    'categories': 2,
+    'profile': 1,
+}
+
+
+@pytest.fixture
+def count_queries(app):
+    """Count the statements every engine runs while the returned callable is used"""
+    statements = []
+
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', before_execute)
+
+    def count(client, url):
+        statements.clear()
+        response = client.get(url)
+        assert response.status_code == 200
+        return len(statements)
+
+    yield count
+    for engine in engines:
+        event.remove(engine, 'before_cursor_execute', before_execute)
+
+
+@pytest.fixture
+def urls(app):
+    with app.app_context():
+        category_id = db.session.query(Category.id).order_by(Category.id).limit(1).scalar()
+        # A well-reviewed, often-bought book exercises the reviews and recommendations too
+        book_id = db.session.query(Book.id).order_by(Book.rating_count.desc(), Book.id).limit(1).scalar()
+        user_id = (db.session.query(Order.user_id).group_by(Order.user_id)
+                   .order_by(db.func.count().desc()).limit(1).scalar())
+    return {
+        'books': '/books',
+        'category': f'/category/{category_id}',
+        'book': f'/book/{book_id}',
+        'orders': '/orders',
+        'home': '/',
+        'categories': '/categories',
+        'profile': '/profile',
+    }, user_id
+
+
+@pytest.mark.parametrize('route', sorted(BOUNDS))
+def test_route_query_count(app, client, count_queries, urls, route, monkeypatch):
+    urls, user_id = urls
+    monkeypatch.setitem(app.config, 'RESPONSE_CACHE_ENABLED', False)
+    log_in(client, user_id)
+    # The first request pays for per-process warm-up (facet index, homepage feed)
+    count_queries(client, urls[route])
+    if route == 'home':
+        # Count the feed build, which is where the homepage would load per row
+        with app.app_context():
+            homepage.invalidate()
+    queries = count_queries(client, urls[route])
+    assert queries <= BOUNDS[route], f'{urls[route]} ran {queries} queries'
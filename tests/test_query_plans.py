@@ -0,0 +1,11 @@
+"""
+Query plans of the read routes (the check behind `flask check-query-plans`)
+"""
+
+import query_plans
+
+
+def test_read_routes_do_not_scan_whole_tables(app):
+    with app.app_context():
+        scans, _ = query_plans.check_plans(app)
+    assert not scans, '\n'.join(f'{url}: {detail}\n  {query_plans.format_sql(sql)}' for url, sql, detail in scans)
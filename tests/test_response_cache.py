@@ -0,0 +1,35 @@
+"""
+Response cache
+"""
+
+from response_cache import ResponseCache, get_cache
+
+
+def test_set_skips_a_render_that_raced_an_invalidation():
+    cache = ResponseCache(max_bytes=1024, ttl=60)
+    generation = cache.generation()
+    cache.invalidate('listings')
+    cache.set('key', b'stale', 200, [], {'listings'}, generation)
+    assert cache.get('key') is None
+
+    cache.set('key', b'fresh', 200, [], {'listings'}, cache.generation())
+    assert cache.get('key').body == b'fresh'
+
+
+def test_streamed_page_invalidated_mid_body_is_not_cached(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, 'STREAM_TEMPLATES', True)
+    with app.app_context():
+        get_cache().clear()
+
+    response = client.get('/books?sort=title', buffered=False)
+    assert response.headers['X-Cache'] == 'MISS'
+    chunks = iter(response.response)
+    next(chunks)
+    # A checkout or book edit lands while the rest of the page is still being sent
+    with app.app_context():
+        get_cache().invalidate('listings')
+    for _ in chunks:
+        pass
+    response.close()
+
+    assert client.get('/books?sort=title').headers['X-Cache'] == 'MISS'